@@ -36,20 +36,6 @@ def read_columns(csv_file, columns):
     except Exception as e:
         print("An error occurred:", e)
 
-# Set up plot style
-plt.style.use('seaborn-whitegrid')
-plt.rcParams.update({
-    'font.family': 'serif',
-    'font.serif': ['Computer Modern Roman'],
-    'text.usetex': True,
-    'axes.linewidth': 1.5,
-    'axes.edgecolor': 'black',
-    'xtick.major.width': 1.5,
-    'ytick.major.width': 1.5,
-    'xtick.minor.width': 1,
-    'ytick.minor.width': 1,
-})
-
 # Professional color palette
 colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
 
@@ -61,18 +47,11 @@ scenarios = {
     'Massive Star': {'P': [1e-2, 2], 'B': [1e14, 1e15], 'rate': 5e4}
 }
 
-# Read magnetar data from CSV file
+# Known magnetars (Period, B) from Tab2.csv, loaded when run as a script
 csv_file = 'Tab2.csv'
 columns_to_read = ['Period', 'B']
-data = read_columns(csv_file, columns_to_read)
-
-if data:
-    real_P = np.array(data['Period'])
-    real_B = np.array(data['B'])
-else:
-    print("Failed to read magnetar data. Using empty arrays.")
-    real_P = np.array([])
-    real_B = np.array([])
+real_P = np.array([])
+real_B = np.array([])
 
 # Function to create and save plot
 def save_plot(fig, filename):
@@ -249,6 +228,31 @@ def create_violin_plot():
     save_plot(fig, 'Violin_Plot.png')
 
 if __name__ == "__main__":
+    # Set up plot style
+    plt.style.use('seaborn-whitegrid')
+    plt.rcParams.update({
+        'font.family': 'serif',
+        'font.serif': ['Computer Modern Roman'],
+        'text.usetex': True,
+        'axes.linewidth': 1.5,
+        'axes.edgecolor': 'black',
+        'xtick.major.width': 1.5,
+        'ytick.major.width': 1.5,
+        'xtick.minor.width': 1,
+        'ytick.minor.width': 1,
+    })
+
+    # Read magnetar data from CSV file
+    data = read_columns(csv_file, columns_to_read)
+
+    if data:
+        real_P = np.array(data['Period'])
+        real_B = np.array(data['B'])
+    else:
+        print("Failed to read magnetar data. Using empty arrays.")
+        real_P = np.array([])
+        real_B = np.array([])
+
     # Create and save all plots
     create_bp_diagram()
     create_ppdot_diagram()
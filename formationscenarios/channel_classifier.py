@@ -0,0 +1,139 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Shared helpers live in misc/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+import instrumentation as instr
+from BP_PPdot_diagram import scenarios, read_columns, csv_file
+
+# Defaults
+samples_per_channel = 50000  # Synthetic magnetars drawn per formation channel
+n_neighbours = 16
+max_distance = 0.1  # dex; objects farther than this from every channel sample are unassigned
+query_chunk = 1 << 20
+
+def Pdot_from(P, B):
+    """Period derivative (s/s) from period (s) and dipole field (G), inverting B = sqrt(3.2e19 P Pdot)."""
+    return B**2 / (3.2e19 * P)
+
+def features(P, B, Pdot=None):
+    """(log P, log B, log Pdot) rows; Pdot is derived from (P, B) when not measured."""
+    P = np.asarray(P, dtype=float)
+    B = np.asarray(B, dtype=float)
+    Pdot = Pdot_from(P, B) if Pdot is None else np.asarray(Pdot, dtype=float)
+    return np.column_stack([np.log10(P), np.log10(B), np.log10(Pdot)])
+
+def sample_channels(n=samples_per_channel, seed=None):
+    """
+    Synthetic populations drawn within each scenario's P and B ranges, as in the B-P diagram.
+
+    The draws are log-uniform, matching the logarithmic metric of the neighbour search, so every
+    part of a channel's box is covered equally.
+    """
+    rng = np.random.default_rng(seed)
+    points, labels = [], []
+    for c, data in enumerate(scenarios.values()):
+        P = 10**rng.uniform(*np.log10(data['P']), n)
+        B = 10**rng.uniform(*np.log10(data['B']), n)
+        points.append(features(P, B))
+        labels.append(np.full(n, c, dtype=np.intp))
+    return np.concatenate(points), np.concatenate(labels)
+
+class ChannelClassifier:
+    """
+    k-nearest-neighbour channel membership in (log P, log B, log Pdot).
+
+    The channel samples are indexed once in a KD-tree; each object's probabilities are the
+    prior-weighted fractions of its k nearest samples (within max_distance) from each channel.
+    With prior='rate' the channels are weighted by their formation rates.
+    """
+
+    def __init__(self, n=samples_per_channel, k=n_neighbours, prior='equal', seed=None):
+        self.channels = list(scenarios)
+        self.k = k
+        with instr.stage('build_tree'):
+            points, self.labels = sample_channels(n, seed)
+            self.tree = cKDTree(points)
+        if prior == 'rate':
+            weights = np.array([scenarios[name]['rate'] for name in self.channels], dtype=float)
+        elif prior == 'equal':
+            weights = np.ones(len(self.channels))
+        else:
+            raise ValueError(f"unknown prior '{prior}', use 'equal' or 'rate'")
+        self.weights = weights / weights.sum()
+
+    def probabilities(self, P, B, Pdot=None, max_distance=max_distance):
+        """
+        Channel membership probabilities for catalog or synthetic objects.
+
+        Returns:
+        tuple: (probabilities of shape (n, n_channels), distance in dex to the nearest channel sample,
+               inf beyond max_distance); objects with no sample within max_distance get all-zero probabilities
+        """
+        X = features(P, B, Pdot)
+        n_channels = len(self.channels)
+        probabilities = np.zeros((X.shape[0], n_channels))
+        nearest = np.empty(X.shape[0])
+        with instr.stage('knn_query'):
+            for start in range(0, X.shape[0], query_chunk):
+                rows = slice(start, start + query_chunk)
+                # The distance bound prunes the search; missing neighbours come back with index n_samples
+                distance, index = self.tree.query(X[rows], k=self.k, distance_upper_bound=max_distance, workers=-1)
+                distance, index = distance.reshape(-1, self.k), index.reshape(-1, self.k)
+                found = index < self.labels.size
+                labels = np.where(found, self.labels[np.minimum(index, self.labels.size - 1)], n_channels)
+                # Per-row channel counts in one bincount; the extra bin collects missing neighbours
+                offsets = np.arange(labels.shape[0])[:, None] * (n_channels + 1)
+                counts = np.bincount((offsets + labels).ravel(), minlength=labels.shape[0] * (n_channels + 1))
+                weighted = counts.reshape(-1, n_channels + 1)[:, :n_channels] * self.weights
+                total = weighted.sum(axis=1, keepdims=True)
+                np.divide(weighted, total, out=probabilities[rows], where=total > 0)
+                nearest[rows] = distance[:, 0]
+        instr.count('objects_classified', X.shape[0])
+        return probabilities, nearest
+
+    def classify(self, P, B, Pdot=None, max_distance=max_distance):
+        """Most probable channel name per object, or None when no channel is compatible."""
+        probabilities, _ = self.probabilities(P, B, Pdot, max_distance)
+        best = np.argmax(probabilities, axis=1)
+        return [self.channels[c] if probabilities[i, c] > 0 else None for i, c in enumerate(best)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Assign magnetars to formation channels.')
+    parser.add_argument('--catalog', default=csv_file, help='CSV with Period (s) and B (G) columns')
+    parser.add_argument('--prior', choices=['equal', 'rate'], default='equal')
+    parser.add_argument('--synthetic', type=int, default=1_000_000,
+                        help='synthetic objects classified for timing')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    classifier = ChannelClassifier(prior=args.prior, seed=args.seed)
+    if os.path.exists(args.catalog):
+        data = read_columns(args.catalog, ['Period', 'B'])
+        probabilities, nearest = classifier.probabilities(data['Period'], data['B'])
+        print(f"{'P (s)':>10} {'B (G)':>10} " + " ".join(f"{name:>13}" for name in classifier.channels))
+        for P, B, row, d in zip(data['Period'], data['B'], probabilities, nearest):
+            flag = '' if d <= max_distance else '  (outside all channels)'
+            print(f"{P:10.3g} {B:10.3g} " + " ".join(f"{p:13.3f}" for p in row) + flag)
+    else:
+        print(f"Catalog {args.catalog} not found; classifying synthetic objects only")
+
+    rng = np.random.default_rng(args.seed)
+    P = 10**rng.uniform(-3, 0.5, args.synthetic)
+    B = 10**rng.uniform(14, 16, args.synthetic)
+    start = time.perf_counter()
+    probabilities, _ = classifier.probabilities(P, B)
+    elapsed = time.perf_counter() - start
+    assigned = probabilities.sum(axis=1) > 0
+    print(f"Classified {args.synthetic} synthetic objects in {elapsed:.2f} s; "
+          f"{assigned.mean():.1%} compatible with at least one channel")
+    for name, p in zip(classifier.channels, probabilities[assigned].mean(axis=0)):
+        print(f"  {name}: mean membership {p:.3f}")
+
+if __name__ == "__main__":
+    main()
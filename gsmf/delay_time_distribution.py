@@ -0,0 +1,136 @@
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft
+
+# Shared helpers live in misc/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+import instrumentation as instr
+import luminositydistance
+from sfr_smd_rate_comparison import SFR_z, SFR_MW
+from doubleschechter import event_rates
+
+# Uniform lookback-time grid
+z_max = 10.0  # Star formation before this redshift is neglected
+time_step = 1e-3  # Gyr
+
+# Delay-time distributions of the merger channels: t^slope for t_min < t (Gyr)
+channel_dtds = {
+    'BWD': {'slope': -1.1, 't_min': 0.04},
+    'NSWD': {'slope': -1.0, 't_min': 0.1},
+    'BNS': {'slope': -1.0, 't_min': 0.02},
+}
+
+def event_rate_channel(label):
+    """Merger channel of an event_rates label, or None for prompt (massive-star) channels."""
+    for channel in ('NSWD', 'BWD', 'BNS'):
+        if channel in label:
+            return channel
+    return None
+
+@lru_cache(maxsize=None)
+def time_grid(z_max=z_max, time_step=time_step):
+    """
+    Cosmic time since z_max (Gyr) on a uniform grid, the matching redshifts and the SFR there.
+
+    Returns:
+    tuple: (t, z, SFR in M_sun Mpc^-3 yr^-1), ordered from z_max to z = 0
+    """
+    z_table, t_L_table = luminositydistance.lookback_time_table()
+    t_L_max = np.interp(z_max, z_table, t_L_table)
+    t = np.arange(0, t_L_max, time_step)
+    z = np.interp(t_L_max - t, t_L_table, z_table)
+    sfr = SFR_z(z)
+    for array in (t, z, sfr):
+        array.setflags(write=False)
+    return t, z, sfr
+
+instr.watch_cache('time_grid', time_grid)
+
+def power_law_cdf(t, slope, t_min):
+    """Unnormalized cumulative integral of t^slope from t_min (vectorized over slope and t_min)."""
+    t = np.maximum(t, t_min)
+    if np.ndim(slope) == 0 and slope == -1:
+        return np.log(t / t_min)
+    slope = np.asarray(slope, dtype=float)
+    log_ratio = np.log(t / t_min)
+    # (t^(s+1) - t_min^(s+1)) / (s+1), continuous through s = -1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        value = t_min**(slope + 1) * np.expm1((slope + 1) * log_ratio) / (slope + 1)
+    return np.where(slope == -1, log_ratio, value)
+
+def cell_weights(cdf, n_cells, time_step=time_step):
+    """Normalized DTD mass in each delay cell [k, k+1) * time_step from a cumulative distribution."""
+    edges = np.arange(n_cells + 1) * time_step
+    weights = np.diff(cdf(edges), axis=-1)
+    return weights / weights.sum(axis=-1, keepdims=True)
+
+def power_law_dtds(slopes, t_mins, n_cells, time_step=time_step):
+    """Cell weights for every (slope, t_min) pair, shape (len(slopes), n_cells)."""
+    slopes = np.asarray(slopes, dtype=float)[:, None]
+    t_mins = np.asarray(t_mins, dtype=float)[:, None]
+    return cell_weights(lambda edges: power_law_cdf(edges, slopes, t_mins), n_cells, time_step)
+
+def tabulated_dtd(delays, dtd, n_cells, time_step=time_step):
+    """Cell weights of a tabulated DTD (delays in Gyr, zero outside the table)."""
+    delays = np.asarray(delays, dtype=float)
+    cumulative = np.concatenate([[0.0], np.cumsum(0.5 * (dtd[1:] + dtd[:-1]) * np.diff(delays))])
+    return cell_weights(lambda edges: np.interp(edges, delays, cumulative), n_cells, time_step)
+
+def convolve_sfr(dtds, sfr):
+    """
+    Causal convolution of the SFR with every DTD in one batched FFT.
+
+    Parameters:
+    dtds (ndarray): Cell weights on the delay grid, shape (n_dtd, n_t)
+    sfr (ndarray): SFR on the uniform cosmic-time grid, shape (n_t,)
+
+    Returns:
+    ndarray: Delayed SFR (same units as sfr), shape (n_dtd, n_t)
+    """
+    n_t = sfr.shape[-1]
+    n_fft = next_fast_len(2 * n_t - 1, real=True)
+    with instr.stage('dtd_convolution'):
+        spectrum = rfft(dtds, n_fft, axis=-1) * rfft(sfr, n_fft)
+        delayed = irfft(spectrum, n_fft, axis=-1)[..., :n_t]
+    instr.count('dtd_convolutions', dtds.shape[0])
+    return np.clip(delayed, 0, None)
+
+def delayed_sfr(z, dtds):
+    """Delayed SFR (M_sun Mpc^-3 yr^-1) at redshifts z for every DTD row, shape (n_dtd, len(z))."""
+    t, z_grid, sfr = time_grid()
+    delayed = convolve_sfr(dtds, sfr)
+    # The grid runs towards lower redshift; reverse it for interpolation in z
+    return np.array([np.interp(z, z_grid[::-1], row[::-1]) for row in delayed])
+
+def channel_rates(z, r_MW_values, dtds):
+    """
+    Volumetric rates (Gpc^-3 yr^-1) for Milky Way rates r_MW (yr^-1) traced by the delayed SFR,
+    normalized as in sfr_smd_rate_comparison (r_MW / SFR_MW per unit star formation).
+    """
+    return (np.asarray(r_MW_values, dtype=float)[:, None] / SFR_MW) * delayed_sfr(z, dtds) * 1e9
+
+if __name__ == "__main__":
+    z = np.array([0.0, 0.5, 1.0, 2.0, 3.0, 4.0])
+    n_t = time_grid()[0].size
+    merger_rates = [(rate, label, event_rate_channel(label)) for rate, label in event_rates
+                    if event_rate_channel(label) is not None]
+    dtds = power_law_dtds([channel_dtds[channel]['slope'] for _, _, channel in merger_rates],
+                          [channel_dtds[channel]['t_min'] for _, _, channel in merger_rates], n_t)
+    rates = channel_rates(z, [rate for rate, _, _ in merger_rates], dtds)
+    print("z:" + "".join(f"{value:>11.1f}" for value in z))
+    for (rate, label, channel), row in zip(merger_rates, rates):
+        prompt = rate / SFR_MW * SFR_z(z) * 1e9
+        print(f"{label} ({channel}, t^{channel_dtds[channel]['slope']}, "
+              f"t_min = {channel_dtds[channel]['t_min']} Gyr)")
+        print("  delayed:" + "".join(f"{value:11.3e}" for value in row))
+        print("  prompt: " + "".join(f"{value:11.3e}" for value in prompt))
+
+    # DTD parameter sweep, all convolved together
+    slopes, t_mins = np.meshgrid([-0.5, -1.0, -1.5], [0.02, 0.1, 0.5])
+    sweep = delayed_sfr(z, power_law_dtds(slopes.ravel(), t_mins.ravel(), n_t))
+    print("\nDelayed SFR / SFR for a grid of power-law DTDs")
+    for slope, t_min, row in zip(slopes.ravel(), t_mins.ravel(), sweep):
+        print(f"  t^{slope:<5} t_min = {t_min:<4} Gyr:" + "".join(f"{value:9.3f}" for value in row / SFR_z(z)))
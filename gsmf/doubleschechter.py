@@ -1,8 +1,21 @@
+import argparse
+import os
+import sys
+from functools import lru_cache
+
 import numpy as np
-from scipy.integrate import quad
 import matplotlib.pyplot as plt
 from scipy.interpolate import interp1d
 
+# Shared helpers live in misc/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+import instrumentation as instr
+import incremental
+import integration
+import output_sink
+import result_store
+from host_mass_sampler import HostMassSampler, RedshiftHostSampler
+
 # Define the double Schechter function
 def double_schechter(m, phi_1, phi_2, alpha_1, alpha_2, M_star):
     term1 = phi_1 * (m / M_star)**alpha_1
@@ -39,69 +52,192 @@ event_rates = [
     (1e-2, "Magnetars from massive stars (Beniamini+19) max")
 ]
 
-# Set font sizes for plots
-plt.rcParams.update({'font.size': 14})
+def integrated_number_density(log_M_star, phi_1, phi_2, alpha_1, alpha_2, mass_min=mass_min, mass_max=mass_max):
+    """Number density of galaxies between mass_min and mass_max in Gpc^-3."""
+    M_star = 10**log_M_star  # Convert log(M_star/M_sun) to M_sun
+
+    # Integrate the function from 10^8 to 10^12 solar masses, over ln M where the power laws are smooth
+    n_gal_mpc3 = integration.integrate(double_schechter, mass_min, mass_max, args=(phi_1, phi_2, alpha_1, alpha_2, M_star),
+                                       log_variable=True).value
+
+    # Convert result to Gpc^-3
+    return n_gal_mpc3 * 1e9
 
-# Prepare for comparison plot
-comparison_fig, comparison_ax = plt.subplots(figsize=(12, 8))
+def integrated_number_densities(log_M_star, phi_1, phi_2, alpha_1, alpha_2, mass_min=mass_min, mass_max=mass_max):
+    """integrated_number_density for arrays of parameter sets, integrated together in one batch."""
+    n_gal_mpc3, _, _ = integration.integrate_many(double_schechter, mass_min, mass_max,
+                                                  args=(phi_1, phi_2, alpha_1, alpha_2, 10**np.asarray(log_M_star)),
+                                                  log_variable=True)
+    return n_gal_mpc3 * 1e9
 
-# Iterate over each event rate
-for event_rate, label in event_rates:
+def number_density_11(log_M_star, phi_1, phi_2, alpha_1, alpha_2, mass_11=mass_11):
+    """Number density at 10^11 solar masses (mass_11) in Gpc^-3 M_odot^-1."""
+    n_gal_11_mpc3 = double_schechter(mass_11, phi_1, phi_2, alpha_1, alpha_2, 10**log_M_star)
+    return n_gal_11_mpc3 * 1e9
+
+def normalization(log_M_star, phi_1, phi_2, alpha_1, alpha_2):
+    """Return (n_gal_gpc3, n_gal_11_gpc3, N) for one set of Schechter parameters."""
+    n_gal_gpc3 = integrated_number_density(log_M_star, phi_1, phi_2, alpha_1, alpha_2)
+    n_gal_11_gpc3 = number_density_11(log_M_star, phi_1, phi_2, alpha_1, alpha_2)
+
+    # Calculate normalization factor N
+    N = n_gal_gpc3 / n_gal_11_gpc3
+    return n_gal_gpc3, n_gal_11_gpc3, N
+
+def volumetric_rate(event_rate, n_gal_gpc3, N):
+    """Volumetric rate R in Gpc^-3 yr^-1 for a per-galaxy event rate in yr^-1."""
     # Convert event rate to per solar mass
     r_per_unit_mass = event_rate / mass_11  # yr^-1 M_odot^-1
-    
-    # Lists to store results for plotting
-    redshifts = []
-    volumetric_rates = []
-
-    # Iterate over each set of Schechter parameters
-    for ref, z, log_M_star, phi_1, phi_2, alpha_1, alpha_2 in schechter_params:
-        M_star = 10**log_M_star  # Convert log(M_star/M_sun) to M_sun
-
-        # Integrate the function from 10^8 to 10^12 solar masses
-        n_gal_mpc3, error = quad(double_schechter, mass_min, mass_max, args=(phi_1, phi_2, alpha_1, alpha_2, M_star))
-
-        # Convert result to Gpc^-3
-        n_gal_gpc3 = n_gal_mpc3 * 1e9
-
-        # Calculate n_gal_11 at m = 10^11 solar masses
-        n_gal_11_mpc3 = double_schechter(mass_11, phi_1, phi_2, alpha_1, alpha_2, M_star)
-
-        # Convert result to Gpc^-3 M_odot^-1
-        n_gal_11_gpc3 = n_gal_11_mpc3 * 1e9
-
-        # Calculate normalization factor N
-        N = n_gal_gpc3 / n_gal_11_gpc3
-
-        # Calculate volumetric rate R
-        R = r_per_unit_mass * n_gal_gpc3 * N
-
-        # Store results for plotting
-        redshifts.append(z)
-        volumetric_rates.append(R)
-
-        # Print results
-        print(f"Event Rate: {label}")
-        print(f"Reference: {ref}, z: {z}")
-        print(f"Integrated number density: {n_gal_gpc3:.2e} Gpc^-3")
-        print(f"Number density at 10^11 solar masses: {n_gal_11_gpc3:.2e} Gpc^-3 M_odot^-1")
-        print(f"Normalization factor N: {N:.2e}")
-        print(f"Volumetric rate R: {R:.2e} Gpc^-3 yr^-1")
-        print("-" * 50)
-
-    # Interpolate to make the curve smoother
-    redshifts_interp = np.linspace(min(redshifts), max(redshifts), 100)
-    volumetric_rates_interp = interp1d(redshifts, volumetric_rates, kind='cubic')(redshifts_interp)
-
-    # Add to comparison plot
-    comparison_ax.plot(redshifts_interp, volumetric_rates_interp, linestyle='-', label=f'{label}')
-
-# Finalize comparison plot
-comparison_ax.set_xlabel('Redshift')
-comparison_ax.set_ylabel('Volumetric Rate R (Gpc$^{-3}$ yr$^{-1}$)')
-comparison_ax.set_title('Comparison of Volumetric Rates vs. Redshift')
-comparison_ax.legend()
-comparison_ax.grid(True, linestyle='--', alpha=0.7)
-plt.tight_layout()
-plt.show()
-
+    return r_per_unit_mass * n_gal_gpc3 * N
+
+def rate_factor(n_gal_gpc3, N, mass_11=mass_11):
+    """R / event_rate in Gpc^-3 M_odot: R is linear in r_per_unit_mass, so each rate is one multiply."""
+    return n_gal_gpc3 * N / mass_11
+
+@lru_cache(maxsize=None)
+def host_sampler(log_M_star, phi_1, phi_2, alpha_1, alpha_2, rate_slope=None):
+    """
+    Inverse-CDF host-mass sampler for one parameter set, built once.
+
+    With rate_slope the hosts are weighted by a per-galaxy rate r(M) = (M / 10^11 M_odot)^rate_slope
+    (1 yr^-1 at 10^11 M_odot), and the sampler's total is ∫ φ r dM in Gpc^-3 yr^-1.
+    """
+    M_star = 10**log_M_star
+    rate = None if rate_slope is None else (lambda M: (M / mass_11)**rate_slope)
+    return HostMassSampler(lambda M: double_schechter(M, phi_1, phi_2, alpha_1, alpha_2, M_star) * 1e9, rate,
+                           np.log10(mass_min), np.log10(mass_max))
+
+instr.watch_cache('host_sampler', host_sampler)
+
+def redshift_host_sampler(rate_slope=None, params=schechter_params):
+    """Host-mass sampler over redshift, using the parameter set nearest to each source's z."""
+    return RedshiftHostSampler([z for _, z, *_ in params],
+                               [host_sampler(*shape, rate_slope=rate_slope) for _, _, *shape in params])
+
+def host_weighted_rate(event_rate, log_M_star, phi_1, phi_2, alpha_1, alpha_2, rate_slope=1.0):
+    """
+    Volumetric rate in Gpc^-3 yr^-1 for a mass-dependent per-galaxy rate, integrated over the hosts.
+
+    The per-galaxy rate is event_rate (M / 10^11 M_odot)^rate_slope, so event_rate is the rate of
+    a 10^11 M_odot galaxy as in volumetric_rate, but every galaxy mass contributes.
+    """
+    return event_rate * host_sampler(log_M_star, phi_1, phi_2, alpha_1, alpha_2, rate_slope).total
+
+def multiply(a, b):
+    return a * b
+
+def divide(a, b):
+    return a / b
+
+def rate_graph(graph, params=schechter_params, rates=event_rates):
+    """
+    Add the nodes parameter set -> integral -> N -> rate factor -> rate per event to a graph.
+
+    The mass limits are explicit node inputs, so editing mass_min, mass_max or mass_11 changes the
+    keys of the nodes that use them instead of reusing stored values.
+
+    Returns:
+    list: One dict per parameter set with its 'reference', 'z' and the nodes 'n_gal',
+          'n_gal_11', 'N' and 'rates' (event rate label -> node)
+    """
+    sets = []
+    for ref, z, *shape in params:
+        n_gal = graph.add('integrated_number_density', integrated_number_density, *shape, mass_min, mass_max)
+        n_gal_11 = graph.add('number_density_11', number_density_11, *shape, mass_11)
+        N = graph.add('normalization_factor', divide, n_gal, n_gal_11)
+        factor = graph.add('rate_factor', rate_factor, n_gal, N, mass_11)
+        sets.append({
+            'reference': ref, 'z': z, 'n_gal': n_gal, 'n_gal_11': n_gal_11, 'N': N,
+            'rates': {label: graph.add('volumetric_rate', multiply, event_rate, factor) for event_rate, label in rates},
+        })
+    return sets
+
+def main():
+    parser = argparse.ArgumentParser(description='Volumetric rates from double Schechter mass functions.')
+    output_sink.add_arguments(parser)
+    args = parser.parse_args()
+    sink = output_sink.from_args(args)
+    out = output_sink.text_stream(sink)
+
+    # Parameter sets and rates already evaluated in earlier runs are reused
+    graph = incremental.Graph('doubleschechter')
+    sets = rate_graph(graph)
+
+    # Set font sizes for plots
+    plt.rcParams.update({'font.size': 14})
+
+    # Prepare for comparison plot
+    comparison_fig, comparison_ax = plt.subplots(figsize=(12, 8))
+
+    # Iterate over each event rate
+    for event_rate, label in event_rates:
+        # Lists to store results for plotting
+        redshifts = []
+        volumetric_rates = []
+
+        # Iterate over each set of Schechter parameters
+        for nodes in sets:
+            ref, z = nodes['reference'], nodes['z']
+            n_gal_gpc3, n_gal_11_gpc3, N = nodes['n_gal'].value, nodes['n_gal_11'].value, nodes['N'].value
+
+            # Calculate volumetric rate R
+            R = nodes['rates'][label].value
+
+            # Store results for plotting
+            redshifts.append(z)
+            volumetric_rates.append(R)
+
+            # Print results
+            print(f"Event Rate: {label}", file=out)
+            print(f"Reference: {ref}, z: {z}", file=out)
+            print(f"Integrated number density: {n_gal_gpc3:.2e} Gpc^-3", file=out)
+            print(f"Number density at 10^11 solar masses: {n_gal_11_gpc3:.2e} Gpc^-3 M_odot^-1", file=out)
+            print(f"Normalization factor N: {N:.2e}", file=out)
+            print(f"Volumetric rate R: {R:.2e} Gpc^-3 yr^-1", file=out)
+            print("-" * 50, file=out)
+            if sink is not None:
+                sink.write({'event_rate_label': label, 'event_rate_yr': event_rate, 'reference': ref, 'z': z,
+                            'n_gal_gpc3': n_gal_gpc3, 'n_gal_11_gpc3_msun': n_gal_11_gpc3, 'N': N,
+                            'R_gpc3_yr': R})
+
+        # Interpolate to make the curve smoother
+        with instr.stage('interpolation'):
+            redshifts_interp = np.linspace(min(redshifts), max(redshifts), 100)
+            volumetric_rates_interp = interp1d(redshifts, volumetric_rates, kind='cubic')(redshifts_interp)
+
+        # Add to comparison plot
+        with instr.stage('plot'):
+            comparison_ax.plot(redshifts_interp, volumetric_rates_interp, linestyle='-', label=f'{label}')
+
+    graph.save()
+    if sink is not None:
+        sink.close()
+
+    store = result_store.open_default()
+    if store is not None:
+        rates = [[nodes['rates'][label].value for _, label in event_rates] for nodes in sets]
+        store.write('doubleschechter/volumetric_rate', np.array(rates), units='Gpc^-3 yr^-1', attrs={
+            'dims': ['parameter_set', 'event_rate'],
+            'parameter_set': [f"{nodes['reference']} z={nodes['z']}" for nodes in sets],
+            'event_rate': [label for _, label in event_rates],
+            'event_rate_per_galaxy': [rate for rate, _ in event_rates],
+        })
+        store.write('doubleschechter/normalization', np.array([[nodes[key].value for key in ('n_gal', 'n_gal_11', 'N')]
+                                                               for nodes in sets]),
+                    units={'n_gal': 'Gpc^-3', 'n_gal_11': 'Gpc^-3 M_odot^-1', 'N': 'M_odot'},
+                    attrs={'dims': ['parameter_set', 'quantity'], 'quantity': ['n_gal', 'n_gal_11', 'N'],
+                           'parameter_set': [f"{nodes['reference']} z={nodes['z']}" for nodes in sets]})
+
+    # Finalize comparison plot
+    with instr.stage('plot'):
+        comparison_ax.set_xlabel('Redshift')
+        comparison_ax.set_ylabel('Volumetric Rate R (Gpc$^{-3}$ yr$^{-1}$)')
+        comparison_ax.set_title('Comparison of Volumetric Rates vs. Redshift')
+        comparison_ax.legend()
+        comparison_ax.grid(True, linestyle='--', alpha=0.7)
+        plt.tight_layout()
+    with instr.stage('show'):
+        plt.show()
+
+if __name__ == "__main__":
+    main()
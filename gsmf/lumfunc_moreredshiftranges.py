@@ -1,20 +1,100 @@
-import lumfunc as lf
+import argparse
+import os
+import sys
+
 import numpy as np
-from scipy.integrate import quad
-from astropy import units as u
-from scipy.integrate import romberg
-from scipy.integrate import quad_vec
 import matplotlib.pyplot as plt
 from scipy import integrate
 
+# Shared helpers live in misc/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+import instrumentation as instr
+import integration
+import output_sink
+
 h = 0.7
+ln10 = np.log(10)
+ln_ln10 = np.log(ln10)
+kernel_chunk = 65536  # Points per in-place kernel pass; keeps temporaries cache-sized
+
+def double_schechter_constants(phi_star1, phi_star2, M_star, alpha1, alpha2):
+    """
+    Per-set constants for double_schechter_log_mass, computed once per parameter set.
+    
+    Returns:
+    tuple: (log10 M_star, ln(ln10 phi_star1), ln(ln10 phi_star2), alpha1 + 1, alpha2 + 1)
+    """
+    return (np.log10(M_star), ln_ln10 + np.log(phi_star1), ln_ln10 + np.log(phi_star2),
+            alpha1 + 1, alpha2 + 1)
+
+def double_schechter_log_mass(log_M, constants, log_output=False, out=None):
+    """
+    Double Schechter function evaluated natively in log10 stellar mass.
+    
+    With u = ln(M / M_star) and c_i = ln(ln10 phi_star_i), the function is
+    Φ = exp(c_1 + (alpha1 + 1) u - e^u) + exp(c_2 + (alpha2 + 1) u - e^u), and
+    ln Φ = logaddexp(c_1 + (alpha1 + 1) u, c_2 + (alpha2 + 1) u) - e^u. The log-sum is
+    formed as max(a, b) + log1p(exp(-|b - a|)), which is what np.logaddexp computes
+    but several times faster. The input is processed in chunks with two reusable
+    temporaries, so peak memory is the output array plus 2 * kernel_chunk floats.
+    
+    Parameters:
+    log_M (array-like): log10 of the stellar mass values
+    constants (tuple): Output of double_schechter_constants for one parameter set
+    log_output (bool): Return ln Φ instead of Φ; stays finite far above M_star
+    out (ndarray, optional): Float64 array with the shape of log_M to write into
+    
+    Returns:
+    array-like: Values of the double Schechter function (or its natural log)
+    """
+    log_M_star, c1, c2, slope1, slope2 = constants
+    log_M = np.asarray(log_M, dtype=float)
+    if out is None:
+        out = np.empty_like(log_M)
+    flat_in = log_M.reshape(-1)
+    flat_out = out.reshape(-1)
+    u_buf = np.empty(min(flat_in.size, kernel_chunk))
+    x_buf = np.empty_like(u_buf)
+    
+    for start in range(0, flat_in.size, kernel_chunk):
+        stop = min(start + kernel_chunk, flat_in.size)
+        o = flat_out[start:stop]
+        u = u_buf[:stop - start]
+        x = x_buf[:stop - start]
+        np.subtract(flat_in[start:stop], log_M_star, out=u)
+        u *= ln10  # ln(M / M_star)
+        np.exp(u, out=x)  # M / M_star
+        np.multiply(u, slope1, out=o)
+        o += c1
+        if log_output:
+            o -= x
+            # u becomes b - a, then log1p(exp(-|b - a|))
+            u *= slope2 - slope1
+            u += c2 - c1
+            np.maximum(u, 0, out=x)
+            o += x
+            np.abs(u, out=u)
+            np.negative(u, out=u)
+            np.exp(u, out=u)
+            np.log1p(u, out=u)
+            o += u
+        else:
+            o -= x
+            np.exp(o, out=o)
+            u *= slope2
+            u += c2
+            u -= x
+            np.exp(u, out=u)
+            o += u
+    
+    return out[()] if out.ndim == 0 else out
 
 def double_schechter_mass(M, phi_star1, phi_star2, M_star, alpha1, alpha2):
     """
     Double Schechter function for stellar mass function.
     
     Parameters:
-    M (array-like): Stellar mass values
+    M (array-like): Stellar mass values (linear, in solar masses)
     phi_star1 (float): First normalization factor
     phi_star2 (float): Second normalization factor
     M_star (float): Characteristic mass (shared between both components)
@@ -24,17 +104,8 @@ def double_schechter_mass(M, phi_star1, phi_star2, M_star, alpha1, alpha2):
     Returns:
     array-like: Values of the double Schechter function
     """
-    
-    log_M = np.log10(M) if np.all(M > 0) else M
-    log_M_star = np.log10(M_star) if M_star > 0 else M_star
-    
-    exp_term = np.exp(-10 ** (log_M - log_M_star))
-    first_term = phi_star1 * (10 ** ((log_M - log_M_star) * (alpha1 + 1)))
-    second_term = phi_star2 * (10 ** ((log_M - log_M_star) * (alpha2 + 1)))
-    
-    phi = np.log(10) * exp_term * (first_term + second_term)
-    
-    return phi
+    constants = double_schechter_constants(phi_star1, phi_star2, M_star, alpha1, alpha2)
+    return double_schechter_log_mass(np.log10(M), constants)
 
 
 # Set up the mass range and parameters
@@ -90,123 +161,69 @@ M_star_7 = 10**10.84
 alpha1_7 = -0.01
 alpha2_7 = -1.79
 
-# Calculate the Schechter function values
+# (printed label, plot label, phi_star1, phi_star2, M_star, alpha1, alpha2) for each redshift range
+redshift_sets = [
+    ('z < 0.06', 'z < 0.06', phi_star1_1, phi_star2_1, M_star_1, alpha1_1, alpha2_1),
+    ('0.25 <= z <= 0.75', '0.25 ≤ z < 0.75', phi_star1_2, phi_star2_2, M_star_2, alpha1_2, alpha2_2),
+    ('0.75 <= z <= 1.25', '0.75 ≤ z < 1.25', phi_star1_3, phi_star2_3, M_star_3, alpha1_3, alpha2_3),
+    ('1.25 <= z <= 1.75', '1.25 ≤ z < 1.75', phi_star1_4, phi_star2_4, M_star_4, alpha1_4, alpha2_4),
+    ('1.75 <= z <= 2.25', '1.75 ≤ z < 2.25', phi_star1_5, phi_star2_5, M_star_5, alpha1_5, alpha2_5),
+    ('2.25 <= z <= 2.75', '2.25 ≤ z < 2.75', phi_star1_6, phi_star2_6, M_star_6, alpha1_6, alpha2_6),
+    ('2.75 <= z <= 3.75', '2.75 ≤ z < 3.75', phi_star1_7, phi_star2_7, M_star_7, alpha1_7, alpha2_7),
+]
 
-# z < 0.06 
-phi_values_1 = double_schechter_mass(M_range, phi_star1_1, phi_star2_1, M_star_1, alpha1_1, alpha2_1)
-
-# 0.25 <= z <= 0.75 
-phi_values_2 = double_schechter_mass(M_range, phi_star1_2, phi_star2_2, M_star_2, alpha1_2, alpha2_2)
-
-# 0.75 <= z <= 1.25
-phi_values_3 = double_schechter_mass(M_range, phi_star1_3, phi_star2_3, M_star_3, alpha1_3, alpha2_3)
-
-# 1.25 <= z <= 1.75
-phi_values_4 = double_schechter_mass(M_range, phi_star1_4, phi_star2_4, M_star_4, alpha1_4, alpha2_4)
-
-# 1.75 <= z <= 2.25 
-phi_values_5 = double_schechter_mass(M_range, phi_star1_5, phi_star2_5, M_star_5, alpha1_5, alpha2_5)
-
-# 2.25 <= z <= 2.75 
-phi_values_6 = double_schechter_mass(M_range, phi_star1_6, phi_star2_6, M_star_6, alpha1_6, alpha2_6)
-
-# 2.75 <= z <= 3.75
-phi_values_7 = double_schechter_mass(M_range, phi_star1_7, phi_star2_7, M_star_7, alpha1_7, alpha2_7)
-
-# Integrate the function
+# Per-set kernel constants, computed once
+set_constants = [double_schechter_constants(*params) for _, _, *params in redshift_sets]
 
 # Function to convert Mpc^-3 to Gpc^-3
 def mpc3_to_gpc3(value):
     return value * 1e9
 
-# z < 0.06 
-def integrand_1(log_M):
-    M = 10**log_M
-    return double_schechter_mass(M, phi_star1_1, phi_star2_1, M_star_1, alpha1_1, alpha2_1) * M * np.log(10)
-
-# Integrate from 10^8 to 10^12 solar masses 
-integral_1, error_1 = integrate.quad(integrand_1, 8, 12)
-
-print(f"z < 0.06 integrated number density: {mpc3_to_gpc3(integral_1):.4e} Gpc^-3")
-print(f"z < 0.06 integration error: {mpc3_to_gpc3(error_1):.4e} Gpc^-3")
-
-# 0.25 <= z <= 0.75 
-def integrand_2(log_M):
-    M = 10**log_M
-    return double_schechter_mass(M, phi_star1_2, phi_star2_2, M_star_2, alpha1_2, alpha2_2) * M * np.log(10)
-
-integral_2, error_2 = integrate.quad(integrand_2, 8, 12)
-
-print(f"0.25 <= z <= 0.75 integrated number density: {mpc3_to_gpc3(integral_2):.4e} Gpc^-3")
-print(f"0.25 <= z <= 0.75 integration error: {mpc3_to_gpc3(error_2):.4e} Gpc^-3")
-
-# 0.75 <= z <= 1.25
-def integrand_3(log_M):
-    M = 10**log_M
-    return double_schechter_mass(M, phi_star1_3, phi_star2_3, M_star_3, alpha1_3, alpha2_3) * M * np.log(10)
-
-integral_3, error_3 = integrate.quad(integrand_3, 8, 12)
-
-print(f"0.75 <= z <= 1.25 integrated number density: {mpc3_to_gpc3(integral_3):.4e} Gpc^-3")
-print(f"0.75 <= z <= 1.25 integration error: {mpc3_to_gpc3(error_3):.4e} Gpc^-3")
-
-# 1.25 <= z <= 1.75
-def integrand_4(log_M):
-    M = 10**log_M
-    return double_schechter_mass(M, phi_star1_4, phi_star2_4, M_star_4, alpha1_4, alpha2_4) * M * np.log(10)
-
-integral_4, error_4 = integrate.quad(integrand_4, 8, 12)
-
-print(f"1.25 <= z <= 1.75 integrated number density: {mpc3_to_gpc3(integral_4):.4e} Gpc^-3")
-print(f"1.25 <= z <= 1.75 integration error: {mpc3_to_gpc3(error_4):.4e} Gpc^-3")
-
-# 1.75 <= z <= 2.25 
-def integrand_5(log_M):
-    M = 10**log_M
-    return double_schechter_mass(M, phi_star1_5, phi_star2_5, M_star_5, alpha1_5, alpha2_5) * M * np.log(10)
-
-integral_5, error_5 = integrate.quad(integrand_5, 8, 12)
-
-print(f"1.75 <= z <= 2.25 integrated number density: {mpc3_to_gpc3(integral_5):.4e} Gpc^-3")
-print(f"1.75 <= z <= 2.25 integration error: {mpc3_to_gpc3(error_5):.4e} Gpc^-3")
-
-# 2.25 <= z <= 2.75 
-def integrand_6(log_M):
-    M = 10**log_M
-    return double_schechter_mass(M, phi_star1_6, phi_star2_6, M_star_6, alpha1_6, alpha2_6) * M * np.log(10)
-
-integral_6, error_6 = integrate.quad(integrand_6, 8, 12)
-
-print(f"2.25 <= z <= 2.75 integrated number density: {mpc3_to_gpc3(integral_6):.4e} Gpc^-3")
-print(f"2.25 <= z <= 2.75 integration error: {mpc3_to_gpc3(error_6):.4e} Gpc^-3")
-
-# 2.75 <= z <= 3.75
-def integrand_7(log_M):
-    M = 10**log_M
-    return double_schechter_mass(M, phi_star1_7, phi_star2_7, M_star_7, alpha1_7, alpha2_7) * M * np.log(10)
-
-integral_7, error_7 = integrate.quad(integrand_7, 8, 12)
-
-print(f"2.75 <= z <= 3.75 integrated number density: {mpc3_to_gpc3(integral_7):.4e} Gpc^-3")
-print(f"2.75 <= z <= 3.75 integration error: {mpc3_to_gpc3(error_7):.4e} Gpc^-3")
-
-# Plotting
-plt.figure(figsize=(12, 8))
-
-plt.loglog(M_range, phi_values_1, label='z < 0.06')
-plt.loglog(M_range, phi_values_2, label='0.25 ≤ z < 0.75')
-plt.loglog(M_range, phi_values_3, label='0.75 ≤ z < 1.25')
-plt.loglog(M_range, phi_values_4, label='1.25 ≤ z < 1.75')
-plt.loglog(M_range, phi_values_5, label='1.75 ≤ z < 2.25')
-plt.loglog(M_range, phi_values_6, label='2.25 ≤ z < 2.75')
-plt.loglog(M_range, phi_values_7, label='2.75 ≤ z < 3.75')
-
-plt.xlabel('Stellar Mass (M☉)', fontsize=14)
-plt.ylabel('Φ (Gpc⁻³ dex⁻¹)', fontsize=14)
-plt.title('Double Schechter Mass Function for Different Redshift Ranges', fontsize=16)
-plt.legend(fontsize=12)
-plt.grid(True, which="both", ls="-", alpha=0.2)
-
-plt.tight_layout()
-plt.show()
-
+def integrand(log_M, constants):
+    return double_schechter_log_mass(log_M, constants) * 10**log_M * np.log(10)
+
+def main():
+    parser = argparse.ArgumentParser(description='Double Schechter mass functions for several redshift ranges.')
+    output_sink.add_arguments(parser)
+    args = parser.parse_args()
+    sink = output_sink.from_args(args)
+    out = output_sink.text_stream(sink)
+
+    log_M_range = np.log10(M_range)
+
+    # Calculate the Schechter function values
+    with instr.stage('grid_evaluation'):
+        phi_values = [double_schechter_log_mass(log_M_range, constants) for constants in set_constants]
+    instr.count('grid_points', len(set_constants) * log_M_range.size)
+
+    # Integrate from 10^8 to 10^12 solar masses
+    for (label, _, *_), constants in zip(redshift_sets, set_constants):
+        integral, error, _, _ = integration.integrate(integrand, 8, 12, args=(constants,))
+
+        print(f"{label} integrated number density: {mpc3_to_gpc3(integral):.4e} Gpc^-3", file=out)
+        print(f"{label} integration error: {mpc3_to_gpc3(error):.4e} Gpc^-3", file=out)
+        if sink is not None:
+            sink.write({'redshift_range': label, 'n_gal_gpc3': mpc3_to_gpc3(integral),
+                        'n_gal_error_gpc3': mpc3_to_gpc3(error)})
+    if sink is not None:
+        sink.close()
+
+    # Plotting
+    with instr.stage('plot'):
+        plt.figure(figsize=(12, 8))
+
+        for (_, plot_label, *_), phi in zip(redshift_sets, phi_values):
+            plt.loglog(M_range, phi, label=plot_label)
+
+        plt.xlabel('Stellar Mass (M☉)', fontsize=14)
+        plt.ylabel('Φ (Gpc⁻³ dex⁻¹)', fontsize=14)
+        plt.title('Double Schechter Mass Function for Different Redshift Ranges', fontsize=16)
+        plt.legend(fontsize=12)
+        plt.grid(True, which="both", ls="-", alpha=0.2)
+
+        plt.tight_layout()
+    with instr.stage('show'):
+        plt.show()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
+import os
+import sys
+
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.interpolate import interp1d
 
+# Shared helpers live in misc/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+import result_store
+
 # Constants
 M_MW = 1e10  # Stellar mass of the Milky Way in M_sun
 SFR_MW = 2.0  # Star Formation Rate of the Milky Way in M_sun/yr
@@ -47,91 +54,101 @@ def SFR_z(z):
     """Returns SFR density in M_sun Mpc^-3 yr^-1"""
     return 0.015 * (1 + z)**2.7 / (1 + ((1 + z) / 2.9)**5.6)
 
-# Initialize dictionaries for all rates and their uncertainties
-R_SMD = {}
-R_SMD_upper = {}
-R_SMD_lower = {}
-R_SFR = {}
-R_SFR_upper = {}
-R_SFR_lower = {}
-
-# Calculate all rates and their uncertainties
-for r_MW in r_MW_values:
-    # R_SMD calculations with error bands
-    R_SMD[r_MW] = (r_MW / M_MW) * rho_star_interp(z_values)
-    R_SMD_upper[r_MW] = (r_MW / M_MW) * rho_star_upper(z_values)
-    R_SMD_lower[r_MW] = (r_MW / M_MW) * rho_star_lower(z_values)
-    
-    # R_SFR calculation with error bands
-    sfr_nominal = SFR_z(z_values) * 1e9  # Convert to Gpc^-3
-    R_SFR[r_MW] = (r_MW / SFR_MW) * sfr_nominal
-    R_SFR_upper[r_MW] = (r_MW / (SFR_MW - SFR_MW_error)) * sfr_nominal
-    R_SFR_lower[r_MW] = (r_MW / (SFR_MW + SFR_MW_error)) * sfr_nominal
-
-# Set global font sizes
-plt.rcParams.update({'font.size': 20,
-                    'axes.labelsize': 20,
-                    'axes.titlesize': 20,
-                    'xtick.labelsize': 20,
-                    'ytick.labelsize': 20,
-                    'legend.fontsize': 20})
-
-# Plotting
-plt.figure(figsize=(12, 8))
-
-# Colorblind friendly palette (IBM ColorBlind Safe palette)
-colors = ['#648FFF', '#785EF0', '#DC267F', '#FE6100']
-legend_elements = []
-
-# Add simple legend for line types
-legend_elements.append(plt.Line2D([0], [0], color='gray', label='$\mathcal{R}_{SFR}$', linewidth=2))
-legend_elements.append(plt.Line2D([0], [0], color='gray', linestyle='--', label='$\mathcal{R}_{SMD}$', linewidth=2))
-
-for i, r_MW in enumerate(r_MW_values):
-    # Plot R_SFR with error region
-    plt.plot(z_values, R_SFR[r_MW], 
-             color=colors[i],
-             linewidth=2)
-    plt.fill_between(z_values, 
-                     R_SFR_lower[r_MW], 
-                     R_SFR_upper[r_MW], 
-                     color=colors[i],
-                     alpha=0.1)
-    
-    # Plot R_SMD with error region
-    plt.plot(z_values, R_SMD[r_MW], 
-             color=colors[i],
-             linestyle='--',
-             linewidth=2)
-    plt.fill_between(z_values, 
-                     R_SMD_lower[r_MW], 
-                     R_SMD_upper[r_MW], 
-                     color=colors[i],
-                     alpha=0.2)
-    
-    # Add r_MW value annotation on the left side
-    y_pos = R_SFR[r_MW][0]  # Get y-value at z=0
-    plt.annotate(f'$r_{{MW}}=10^{{{int(np.log10(r_MW))}}}$ yr$^{{-1}}$',
-                xy=(0, y_pos),
-                xytext=(0.83, y_pos),
-                textcoords='data',
-                color=colors[i],
-                fontsize=20,
-                horizontalalignment='right',
-                verticalalignment='center')
-
-
-plt.xlabel('Redshift $(z)$')
-plt.ylabel('Volumetric Rate (Gpc$^{-3}$ yr$^{-1}$)')
-# plt.title('Volumetric Rate vs Redshift (up to $z = 4$)')
-plt.grid(True)
-plt.yscale('log')
-plt.legend(handles=legend_elements, loc='upper right')
-
-# Adjust plot limits to accommodate left-side labels
-plt.xlim(0, 4)
-plt.tight_layout()
-plt.savefig('sfr_smd_vs_rate.pdf',  dpi=300, bbox_inches='tight')
-plt.show()
-
-
+def main():
+    # Initialize dictionaries for all rates and their uncertainties
+    R_SMD = {}
+    R_SMD_upper = {}
+    R_SMD_lower = {}
+    R_SFR = {}
+    R_SFR_upper = {}
+    R_SFR_lower = {}
+
+    # Calculate all rates and their uncertainties
+    for r_MW in r_MW_values:
+        # R_SMD calculations with error bands
+        R_SMD[r_MW] = (r_MW / M_MW) * rho_star_interp(z_values)
+        R_SMD_upper[r_MW] = (r_MW / M_MW) * rho_star_upper(z_values)
+        R_SMD_lower[r_MW] = (r_MW / M_MW) * rho_star_lower(z_values)
+
+        # R_SFR calculation with error bands
+        sfr_nominal = SFR_z(z_values) * 1e9  # Convert to Gpc^-3
+        R_SFR[r_MW] = (r_MW / SFR_MW) * sfr_nominal
+        R_SFR_upper[r_MW] = (r_MW / (SFR_MW - SFR_MW_error)) * sfr_nominal
+        R_SFR_lower[r_MW] = (r_MW / (SFR_MW + SFR_MW_error)) * sfr_nominal
+
+    store = result_store.open_default()
+    if store is not None:
+        attrs = {'dims': ['r_MW', 'z'], 'r_MW': r_MW_values, 'z': z_values}
+        for name, rates in [('R_SFR', R_SFR), ('R_SFR_lower', R_SFR_lower), ('R_SFR_upper', R_SFR_upper),
+                            ('R_SMD', R_SMD), ('R_SMD_lower', R_SMD_lower), ('R_SMD_upper', R_SMD_upper)]:
+            store.write(f'sfr_smd_rate_comparison/{name}', np.array([rates[r_MW] for r_MW in r_MW_values]),
+                        units='Gpc^-3 yr^-1', attrs=attrs)
+
+    # Set global font sizes
+    plt.rcParams.update({'font.size': 20,
+                        'axes.labelsize': 20,
+                        'axes.titlesize': 20,
+                        'xtick.labelsize': 20,
+                        'ytick.labelsize': 20,
+                        'legend.fontsize': 20})
+
+    # Plotting
+    plt.figure(figsize=(12, 8))
+
+    # Colorblind friendly palette (IBM ColorBlind Safe palette)
+    colors = ['#648FFF', '#785EF0', '#DC267F', '#FE6100']
+    legend_elements = []
+
+    # Add simple legend for line types
+    legend_elements.append(plt.Line2D([0], [0], color='gray', label='$\mathcal{R}_{SFR}$', linewidth=2))
+    legend_elements.append(plt.Line2D([0], [0], color='gray', linestyle='--', label='$\mathcal{R}_{SMD}$', linewidth=2))
+
+    for i, r_MW in enumerate(r_MW_values):
+        # Plot R_SFR with error region
+        plt.plot(z_values, R_SFR[r_MW], 
+                 color=colors[i],
+                 linewidth=2)
+        plt.fill_between(z_values, 
+                         R_SFR_lower[r_MW], 
+                         R_SFR_upper[r_MW], 
+                         color=colors[i],
+                         alpha=0.1)
+
+        # Plot R_SMD with error region
+        plt.plot(z_values, R_SMD[r_MW], 
+                 color=colors[i],
+                 linestyle='--',
+                 linewidth=2)
+        plt.fill_between(z_values, 
+                         R_SMD_lower[r_MW], 
+                         R_SMD_upper[r_MW], 
+                         color=colors[i],
+                         alpha=0.2)
+
+        # Add r_MW value annotation on the left side
+        y_pos = R_SFR[r_MW][0]  # Get y-value at z=0
+        plt.annotate(f'$r_{{MW}}=10^{{{int(np.log10(r_MW))}}}$ yr$^{{-1}}$',
+                    xy=(0, y_pos),
+                    xytext=(0.83, y_pos),
+                    textcoords='data',
+                    color=colors[i],
+                    fontsize=20,
+                    horizontalalignment='right',
+                    verticalalignment='center')
+
+
+    plt.xlabel('Redshift $(z)$')
+    plt.ylabel('Volumetric Rate (Gpc$^{-3}$ yr$^{-1}$)')
+    # plt.title('Volumetric Rate vs Redshift (up to $z = 4$)')
+    plt.grid(True)
+    plt.yscale('log')
+    plt.legend(handles=legend_elements, loc='upper right')
+
+    # Adjust plot limits to accommodate left-side labels
+    plt.xlim(0, 4)
+    plt.tight_layout()
+    plt.savefig('sfr_smd_vs_rate.pdf',  dpi=300, bbox_inches='tight')
+    plt.show()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from functools import lru_cache
+
 import numpy as np
-import scipy.integrate as integrate
 import matplotlib.pyplot as plt
 
+# Shared helpers live in misc/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+import instrumentation as instr
+import integration
+from host_mass_sampler import HostMassSampler
+
 # Constants for the double Schechter function
 phi1 = 0.4e-3  # Gpc^-3
 phi2 = 0.6e-3  # Gpc^-3
@@ -9,60 +21,121 @@ alpha1 = -1.3
 alpha2 = -1.5
 M_star = 1e10  # Solar masses
 
-def double_schechter(M):
+# Integration limits for n_galaxies
+mass_min = 1e8
+mass_max = 1e12
+
+# Number of (rate, galaxy mass) pairs converted per vectorized batch
+batch_size = 65536
+
+# Output columns for batch mode
+output_fields = ['rate_per_year', 'galaxy_mass', 'R', 'n_value', 'N', 'result']
+
+def double_schechter(M, phi1=phi1, phi2=phi2, alpha1=alpha1, alpha2=alpha2, M_star=M_star):
     """Double Schechter function."""
     M_ratio = M / M_star
     term1 = phi1 * (M_ratio ** alpha1) * np.exp(-M_ratio)
     term2 = phi2 * (M_ratio ** alpha2) * np.exp(-M_ratio)
     return np.log(10) * (term1 + term2)
 
-def cumulative_number_density(mass_range):
-    """Calculate the cumulative number density of galaxies."""
-    cumulative_density = np.zeros_like(mass_range)
-    for i, M in enumerate(mass_range):
-        cumulative_density[i], _ = integrate.quad(double_schechter, mass_range[0], M)
-    return cumulative_density
+@lru_cache(maxsize=None)
+def integrated_number_density(phi1=phi1, phi2=phi2, alpha1=alpha1, alpha2=alpha2, M_star=M_star):
+    """Integrated number density n_galaxies, computed once per parameter set."""
+    return integration.integrate(double_schechter, mass_min, mass_max, args=(phi1, phi2, alpha1, alpha2, M_star),
+                                 log_variable=True).value
 
-def main():
-    # Step 1: Take user input for the rate
-    rate_per_year = float(input("Enter the rate per year: "))
-    print(f"Rate per year: {rate_per_year:.2e} yr^-1")
+instr.watch_cache('integrated_number_density', integrated_number_density)
 
-    # Step 2: Ask for the mass of the galaxy
-    galaxy_mass = float(input("Enter the mass of the galaxy (in solar masses): "))
-    print(f"Galaxy mass: {galaxy_mass:.2e} M_sun")
+@lru_cache(maxsize=None)
+def host_sampler():
+    """Inverse-CDF sampler of host galaxy masses from the double Schechter function, built once."""
+    return HostMassSampler(double_schechter, log_mass_min=np.log10(mass_min), log_mass_max=np.log10(mass_max))
 
-    # Step 3: Calculate R
-    R = rate_per_year / galaxy_mass
-    print(f"Rate per year per solar mass, R: {R:.2e} yr^-1 M_sun^-1")
+instr.watch_cache('host_sampler', host_sampler)
 
-    # Step 4 & 5: Integrate the double Schechter function over the mass range
-    mass_range = np.logspace(8, 12, 1000)
-    n_galaxies, _ = integrate.quad(double_schechter, 1e8, 1e12)
-    print(f"Integrated number density of galaxies, n_galaxies: {n_galaxies:.2e} Gpc^-3")
-
-    # Additional print statement for rate per year * n_galaxies
-    rate_times_n_galaxies = rate_per_year * n_galaxies
-    print(f"Rate per year multiplied by n_galaxies: {rate_times_n_galaxies:.2e} yr^-1 Gpc^-3")
+def cumulative_number_density(mass_range):
+    """Calculate the cumulative number density of galaxies."""
+    # Integrate each interval between neighbouring masses once and accumulate
+    cumulative_density = np.zeros_like(mass_range)
+    with instr.stage('cumulative_density'):
+        for i in range(1, len(mass_range)):
+            cumulative_density[i] = integration.integrate(double_schechter, mass_range[i - 1], mass_range[i],
+                                                          log_variable=True).value
+    return np.cumsum(cumulative_density)
 
-    # Step 6: Calculate the value of the double Schechter function at the galaxy mass
+def volumetric_rate(rate_per_year, galaxy_mass, n_galaxies):
+    """Vectorized R * n_galaxies * N for arrays of (rate, galaxy mass) pairs."""
+    rate_per_year = np.asarray(rate_per_year, dtype=float)
+    galaxy_mass = np.asarray(galaxy_mass, dtype=float)
+    R = rate_per_year / galaxy_mass
     n_value = double_schechter(galaxy_mass)
-    print(f"Number density at galaxy mass, n_value: {n_value:.2e} Gpc^-3")
-
-    # Step 7: Define normalization value N
     N = n_galaxies / n_value
-    print(f"Normalization value, N: {N:.2e}")
+    return {
+        'rate_per_year': rate_per_year,
+        'galaxy_mass': galaxy_mass,
+        'R': R,
+        'n_value': n_value,
+        'N': N,
+        'result': R * n_galaxies * N,
+    }
 
-    # Step 8: Multiply R * n_galaxies * N
-    result = R * n_galaxies * N
-    print(f"Result of R * n_galaxies * N: {result:.2e} yr^-1 Gpc^-3")
+def read_pairs(stream, size=batch_size):
+    """Yield (rate_per_year, galaxy_mass) arrays of up to `size` pairs from a text stream.
+
+    Each line holds a rate and a galaxy mass separated by a comma or whitespace.
+    Blank lines, '#' comments and a non-numeric header as the first line are skipped;
+    any other line that is not two finite numbers with a positive galaxy mass raises
+    ValueError naming its line number.
+    """
+    rates, masses = [], []
+    first = True
+    for number, line in enumerate(stream, start=1):
+        fields = line.replace(',', ' ').split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        try:
+            values = [float(field) for field in fields]
+        except ValueError:
+            if first:
+                first = False
+                continue
+            values = None
+        first = False
+        if values is None or len(values) != 2:
+            raise ValueError(f"line {number}: expected a rate and a galaxy mass, got {line.strip()!r}")
+        rate, mass = values
+        if not (np.isfinite(rate) and np.isfinite(mass)) or mass <= 0:
+            raise ValueError(f"line {number}: rate must be finite and galaxy mass finite and positive, "
+                             f"got {line.strip()!r}")
+        rates.append(rate)
+        masses.append(mass)
+        if len(rates) == size:
+            yield np.array(rates), np.array(masses)
+            rates, masses = [], []
+    if rates:
+        yield np.array(rates), np.array(masses)
+
+def write_results(results, stream, fmt, header=False):
+    """Write one batch of results to `stream` as NDJSON or CSV rows."""
+    columns = [results[field].tolist() for field in output_fields]
+    if fmt == 'ndjson':
+        for row in zip(*columns):
+            stream.write(json.dumps(dict(zip(output_fields, row))) + '\n')
+    else:
+        writer = csv.writer(stream)
+        if header:
+            writer.writerow(output_fields)
+        writer.writerows(zip(*columns))
+    stream.flush()
 
-    # Step 9: Plot the double Schechter function
+def plot_double_schechter(mass_range, galaxy_mass, n_value):
+    """Plot the double Schechter function with the galaxy mass(es) marked."""
     schechter_values = double_schechter(mass_range)
-    
+    label = f'Galaxy Mass: {galaxy_mass:.2e} M_sun' if np.ndim(galaxy_mass) == 0 else 'Galaxy Masses'
+
     plt.figure(figsize=(10, 6))
     plt.loglog(mass_range, schechter_values, label='Double Schechter Function', color='blue')
-    plt.scatter(galaxy_mass, n_value, color='red', zorder=5, label=f'Galaxy Mass: {galaxy_mass:.2e} M_sun')
+    plt.scatter(galaxy_mass, n_value, color='red', zorder=5, label=label)
     plt.xlabel('Mass (Solar Masses)', fontsize=12)
     plt.ylabel('Number Density (Gpc$^{-3}$)', fontsize=12)
     plt.title('Double Schechter Function', fontsize=14)
@@ -75,7 +148,8 @@ def main():
     plt.tight_layout()
     plt.show()
 
-    # New Plot: Cumulative Number Density
+def plot_cumulative_density(mass_range):
+    """Plot the cumulative number density of galaxies."""
     cumulative_density = cumulative_number_density(mass_range)
     
     plt.figure(figsize=(10, 6))
@@ -92,5 +166,123 @@ def main():
     plt.tight_layout()
     plt.show()
 
+def run_batch(input_path, output_path, fmt, plot=False):
+    """Convert (rate, galaxy mass) pairs from a file or stdin ('-') in vectorized batches."""
+    n_galaxies = integrated_number_density()
+    instream = sys.stdin if input_path == '-' else open(input_path, 'r')
+    outstream = sys.stdout if output_path == '-' else open(output_path, 'w', newline='')
+    plotted_masses = []
+    try:
+        for i, (rates, masses) in enumerate(read_pairs(instream)):
+            with instr.stage('batch_evaluation'):
+                results = volumetric_rate(rates, masses, n_galaxies)
+            instr.count('pairs_evaluated', len(rates))
+            with instr.stage('write_results'):
+                write_results(results, outstream, fmt, header=(i == 0))
+            if plot:
+                plotted_masses.append(masses)
+    finally:
+        if instream is not sys.stdin:
+            instream.close()
+        if outstream is not sys.stdout:
+            outstream.close()
+
+    if plot and plotted_masses:
+        masses = np.concatenate(plotted_masses)
+        mass_range = np.logspace(8, 12, 1000)
+        with instr.stage('plot'):
+            plot_double_schechter(mass_range, masses, double_schechter(masses))
+            plot_cumulative_density(mass_range)
+
+def run_hosts(rate_per_year, n_hosts, output_path, fmt, seed=None):
+    """Evaluate a per-galaxy rate at n_hosts galaxy masses drawn from the mass function, in batches."""
+    n_galaxies = integrated_number_density()
+    rng = np.random.default_rng(seed)
+    outstream = sys.stdout if output_path == '-' else open(output_path, 'w', newline='')
+    try:
+        for i, start in enumerate(range(0, n_hosts, batch_size)):
+            with instr.stage('host_sampling'):
+                masses = host_sampler().draw(min(batch_size, n_hosts - start), rng)
+            with instr.stage('batch_evaluation'):
+                results = volumetric_rate(np.full(masses.size, rate_per_year), masses, n_galaxies)
+            instr.count('pairs_evaluated', masses.size)
+            with instr.stage('write_results'):
+                write_results(results, outstream, fmt, header=(i == 0))
+    finally:
+        if outstream is not sys.stdout:
+            outstream.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Volumetric rate from a per-galaxy rate and galaxy mass.')
+    parser.add_argument('--batch', metavar='FILE',
+                        help="read (rate, galaxy mass) pairs from FILE ('-' for stdin) instead of prompting")
+    parser.add_argument('--output', default='-', metavar='FILE',
+                        help="batch output file ('-' for stdout, the default)")
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson',
+                        help='batch output format')
+    parser.add_argument('--hosts', type=int, metavar='N',
+                        help='draw N host galaxy masses from the mass function instead of reading pairs (needs --rate)')
+    parser.add_argument('--rate', type=float, help='rate per year used with --hosts')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for --hosts')
+    parser.add_argument('--plot', action='store_true',
+                        help='show the plots in batch mode')
+    parser.add_argument('--profile', action='store_true',
+                        help='write a stage timing trace at exit (same as MSEC_PROFILE=1)')
+    args = parser.parse_args()
+    if args.profile:
+        instr.enable()
+
+    if args.hosts is not None:
+        if args.rate is None:
+            parser.error('--hosts needs --rate')
+        run_hosts(args.rate, args.hosts, args.output, args.format, args.seed)
+        return
+
+    if args.batch is not None:
+        run_batch(args.batch, args.output, args.format, plot=args.plot)
+        return
+
+    # Step 1: Take user input for the rate
+    rate_per_year = float(input("Enter the rate per year: "))
+    print(f"Rate per year: {rate_per_year:.2e} yr^-1")
+
+    # Step 2: Ask for the mass of the galaxy
+    galaxy_mass = float(input("Enter the mass of the galaxy (in solar masses): "))
+    if not galaxy_mass > 0:
+        raise ValueError(f"galaxy mass must be positive, got {galaxy_mass}")
+    print(f"Galaxy mass: {galaxy_mass:.2e} M_sun")
+
+    # Step 3: Calculate R
+    R = rate_per_year / galaxy_mass
+    print(f"Rate per year per solar mass, R: {R:.2e} yr^-1 M_sun^-1")
+
+    # Step 4 & 5: Integrate the double Schechter function over the mass range
+    mass_range = np.logspace(8, 12, 1000)
+    n_galaxies = integrated_number_density()
+    print(f"Integrated number density of galaxies, n_galaxies: {n_galaxies:.2e} Gpc^-3")
+
+    # Additional print statement for rate per year * n_galaxies
+    rate_times_n_galaxies = rate_per_year * n_galaxies
+    print(f"Rate per year multiplied by n_galaxies: {rate_times_n_galaxies:.2e} yr^-1 Gpc^-3")
+
+    # Step 6: Calculate the value of the double Schechter function at the galaxy mass
+    n_value = double_schechter(galaxy_mass)
+    print(f"Number density at galaxy mass, n_value: {n_value:.2e} Gpc^-3")
+
+    # Step 7: Define normalization value N
+    N = n_galaxies / n_value
+    print(f"Normalization value, N: {N:.2e}")
+
+    # Step 8: Multiply R * n_galaxies * N
+    result = R * n_galaxies * N
+    print(f"Result of R * n_galaxies * N: {result:.2e} yr^-1 Gpc^-3")
+
+    with instr.stage('plot'):
+        # Step 9: Plot the double Schechter function
+        plot_double_schechter(mass_range, galaxy_mass, n_value)
+
+        # New Plot: Cumulative Number Density
+        plot_cumulative_density(mass_range)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,153 @@
+import csv
+import glob
+import os
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+
+# Shared helpers live in misc/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+import lookup_tables
+
+# Constants
+M_sun = 1.989e33  # Solar mass in grams
+table_points = 4096  # Points of the dense uniform-mass table built from each EOS
+table_version = 2  # Bump when the table construction changes
+
+# Tabulated EOS files: CSV with columns M_Msun, R_km and optionally I_1e45 (g cm^2 / 1e45),
+# one row per configuration in order of increasing central density, e.g. exported from CompOSE
+# or LALSuite; rows past the maximum mass (the unstable branch) are dropped. SLy, APR4, MPA1 and
+# H4 ship in eos_tables/, tabulated by tov.py from the Read et al. (2009) piecewise polytropes
+eos_dir = os.environ.get('MSEC_EOS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eos_tables'))
+
+# Dense table of one EOS on a uniform mass grid; radius in cm, inertia in g cm^2
+EOSTable = namedtuple('EOSTable', ['name', 'mass_min', 'mass_step', 'radius', 'inertia'])
+
+def lattimer_schutz_I(M_Msun, R_km):
+    """Moment of inertia (g cm^2) from the Lattimer & Schutz (2005) fit, I = 0.237 M R^2 [1 + 4.2 x + 90 x^4]."""
+    x = M_Msun / R_km  # (M/M_sun) / (R/km)
+    return 0.237 * M_Msun * M_sun * (R_km * 1e5)**2 * (1 + 4.2 * x + 90 * x**4)
+
+def fixed_radius_eos(R_km, M_min=1.0, M_max=2.2):
+    """Reference M-R relation with constant radius, for use when no tabulated EOS is available."""
+    M = np.linspace(M_min, M_max, 25)
+    return M, np.full_like(M, R_km), None
+
+# Built-in relations: name -> function returning (M in M_sun, R in km, I in 1e45 g cm^2 or None)
+builtin_eos = {
+    'R10km': lambda: fixed_radius_eos(10.0),
+    'R12km': lambda: fixed_radius_eos(12.0),
+    'R14km': lambda: fixed_radius_eos(14.0),
+}
+
+def read_eos_file(path):
+    """Read (M in M_sun, R in km, I in 1e45 g cm^2 or None) from a tabulated EOS CSV file."""
+    with open(path, 'r', newline='') as f:
+        rows = list(csv.DictReader(f))
+    M = np.array([float(row['M_Msun']) for row in rows])
+    R = np.array([float(row['R_km']) for row in rows])
+    I = np.array([float(row['I_1e45']) for row in rows]) if rows and 'I_1e45' in rows[0] else None
+    return M, R, I
+
+def available_eos():
+    """Names of the built-in relations and of the tabulated EOS files in eos_dir."""
+    files = sorted(glob.glob(os.path.join(eos_dir, '*.csv')))
+    return list(builtin_eos) + [os.path.splitext(os.path.basename(path))[0] for path in files]
+
+def eos_points(name):
+    if name in builtin_eos:
+        return builtin_eos[name]()
+    path = os.path.join(eos_dir, f'{name}.csv')
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown EOS '{name}'. Available: {', '.join(available_eos())}")
+    return read_eos_file(path)
+
+def stable_branch(M, R, I=None):
+    """
+    The stable branch of a mass-radius sequence ordered by central density, sorted by mass.
+
+    Rows after the maximum mass are dropped. Raises ValueError if the mass does not increase
+    strictly along the kept rows, since R(M) and I(M) would then not be single-valued.
+    """
+    M, R = np.asarray(M, dtype=float), np.asarray(R, dtype=float)
+    stable = slice(0, int(np.argmax(M)) + 1)
+    M, R = M[stable], R[stable]
+    I = None if I is None else np.asarray(I, dtype=float)[stable]
+    if M.size < 2 or np.any(np.diff(M) <= 0):
+        raise ValueError("EOS masses must increase strictly with central density up to the maximum mass")
+    return M, R, I
+
+@lru_cache(maxsize=None)
+def eos_table(name):
+    """
+    Dense R(M) and I(M) table for an EOS, built once with monotone (PCHIP) interpolants.
+
+    The table is stored through lookup_tables, so later runs open it memory-mapped instead of
+    rebuilding it. Only the stable branch up to the maximum mass is kept (see stable_branch).
+    """
+    M, R, I = stable_branch(*eos_points(name))
+    I = lattimer_schutz_I(M, R) if I is None else I * 1e45
+    mass_grid = np.linspace(M[0], M[-1], table_points)
+
+    def build():
+        return np.stack([PchipInterpolator(M, R * 1e5)(mass_grid), PchipInterpolator(M, I)(mass_grid)])
+
+    table = lookup_tables.cached_table(f'eos_{name}', {'M': M, 'R': R, 'I': I, 'points': table_points,
+                                                       'version': table_version}, build)
+    return EOSTable(name, M[0] * M_sun, (mass_grid[1] - mass_grid[0]) * M_sun, table[0], table[1])
+
+def _grid_position(eos, M):
+    """Cell index and linear weight on the uniform mass grid, and the in-range mask."""
+    position = (np.asarray(M, dtype=float) - eos.mass_min) / eos.mass_step
+    last = eos.radius.shape[0] - 1
+    index = np.clip(position.astype(np.intp), 0, last - 1)
+    weight = position - index
+    # Allow for round-off at the grid ends, e.g. exactly at the maximum mass
+    return index, weight, (position >= -1e-9) & (position <= last + 1e-9)
+
+def _lookup(values, index, weight, valid):
+    """Linear interpolation on the uniform mass grid; NaN outside the stable branch."""
+    low = values[index]
+    result = np.asarray(low + (values[index + 1] - low) * weight)
+    result[~valid] = np.nan
+    return result[()] if result.ndim == 0 else result
+
+def eos_radius(eos, M):
+    """Radius in cm for NS masses M in grams (vectorized)."""
+    return _lookup(eos.radius, *_grid_position(eos, M))
+
+def eos_moment_of_inertia(eos, M):
+    """Moment of inertia in g cm^2 for NS masses M in grams (vectorized)."""
+    return _lookup(eos.inertia, *_grid_position(eos, M))
+
+def eos_radius_and_inertia(eos, M):
+    """(radius in cm, moment of inertia in g cm^2) for NS masses M in grams, sharing one grid lookup."""
+    position = _grid_position(eos, M)
+    return _lookup(eos.radius, *position), _lookup(eos.inertia, *position)
+
+def check_stable_branch(n=200):
+    """
+    Maximum radius error (km) of the R(M) interpolant on a toy sequence that turns over at 2.1 M☉.
+
+    Along central density x the toy has M = 1 + 1.1 sin(πx/2) and R = 13 - 3x (km) for 0 <= x <= 1.6,
+    so every mass above 1.6 M☉ appears on both branches; the error is near zero only when the
+    unstable rows are dropped.
+    """
+    x = np.linspace(0, 1.6, n)
+    M, R, _ = stable_branch(1 + 1.1 * np.sin(np.pi * x / 2), 13 - 3 * x)
+    mass = np.linspace(1.0, 2.1, 1001)
+    truth = 13 - 3 * (2 / np.pi) * np.arcsin((mass - 1) / 1.1)
+    return float(np.max(np.abs(PchipInterpolator(M, R)(mass) - truth)))
+
+if __name__ == "__main__":
+    print(f"Stable-branch check: max R(M) error {check_stable_branch():.2e} km on a turning-over sequence")
+    for name in available_eos():
+        eos = eos_table(name)
+        M = np.array([1.4, 2.0]) * M_sun
+        R = eos_radius(eos, M)
+        I = eos_moment_of_inertia(eos, M)
+        for m, r, i in zip(M, R, I):
+            print(f"{name}: M = {m/M_sun:.1f} M☉, R = {r/1e5:.2f} km, I = {i:.3e} g cm^2")
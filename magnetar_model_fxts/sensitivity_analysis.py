@@ -0,0 +1,164 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import qmc
+
+# Shared helpers live in misc/, the formation scenarios in formationscenarios/
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_dir, 'misc'))
+sys.path.insert(0, os.path.join(repo_dir, 'formationscenarios'))
+import instrumentation as instr
+import ep_eventrate_of_fxts
+import BP_PPdot_diagram
+from spindown_energy_calculation import calculate_I, calculate_luminosities, M_sun
+
+# Uncertain inputs: (name, lower bound, upper bound), sampled uniformly between the bounds
+parameters = [
+    ('log_eta', -4.0, -1.0),  # X-ray conversion efficiency
+    ('M_NS', 1.2, 2.2),  # NS mass in M_sun
+    ('R_NS', 10.0, 14.0),  # NS radius in km
+    ('log_B', 14.0, 16.0),  # Dipole field in G
+    ('P_ms', 1.0, 2.0),  # Initial spin period in ms
+    ('log_flux_limit', np.log10(ep_eventrate_of_fxts.flux_limit) - 0.5,
+     np.log10(ep_eventrate_of_fxts.flux_limit) + 0.5),  # erg/s/cm^2
+    ('N_FXT', 30.0, 120.0),  # Number of detected FXTs
+]
+# One log10 rate per formation scenario, +/- 1 dex around the adopted value (Gpc^-3 yr^-1)
+for scenario, data in BP_PPdot_diagram.scenarios.items():
+    parameters.append((f'log_rate[{scenario}]', np.log10(data['rate']) - 1, np.log10(data['rate']) + 1))
+
+parameter_names = [name for name, _, _ in parameters]
+lower_bounds = np.array([low for _, low, _ in parameters])
+upper_bounds = np.array([high for _, _, high in parameters])
+
+output_names = ['log_L_X', 'log_tau_sd', 'log_magnetar_fraction']
+
+def model(X):
+    """
+    Vectorized spin-down and detectability model.
+
+    Parameters:
+    X (ndarray): Design points, shape (n, len(parameters)), columns ordered as `parameters`
+
+    Returns:
+    ndarray: Shape (n, len(output_names)) with log10 L_X (erg/s), log10 spin-down time (s)
+             and log10 of the magnetar formation rate over the FXT space density rate
+    """
+    eta = 10**X[:, 0]
+    M = X[:, 1] * M_sun
+    R = X[:, 2] * 1e5
+    B = 10**X[:, 3]
+    P = X[:, 4]
+    flux_limit = 10**X[:, 5]
+    N_FXT = X[:, 6]
+    magnetar_rate = np.sum(10**X[:, 7:], axis=1)
+
+    L_sd, _ = calculate_luminosities(B, P, M, R)
+    L_X = eta * L_sd
+    Omega = 2 * np.pi / (P * 1e-3)
+    tau_sd = calculate_I(M, R) * Omega**2 / (2 * L_sd)
+    rho = ep_eventrate_of_fxts.rho_FXT(L_X, N_FXT=N_FXT, flux_limit=flux_limit)
+
+    return np.column_stack([np.log10(L_X), np.log10(tau_sd), np.log10(magnetar_rate / rho)])
+
+def saltelli_design(n_base, seed=None):
+    """
+    Sobol quasi-random matrices A, B and the k mixed matrices AB_i (column i taken from B).
+
+    Returns:
+    ndarray: Shape (k + 2, n_base, k), stacked as [A, B, AB_1, ..., AB_k]
+    """
+    k = len(parameters)
+    sampler = qmc.Sobol(d=2 * k, scramble=True, seed=seed)
+    base = qmc.scale(sampler.random(n_base), np.tile(lower_bounds, 2), np.tile(upper_bounds, 2))
+    A, B = base[:, :k], base[:, k:]
+    design = np.empty((k + 2, n_base, k))
+    design[0] = A
+    design[1] = B
+    for i in range(k):
+        design[2 + i] = A
+        design[2 + i, :, i] = B[:, i]
+    return design
+
+def evaluate_design(design, workers=1, chunk_size=65536):
+    """Evaluate the model over all design points in chunks, optionally across a process pool."""
+    points = design.reshape(-1, design.shape[-1])
+    chunks = [points[i:i + chunk_size] for i in range(0, len(points), chunk_size)]
+    with instr.stage('model_evaluation'):
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                outputs = list(pool.map(model, chunks))
+        else:
+            outputs = [model(chunk) for chunk in chunks]
+    instr.count('model_evaluations', len(points))
+    return np.concatenate(outputs).reshape(design.shape[:2] + (-1,))
+
+def sobol_indices(f_A, f_B, f_AB):
+    """
+    First-order (Saltelli 2010) and total (Jansen 1999) Sobol indices.
+
+    f_A, f_B have shape (..., n); f_AB has shape (k, ..., n). Returns (S1, ST) of shape (k, ...).
+    Outputs are centred first, which keeps the first-order estimator's variance low.
+    """
+    f_pooled = np.concatenate([f_A, f_B], axis=-1)
+    mean = np.mean(f_pooled, axis=-1, keepdims=True)
+    variance = np.var(f_pooled, axis=-1)
+    f_A, f_B, f_AB = f_A - mean, f_B - mean, f_AB - mean
+    S1 = np.mean(f_B * (f_AB - f_A), axis=-1) / variance
+    ST = 0.5 * np.mean((f_A - f_AB)**2, axis=-1) / variance
+    return S1, ST
+
+def sensitivity_analysis(n_base=4096, n_bootstrap=500, confidence=0.95, workers=1, seed=None):
+    """
+    Sobol indices with bootstrap confidence intervals for every model output.
+
+    Returns:
+    dict: output name -> {'S1', 'ST', 'S1_ci', 'ST_ci'}, arrays indexed like `parameters`
+          (the *_ci entries have shape (k, 2))
+    """
+    design = saltelli_design(n_base, seed)
+    f = evaluate_design(design, workers)
+    f_A, f_B, f_AB = f[0], f[1], f[2:]
+
+    rng = np.random.default_rng(seed)
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+    results = {}
+    with instr.stage('bootstrap'):
+        for j, name in enumerate(output_names):
+            S1, ST = sobol_indices(f_A[:, j], f_B[:, j], f_AB[:, :, j])
+            # Resample design rows; all bootstrap replicates are evaluated as one batch
+            rows = rng.integers(0, n_base, size=(n_bootstrap, n_base))
+            S1_boot, ST_boot = sobol_indices(f_A[rows, j], f_B[rows, j], f_AB[:, rows, j])
+            results[name] = {
+                'S1': S1,
+                'ST': ST,
+                'S1_ci': np.quantile(S1_boot, quantiles, axis=-1).T,
+                'ST_ci': np.quantile(ST_boot, quantiles, axis=-1).T,
+            }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Sobol sensitivity of the magnetar FXT model.')
+    parser.add_argument('--n-base', type=int, default=4096,
+                        help='base Sobol sample size (power of 2); total evaluations = n_base * (k + 2)')
+    parser.add_argument('--bootstrap', type=int, default=500, help='number of bootstrap resamples')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    args = parser.parse_args()
+
+    results = sensitivity_analysis(args.n_base, args.bootstrap, workers=args.workers, seed=args.seed)
+    print(f"Model evaluations: {args.n_base * (len(parameters) + 2)}")
+    for name, indices in results.items():
+        print(f"\nOutput: {name}")
+        print(f"{'Parameter':<30} {'S1':>7} {'95% CI':>17} {'ST':>7} {'95% CI':>17}")
+        for i, parameter in enumerate(parameter_names):
+            S1_lo, S1_hi = indices['S1_ci'][i]
+            ST_lo, ST_hi = indices['ST_ci'][i]
+            print(f"{parameter:<30} {indices['S1'][i]:7.3f} [{S1_lo:6.3f}, {S1_hi:6.3f}] "
+                  f"{indices['ST'][i]:7.3f} [{ST_lo:6.3f}, {ST_hi:6.3f}]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import csv
+import os
+
+import numpy as np
+from scipy.integrate import solve_ivp
+
+# Constants
+G = 6.67430e-8  # Gravitational constant in cgs units
+c = 2.99792458e10  # Speed of light in cm/s
+M_sun = 1.989e33  # Solar mass in grams
+km_per_g_cm3 = G / c**2 * 1e10  # Density (or p/c^2) in g/cm^3 to geometrized km^-2
+M_sun_km = G * M_sun / c**2 / 1e5  # Solar mass in km
+
+# SLy crust as four polytropes p/c^2 = K rho^Gamma (rho in g/cm^3), Read et al. (2009) Table II:
+# (K, Gamma, upper density)
+sly_crust = [
+    (6.80110e-9, 1.58425, 2.44034e7),
+    (1.06186e-6, 1.28733, 3.78358e11),
+    (5.32697e1, 0.62223, 2.62780e12),
+    (3.99874e-8, 1.35692, None),  # Up to the crust-core transition, fixed by continuity
+]
+
+# Core pressures at rho_1 and adiabatic indices, Read et al. (2009) Table III:
+# name -> (log10 p_1 in dyn/cm^2, Gamma_1, Gamma_2, Gamma_3)
+piecewise_polytropes = {
+    'SLy': (34.384, 3.005, 2.988, 2.851),
+    'APR4': (34.269, 2.830, 3.445, 3.348),
+    'MPA1': (34.495, 3.446, 3.572, 2.887),
+    'H4': (34.669, 2.909, 2.246, 2.144),
+}
+rho_1 = 10**14.7  # g/cm^3, dividing densities of the core pieces
+rho_2 = 10**15.0
+
+# Central densities of the tabulated sequences
+log_rho_c_min = 14.55
+log_rho_c_max = 15.6
+sequence_points = 106
+
+eos_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eos_tables')
+
+class PiecewisePolytrope:
+    """Cold EOS of polytropic pieces: p(rho), rho(p) and energy density eps(rho), all in g/cm^3."""
+
+    def __init__(self, log_p1, gamma_1, gamma_2, gamma_3, crust=sly_crust):
+        K_1 = 10**log_p1 / c**2 / rho_1**gamma_1
+        K_2 = K_1 * rho_1**(gamma_1 - gamma_2)
+        K_3 = K_2 * rho_2**(gamma_2 - gamma_3)
+        K_crust, gamma_crust, _ = crust[-1]
+        rho_0 = (K_crust / K_1)**(1 / (gamma_1 - gamma_crust))
+        self.K = np.array([K for K, _, _ in crust] + [K_1, K_2, K_3])
+        self.gamma = np.array([gamma for _, gamma, _ in crust] + [gamma_1, gamma_2, gamma_3])
+        self.rho_edges = np.array([0.0] + [rho for _, _, rho in crust[:-1]] + [rho_0, rho_1, rho_2, np.inf])
+        self.p_edges = self.K * self.rho_edges[:-1]**self.gamma
+        # Energy density eps = (1 + a) rho + K rho^Gamma / (Gamma - 1), continuous across pieces
+        self.a = np.zeros(self.K.size)
+        for i in range(1, self.K.size):
+            rho = self.rho_edges[i]
+            eps = (1 + self.a[i - 1]) * rho + self.K[i - 1] * rho**self.gamma[i - 1] / (self.gamma[i - 1] - 1)
+            self.a[i] = eps / rho - 1 - self.K[i] * rho**(self.gamma[i] - 1) / (self.gamma[i] - 1)
+
+    def pressure(self, rho):
+        i = np.searchsorted(self.rho_edges, rho, side='right') - 1
+        return self.K[i] * rho**self.gamma[i]
+
+    def density(self, p):
+        i = max(np.searchsorted(self.p_edges, p, side='right') - 1, 0)
+        return (p / self.K[i])**(1 / self.gamma[i])
+
+    def energy_density(self, rho):
+        i = np.searchsorted(self.rho_edges, rho, side='right') - 1
+        return (1 + self.a[i]) * rho + self.K[i] * rho**self.gamma[i] / (self.gamma[i] - 1)
+
+def _structure(r, y, eos):
+    """TOV with the slow-rotation frame dragging of Hartle (1967), geometrized units (km)."""
+    m, p, log_j, omega, kappa = y
+    if p <= 0:
+        return np.zeros(5)
+    rho = eos.density(p / km_per_g_cm3)
+    eps = eos.energy_density(rho) * km_per_g_cm3
+    f = 1 - 2 * m / r
+    dm = 4 * np.pi * r**2 * eps
+    dp = -(eps + p) * (m + 4 * np.pi * r**3 * p) / (r**2 * f)
+    dlog_j = -4 * np.pi * r * (eps + p) / f
+    j = np.exp(log_j)
+    # kappa = r^4 j d(omega)/dr, and d(kappa)/dr = -4 r^3 (dj/dr) omega
+    return np.array([dm, dp, dlog_j, kappa / (r**4 * j), -4 * r**3 * j * dlog_j * omega])
+
+def _surface(r, y, eos):
+    return y[1] - eos.p_edges[1] * 1e-3 * km_per_g_cm3
+_surface.terminal = True
+
+def star(eos, rho_c):
+    """
+    (M in M_sun, R in km, I in 1e45 g cm^2) of the non-rotating star with central density rho_c (g/cm^3).
+
+    The moment of inertia is J / Omega from the frame-dragging equation, matched at the surface
+    to the exterior solution omega = 2 J / r^3.
+    """
+    p_c = eos.pressure(rho_c) * km_per_g_cm3
+    eps_c = eos.energy_density(rho_c) * km_per_g_cm3
+    r_0 = 1e-6
+    y_0 = [4 / 3 * np.pi * r_0**3 * eps_c, p_c, 0.0, 1.0, 0.0]
+    solution = solve_ivp(_structure, (r_0, 50.0), y_0, args=(eos,), events=_surface, rtol=1e-10, atol=1e-30,
+                         method='LSODA')
+    R = solution.t[-1]
+    m, _, log_j, omega, kappa = solution.y[:, -1]
+    # Normalize j to its exterior value sqrt(1 - 2M/R) e^(-nu/2) = 1 at the surface
+    d_omega = kappa / (R**4 * np.exp(log_j))
+    J = R**4 * d_omega / 6
+    I_km3 = J / (omega + 2 * J / R**3)
+    return m / M_sun_km, R, I_km3 * 1e15 * c**2 / G / 1e45
+
+def sequence(name, n=sequence_points):
+    """Rows (M in M_sun, R in km, I in 1e45 g cm^2) in order of increasing central density."""
+    eos = PiecewisePolytrope(*piecewise_polytropes[name])
+    return [star(eos, rho_c) for rho_c in np.logspace(log_rho_c_min, log_rho_c_max, n)]
+
+def write_table(rows, path):
+    """Write rows in the CSV format read by eos.read_eos_file."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['M_Msun', 'R_km', 'I_1e45'])
+        for M, R, I in rows:
+            writer.writerow([f'{M:.6f}', f'{R:.5f}', f'{I:.6f}'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Tabulate M-R-I sequences of piecewise-polytrope EOSs for eos.py.')
+    parser.add_argument('names', nargs='*', default=list(piecewise_polytropes), help='EOS names (default: all)')
+    parser.add_argument('--output-dir', default=eos_dir)
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in args.names:
+        path = os.path.join(args.output_dir, f'{name}.csv')
+        rows = np.array(sequence(name))
+        write_table(rows, path)
+        k = np.argmax(rows[:, 0])
+        print(f"{name}: M_max = {rows[k, 0]:.3f} M☉ at R = {rows[k, 1]:.2f} km; written to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Detection efficiency of magnetar-powered X-ray transients.
+
+A dipole spin-down light curve L(t) = L_0 / (1 + t/τ)^2 at redshift z is
+observed by a pointing of length exposure_time that starts a random time after
+(or before) the onset, within one revisit_time. The transient is detected if,
+on any search timescale exposure_time / 2^k, the mean flux in some window
+reaches the flux limit scaled to that timescale (background-limited,
+∝ 1/sqrt(window)). The efficiency is the fraction of onset phases detected.
+
+Bolometric flux depends on (L_0, z, flux limit) only through
+q = L_0 / (4π d_L^2 flux_limit), and the light-curve shape only through the
+observed spin-down time τ (1 + z), so the simulated efficiency is tabulated
+once over (log q, log τ_obs) and every (L_0, τ, z, flux limit) query becomes a
+table lookup. The table is built in parallel and cached by lookup_tables.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+# The spin-down model lives in magnetar_model_fxts/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'magnetar_model_fxts'))
+import instrumentation as instr
+import lookup_tables
+import luminositydistance
+import ep_eventrate_of_fxts
+import viewing_geometry
+from duration_of_fxts import L_0_EM, tau_EM
+
+# Survey model
+exposure_time = 1200.0  # s, length of one pointing
+revisit_time = 86400.0  # s, time between pointings at the same field
+search_levels = 6  # Search timescales exposure_time / 2^k, k = 0 ... search_levels - 1
+n_phases = 256  # Onset phases averaged per efficiency value
+cm_per_mpc = 3.086e24  # 1 Mpc = 3.086e24 cm
+
+# Table grid: log10 q (peak flux over flux limit) and log10 observed spin-down time (s)
+log_q_axis = np.linspace(-4.0, 6.0, 401)
+log_tau_obs_axis = np.linspace(-1.0, 8.0, 361)
+table_version = 1  # Bump when the light-curve or survey model changes
+chunk_size = 2048  # Light curves simulated together
+
+def simulate_efficiency(log_q, log_tau_obs):
+    """
+    Detection efficiency from direct light-curve simulation over onset phases (vectorized).
+
+    Parameters:
+    log_q (array-like): log10 of peak bolometric flux over the flux limit
+    log_tau_obs (array-like): log10 of the observed spin-down time (s)
+
+    Returns:
+    ndarray: Fraction of onset phases for which the transient is detected
+    """
+    log_q, log_tau_obs = np.broadcast_arrays(np.asarray(log_q, dtype=float), np.asarray(log_tau_obs, dtype=float))
+    # Pointing start relative to the onset; negative values start the transient mid-pointing
+    phases = np.linspace(-exposure_time, revisit_time, n_phases, endpoint=False) + \
+        (revisit_time + exposure_time) / (2 * n_phases)
+    n_windows = 2**(search_levels - 1)
+    boundaries = phases[:, None] + np.linspace(0, exposure_time, n_windows + 1)  # (phases, boundaries)
+
+    q = 10**log_q.ravel()
+    tau_obs = 10**log_tau_obs.ravel()
+    efficiency = np.empty(q.size)
+    for start in range(0, q.size, chunk_size):
+        rows = slice(start, start + chunk_size)
+        tau = tau_obs[rows, None, None]
+        u = np.maximum(boundaries, 0)
+        # Observed fluence since onset in units of L_0 / (4π d_L^2 flux_limit): τ_obs u / (u + τ_obs)
+        fluence = q[rows, None, None] * tau * u / (u + tau)
+        detected = np.zeros(fluence.shape[:2], dtype=bool)
+        for level in range(search_levels):
+            stride = 2**level
+            window = exposure_time * stride / n_windows
+            mean_flux = np.diff(fluence[:, :, ::stride], axis=2) / window
+            detected |= np.any(mean_flux >= np.sqrt(exposure_time / window), axis=2)
+        efficiency[rows] = detected.mean(axis=1)
+    instr.count('light_curves_simulated', q.size * n_phases)
+    return efficiency.reshape(log_q.shape)
+
+def _efficiency_rows(log_q_rows):
+    """One block of table rows, for the process pool."""
+    return simulate_efficiency(log_q_rows[:, None], log_tau_obs_axis[None, :])
+
+def build_table(workers=None):
+    """Simulate the efficiency on the full (log q, log τ_obs) grid, split by rows across processes."""
+    blocks = np.array_split(log_q_axis, max(1, (workers or os.cpu_count()) * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return np.concatenate(list(pool.map(_efficiency_rows, blocks)))
+
+@lru_cache(maxsize=None)
+def efficiency_table():
+    """Memory-mapped efficiency table, versioned by the grid and survey model."""
+    inputs = {'log_q': log_q_axis, 'log_tau_obs': log_tau_obs_axis, 'exposure_time': exposure_time,
+              'revisit_time': revisit_time, 'search_levels': search_levels, 'n_phases': n_phases,
+              'version': table_version}
+    return lookup_tables.cached_table('detection_efficiency', inputs, build_table)
+
+instr.watch_cache('efficiency_table', efficiency_table)
+
+def reduced_coordinates(L_0, tau, z, flux_limit=ep_eventrate_of_fxts.flux_limit):
+    """(log10 q, log10 τ_obs) for peak luminosity L_0 (erg/s), spin-down time tau (s) and redshift z."""
+    z = np.asarray(z, dtype=float)
+    D_L = luminositydistance.luminosity_distance(z) * cm_per_mpc
+    with np.errstate(divide='ignore'):
+        log_q = np.log10(L_0) - np.log10(4 * np.pi * D_L**2 * flux_limit)
+    return log_q, np.log10(tau * (1 + z))
+
+def detection_efficiency(L_0, tau, z, flux_limit=ep_eventrate_of_fxts.flux_limit):
+    """
+    Detection efficiency for peak luminosity L_0 (erg/s), spin-down time tau (s, source frame),
+    redshift z and flux limit (erg/s/cm^2), all broadcast together.
+
+    Interpolated from the cached table; values beyond the grid take the edge value
+    (efficiency 0 or 1 for very faint or very bright transients).
+    """
+    log_q, log_tau_obs = reduced_coordinates(L_0, tau, z, flux_limit)
+    return lookup_tables.multilinear_interp(efficiency_table(), (log_q_axis, log_tau_obs_axis),
+                                            (log_q, log_tau_obs))
+
+def population_detectable_fraction(n_draws=1_000_000, eta=1e-3, z_max=1.0,
+                                   flux_limit=ep_eventrate_of_fxts.flux_limit, seed=None,
+                                   profile='isotropic', theta_c=viewing_geometry.theta_c):
+    """
+    Mean detection efficiency of a magnetar population: log-uniform B_p in 10^14-10^16 G,
+    uniform P_i in 1-2 ms, X-ray efficiency eta and sources uniform in comoving volume to z_max.
+    With a beamed profile each source is seen at a random viewing angle (see viewing_geometry).
+    """
+    rng = np.random.default_rng(seed)
+    B_p = 10**rng.uniform(14, 16, n_draws)
+    P_i = rng.uniform(1e-3, 2e-3, n_draws)
+    z_grid, D_C = luminositydistance.comoving_distance_table()
+    D_C_max = np.interp(z_max, z_grid, D_C)
+    z = np.interp(D_C_max * rng.random(n_draws)**(1 / 3), D_C, z_grid)
+    L_0 = eta * L_0_EM(B_p, P_i)
+    if profile != 'isotropic':
+        L_0 = viewing_geometry.observed_luminosity(L_0, viewing_geometry.sample_viewing_angles(n_draws, rng),
+                                                   profile, theta_c)
+    return float(np.mean(detection_efficiency(L_0, tau_EM(B_p, P_i), z, flux_limit)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and check the FXT detection-efficiency table.')
+    parser.add_argument('--check', type=int, default=20000,
+                        help='random points compared against direct simulation')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    efficiency_table()
+    print(f"Table {len(log_q_axis)} x {len(log_tau_obs_axis)} ready in {time.perf_counter() - start:.1f} s")
+
+    rng = np.random.default_rng(args.seed)
+    log_q = rng.uniform(log_q_axis[0], log_q_axis[-1], args.check)
+    log_tau_obs = rng.uniform(log_tau_obs_axis[0], log_tau_obs_axis[-1], args.check)
+    start = time.perf_counter()
+    direct = simulate_efficiency(log_q, log_tau_obs)
+    t_direct = time.perf_counter() - start
+    start = time.perf_counter()
+    table = lookup_tables.multilinear_interp(efficiency_table(), (log_q_axis, log_tau_obs_axis),
+                                             (log_q, log_tau_obs))
+    t_table = time.perf_counter() - start
+    print(f"Direct simulation: {t_direct:.3f} s, table lookup: {t_table:.4f} s "
+          f"({t_direct / t_table:.0f}x), max |difference| {np.max(np.abs(direct - table)):.3f}, "
+          f"mean |difference| {np.mean(np.abs(direct - table)):.4f}")
+    print(f"Population detectable fraction (eta = 1e-3, z < 1): {population_detectable_fraction(seed=args.seed):.3e}")
+    beamed = population_detectable_fraction(seed=args.seed, profile='gaussian', theta_c=viewing_geometry.theta_c)
+    print(f"  with a Gaussian wind profile (theta_c = {viewing_geometry.theta_c} rad): {beamed:.3e}")
+
+if __name__ == "__main__":
+    main()
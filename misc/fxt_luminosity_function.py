@@ -0,0 +1,286 @@
+"""
+1/V_max luminosity function of fast X-ray transients over (L, z) bins.
+
+Each detected source i, with peak flux F_i at redshift z_i, gets the
+luminosity L_i from peakflux_to_peaklum (optionally k-corrected and
+corrected for absorption) and the largest redshift z_max,i at which it
+would still be above the survey flux limit. Within its redshift bin
+[z_lo, z_hi] it could have been found in the time-dilated volume
+
+    V_max,i = (Ω / 4π) ∫_{z_lo}^{min(z_hi, z_max,i)} dV_c/dz / (1 + z) dz
+
+and it contributes 1 / (V_max,i T) to the rate density (Gpc^-3 yr^-1) of
+its bin. The luminosity function is that sum per dex of L. With a photon
+index the same k-correction (and absorption) enters z_max: it is the
+redshift where the predicted flux L / (4π D_L^2 K(z)) meets the limit.
+Sources whose V_max still vanishes (at the flux limit on a bin edge) are
+dropped with the rest.
+
+Bootstrap errors resample the catalog: each resample is a row of source
+multiplicities, drawn in blocks, and every bin total or cumulative rate
+above a threshold is one reduction over that block. Cumulative rate
+densities above any number of thresholds come from one sorted cumulative
+sum per redshift bin.
+"""
+import argparse
+import csv
+import time
+from functools import lru_cache
+
+import numpy as np
+
+import instrumentation as instr
+import kcorrection
+import luminositydistance
+import output_sink
+import result_store
+from ep_eventrate_of_fxts import flux_limit, Omega, T
+from peakflux_to_peaklum import calculate_luminosity, cosmo, cm_per_mpc
+
+# Defaults
+log_L_edges = np.arange(44.0, 50.01, 0.5)  # log10 erg/s
+z_edges = np.array([0.0, 0.5, 1.0, 2.0, 4.0])
+thresholds = np.array([1e44, 1e45, 1e46, 1e47])  # erg/s, as in ep_eventrate_of_fxts
+n_resamples = 2000
+resample_block = 128  # Bootstrap resamples per vectorized block
+z_grid_max = 10.0
+z_grid_points = 10001
+gpc3_per_mpc3 = 1e-9
+bisection_steps = 50  # Halvings of the redshift bracket when solving for a k-corrected z_max
+
+@lru_cache(maxsize=None)
+def volume_table(z_max=z_grid_max, n_z=z_grid_points):
+    """
+    (z, D_L in Mpc, cumulative time-dilated all-sky volume ∫ dV_c/(1+z) in Gpc^3) on a uniform grid.
+
+    The distances use the closed-form flat ΛCDM of peakflux_to_peaklum's fast path.
+    """
+    z = np.linspace(0, z_max, n_z)
+    D_C = luminositydistance.comoving_distance_flat(z, 1 - cosmo.Ode0, cosmo.H0.value)
+    integrand = 4 * np.pi * D_C**2 / (1 + z)
+    V = np.concatenate([[0.0], np.cumsum((integrand[1:] + integrand[:-1]) / 2 * np.diff(D_C))]) * gpc3_per_mpc3
+    return z, (1 + z) * D_C, V
+
+instr.watch_cache('volume_table', volume_table)
+
+def predicted_flux(luminosity, z, gamma=None, log_nh=None):
+    """Peak flux (erg/s/cm^2) of a source of luminosity L at redshift z; the inverse of calculate_luminosity."""
+    z_grid, D_L, _ = volume_table()
+    flux = np.asarray(luminosity) / (4 * np.pi * (np.interp(z, z_grid, D_L) * cm_per_mpc)**2)
+    if gamma is not None:
+        flux = flux / kcorrection.band_correction(gamma, z, log_nh=log_nh)
+    return flux
+
+def z_max_for(luminosity, flux_limit=flux_limit, gamma=None, log_nh=None, z_min=0.0):
+    """
+    Redshift at which a source of luminosity L (erg/s) falls to the flux limit; capped at the grid end.
+
+    With a photon index gamma (and log_nh) the flux includes the k-correction, and z_max is found by
+    bisection above z_min, a redshift where the source is known to be above the limit (its own z).
+    """
+    z, D_L, _ = volume_table()
+    if gamma is None:
+        D_L_max = np.sqrt(np.asarray(luminosity) / (4 * np.pi * flux_limit)) / cm_per_mpc
+        return np.interp(D_L_max, D_L, z)
+    luminosity, gamma, z_min = np.broadcast_arrays(np.asarray(luminosity, dtype=float),
+                                                   np.asarray(gamma, dtype=float), np.asarray(z_min, dtype=float))
+    log_nh = None if log_nh is None else np.broadcast_to(log_nh, luminosity.shape)
+    low, high = z_min.copy(), np.full(luminosity.shape, z[-1])
+    # Sources still above the limit at the grid end are capped there
+    capped = predicted_flux(luminosity, high, gamma, log_nh) >= flux_limit
+    for _ in range(bisection_steps):
+        middle = (low + high) / 2
+        above = predicted_flux(luminosity, middle, gamma, log_nh) >= flux_limit
+        low = np.where(above, middle, low)
+        high = np.where(above, high, middle)
+    return np.where(capped, z[-1], low)
+
+def time_dilated_volume(z):
+    """Cumulative all-sky ∫ dV_c/(1+z) (Gpc^3) to redshift z."""
+    z_grid, _, V = volume_table()
+    return np.interp(z, z_grid, V)
+
+class VmaxEstimator:
+    """
+    Binned 1/V_max estimator for a flux-limited catalog of peak fluxes and redshifts.
+
+    Sources below the flux limit or outside the (L, z) grid are dropped. Rates are in
+    Gpc^-3 yr^-1; the luminosity function is per dex of L.
+    """
+
+    def __init__(self, flux, z, log_L_edges=log_L_edges, z_edges=z_edges, flux_limit=flux_limit,
+                 Omega=Omega, T=T, gamma=None, log_nh=None):
+        flux = np.asarray(flux, dtype=float)
+        z = np.asarray(z, dtype=float)
+        self.log_L_edges = np.asarray(log_L_edges, dtype=float)
+        self.z_edges = np.asarray(z_edges, dtype=float)
+        self.shape = (self.log_L_edges.size - 1, self.z_edges.size - 1)
+        with instr.stage('vmax'):
+            L = calculate_luminosity(flux, z, fast=True, gamma=gamma, log_nh=log_nh)
+            i_L = np.searchsorted(self.log_L_edges, np.log10(L), side='right') - 1
+            i_z = np.searchsorted(self.z_edges, z, side='right') - 1
+            keep = ((flux >= flux_limit) & (i_L >= 0) & (i_L < self.shape[0])
+                    & (i_z >= 0) & (i_z < self.shape[1]))
+            gamma, log_nh = (None if value is None else np.broadcast_to(value, flux.shape)[keep]
+                             for value in (gamma, log_nh))
+            L, z, i_L, i_z = L[keep], z[keep], i_L[keep], i_z[keep]
+            z_lo, z_hi = self.z_edges[i_z], self.z_edges[i_z + 1]
+            # Never below the source's own redshift, where it was seen above the limit
+            z_top = np.clip(np.maximum(z_max_for(L, flux_limit, gamma, log_nh, z_min=z), z), z_lo, z_hi)
+            V_max = (Omega / (4 * np.pi)) * (time_dilated_volume(z_top) - time_dilated_volume(z_lo))
+            found = V_max > 0
+            self.n_dropped = flux.size - int(np.count_nonzero(found))
+            self.L, self.z, i_L, i_z, self.V_max = L[found], z[found], i_L[found], i_z[found], V_max[found]
+            self.weights = 1 / (self.V_max * T)
+        self.bin = i_L * self.shape[1] + i_z
+        self.i_z = i_z
+        self.n = self.L.size
+        instr.count('lf_sources', self.n)
+        # Sources ordered by bin, for per-bin sums by reduceat
+        self._bin_order = np.argsort(self.bin, kind='stable')
+        self._bin_ids, self._bin_starts = np.unique(self.bin[self._bin_order], return_index=True)
+        # Sources ordered by decreasing L within each redshift bin, for cumulative rates
+        self._z_orders = [np.flatnonzero(self.i_z == k)[np.argsort(-self.L[self.i_z == k], kind='stable')]
+                          for k in range(self.shape[1])]
+
+    def _bin_totals(self, weights):
+        """Sum of per-source weights (..., n) in each (L, z) bin -> (..., n_L, n_z)."""
+        totals = np.zeros(weights.shape[:-1] + (self.shape[0] * self.shape[1],))
+        if self.n:
+            totals[..., self._bin_ids] = np.add.reduceat(weights[..., self._bin_order], self._bin_starts, axis=-1)
+        return totals.reshape(weights.shape[:-1] + self.shape)
+
+    def _cumulative(self, weights, thresholds):
+        """Sum of weights (..., n) of sources with L >= each threshold, per redshift bin -> (..., n_thresholds, n_z)."""
+        thresholds = np.atleast_1d(np.asarray(thresholds, dtype=float))
+        result = np.zeros(weights.shape[:-1] + (thresholds.size, self.shape[1]))
+        for k, order in enumerate(self._z_orders):
+            if order.size == 0:
+                continue
+            cumulative = np.cumsum(weights[..., order], axis=-1)
+            # Number of sources with L >= threshold among those sorted by decreasing L
+            count = np.searchsorted(-self.L[order], -thresholds, side='right')
+            selected = count > 0
+            result[..., selected, k] = cumulative[..., count[selected] - 1]
+        return result
+
+    def _multiplicities(self, n_resamples, seed):
+        """Blocks of bootstrap multiplicities, shape (block, n): how often each source is drawn."""
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_resamples, resample_block):
+            block = min(resample_block, n_resamples - start)
+            draws = rng.integers(0, self.n, (block, self.n)) + self.n * np.arange(block)[:, None]
+            yield np.bincount(draws.ravel(), minlength=block * self.n).reshape(block, self.n)
+
+    def luminosity_function(self):
+        """Rate density per dex (Gpc^-3 yr^-1 dex^-1) and source counts, each of shape (n_L, n_z)."""
+        d_log_L = np.diff(self.log_L_edges)[:, None]
+        counts = self._bin_totals(np.ones(self.n))
+        return self._bin_totals(self.weights) / d_log_L, counts
+
+    def rate_density_above(self, thresholds=thresholds):
+        """Rate density (Gpc^-3 yr^-1) of sources brighter than each threshold (erg/s), shape (n_thresholds, n_z)."""
+        return self._cumulative(self.weights, thresholds)
+
+    def bootstrap(self, n_resamples=n_resamples, thresholds=thresholds, seed=None):
+        """
+        Bootstrap samples of the luminosity function and of the cumulative rate densities.
+
+        Returns:
+        tuple: (luminosity function samples (n_resamples, n_L, n_z),
+                cumulative rate density samples (n_resamples, n_thresholds, n_z))
+        """
+        d_log_L = np.diff(self.log_L_edges)[:, None]
+        lf, cumulative = [], []
+        with instr.stage('bootstrap'):
+            for multiplicity in self._multiplicities(n_resamples, seed):
+                weighted = multiplicity * self.weights
+                lf.append(self._bin_totals(weighted) / d_log_L)
+                cumulative.append(self._cumulative(weighted, thresholds))
+        instr.count('bootstrap_resamples', n_resamples)
+        return np.concatenate(lf), np.concatenate(cumulative)
+
+def synthetic_catalog(n_sources=10000, log_L_min=46.0, log_L_max=50.0, slope=-1.0, z_max=4.0, seed=None):
+    """
+    Detected sources of a power-law luminosity function dN/dlogL ∝ L^slope, uniform in time-dilated volume.
+
+    Sources are drawn directly from the detected population: log L with weight L^slope times the
+    volume in which it is above the flux limit, then z uniformly within that volume.
+
+    Returns:
+    tuple: (peak fluxes in erg/s/cm^2, redshifts)
+    """
+    rng = np.random.default_rng(seed)
+    z_grid, D_L, V = volume_table()
+    log_L = np.linspace(log_L_min, log_L_max, 4097)
+    weight = 10**(slope * log_L) * time_dilated_volume(np.minimum(z_max_for(10**log_L), z_max))
+    cdf = np.concatenate([[0.0], np.cumsum((weight[1:] + weight[:-1]) / 2)])
+    L = 10**np.interp(rng.random(n_sources) * cdf[-1], cdf, log_L)
+    V_detectable = time_dilated_volume(np.minimum(z_max_for(L), z_max))
+    z = np.interp(rng.random(n_sources) * V_detectable, V, z_grid)
+    return L / (4 * np.pi * (np.interp(z, z_grid, D_L) * cm_per_mpc)**2), z
+
+def read_catalog(path):
+    """Peak flux, redshift and, when present, photon index columns of a CSV catalog."""
+    with open(path, 'r', newline='') as f:
+        rows = list(csv.DictReader(f))
+    flux = np.array([float(row['flux']) for row in rows])
+    z = np.array([float(row['z']) for row in rows])
+    gamma = np.array([float(row['gamma']) for row in rows]) if rows and 'gamma' in rows[0] else None
+    return flux, z, gamma
+
+def main():
+    parser = argparse.ArgumentParser(description='1/V_max luminosity function of fast X-ray transients.')
+    parser.add_argument('--catalog', help="CSV with 'flux' (erg/s/cm^2), 'z' and optional 'gamma' columns; "
+                                          "a synthetic catalog is used when omitted")
+    parser.add_argument('--synthetic', type=int, default=10000, help='size of the synthetic catalog')
+    parser.add_argument('--resamples', type=int, default=n_resamples, help='bootstrap resamples')
+    parser.add_argument('--seed', type=int, default=None)
+    output_sink.add_arguments(parser)
+    args = parser.parse_args()
+    sink = output_sink.from_args(args)
+    out = output_sink.text_stream(sink)
+
+    if args.catalog:
+        flux, z, gamma = read_catalog(args.catalog)
+    else:
+        flux, z = synthetic_catalog(args.synthetic, seed=args.seed)
+        gamma = None
+
+    start = time.perf_counter()
+    estimator = VmaxEstimator(flux, z, gamma=gamma)
+    lf, counts = estimator.luminosity_function()
+    above = estimator.rate_density_above(thresholds)
+    lf_samples, above_samples = estimator.bootstrap(args.resamples, thresholds, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    lf_low, lf_high = np.percentile(lf_samples, [16, 84], axis=0)
+    above_low, above_high = np.percentile(above_samples, [16, 84], axis=0)
+    print(f"{estimator.n} sources ({estimator.n_dropped} dropped), {args.resamples} bootstrap resamples "
+          f"in {elapsed:.2f} s", file=out)
+
+    for k in range(estimator.shape[1]):
+        z_label = f"{estimator.z_edges[k]:g} <= z < {estimator.z_edges[k + 1]:g}"
+        print(f"\n{z_label}", file=out)
+        for L, r, low, high in zip(thresholds, above[:, k], above_low[:, k], above_high[:, k]):
+            print(f"  rate density above {L:.0e} erg/s: {r:.3e} (+{high - r:.2e} / -{r - low:.2e}) Gpc^-3 yr^-1",
+                  file=out)
+        if sink is not None:
+            sink.write_columns({'z_low': estimator.z_edges[k], 'z_high': estimator.z_edges[k + 1],
+                                'log_L_low': estimator.log_L_edges[:-1], 'log_L_high': estimator.log_L_edges[1:],
+                                'count': counts[:, k], 'phi_gpc3_yr_dex': lf[:, k],
+                                'phi_p16': lf_low[:, k], 'phi_p84': lf_high[:, k]})
+    if sink is not None:
+        sink.close()
+
+    store = result_store.open_default()
+    if store is not None:
+        attrs = {'dims': ['log_L_bin', 'z_bin'], 'log_L_edges': estimator.log_L_edges, 'z_edges': estimator.z_edges,
+                 'n_sources': estimator.n, 'n_resamples': args.resamples, 'flux_limit': flux_limit}
+        store.write('fxt_luminosity_function/phi', lf, units='Gpc^-3 yr^-1 dex^-1', attrs=attrs)
+        store.write('fxt_luminosity_function/phi_interval', np.stack([lf_low, lf_high]), units='Gpc^-3 yr^-1 dex^-1',
+                    attrs=dict(attrs, dims=['percentile', 'log_L_bin', 'z_bin'], percentile=[16, 84]))
+        store.write('fxt_luminosity_function/rate_density_above', above, units='Gpc^-3 yr^-1',
+                    attrs={'dims': ['threshold', 'z_bin'], 'threshold': thresholds, 'z_edges': estimator.z_edges})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Incremental recomputation through a persisted dependency graph.
+
+Each node is a named function applied to inputs, which are plain values or
+other nodes. A node's key hashes its name, version and inputs (upstream nodes
+enter through their own keys), so editing one parameter set or adding one
+event rate changes the keys of the affected nodes only. Anything a node's
+function reads besides its inputs is not part of the key, so such values
+must be passed as inputs. Values are kept in a JSON store in the
+lookup_tables cache directory and reused on later runs; everything else is
+recomputed lazily on first access. Saving drops stored values of nodes the
+current graph no longer has.
+"""
+import json
+import os
+
+import instrumentation as instr
+import lookup_tables
+
+class Node:
+    """A value computed by function(*inputs), identified by a hash of its inputs."""
+
+    def __init__(self, graph, name, function, inputs, version):
+        self.graph = graph
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.key = f"{name}:" + lookup_tables.inputs_hash({
+            'inputs': [value.key if isinstance(value, Node) else value for value in inputs],
+            'version': version,
+        })
+
+    @property
+    def value(self):
+        return self.graph.evaluate(self)
+
+class Graph:
+    """Dependency graph whose node values persist in a JSON store between runs."""
+
+    def __init__(self, name, persist=True):
+        self.path = os.path.join(lookup_tables.cache_dir(), f'graph_{name}.json') if persist else None
+        self.values = {}
+        self.keys = set()  # Keys of the nodes added in this run
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.values = json.load(f)
+        self.computed = 0
+        self.reused = 0
+        self.dirty = False
+
+    def add(self, name, function, *inputs, version=1):
+        """New node for function(*inputs); bump version when the function itself changes."""
+        node = Node(self, name, function, inputs, version)
+        self.keys.add(node.key)
+        return node
+
+    def evaluate(self, node):
+        if node.key in self.values:
+            self.reused += 1
+            instr.count('graph_nodes_reused')
+            return self.values[node.key]
+        arguments = [value.value if isinstance(value, Node) else value for value in node.inputs]
+        with instr.stage(f'graph:{node.name}'):
+            value = node.function(*arguments)
+        self.values[node.key] = value
+        self.computed += 1
+        self.dirty = True
+        instr.count('graph_nodes_computed')
+        return value
+
+    def save(self):
+        """Write the store atomically if any node was computed or a stored node is no longer in the graph."""
+        unreached = [key for key in self.values if key not in self.keys]
+        for key in unreached:
+            del self.values[key]
+        instr.count('graph_nodes_pruned', len(unreached))
+        if self.path is None or not (self.dirty or unreached):
+            return
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.values, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
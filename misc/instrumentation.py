@@ -0,0 +1,121 @@
+"""
+Lightweight stage timers and counters for the analysis scripts.
+
+Profiling is off unless the MSEC_PROFILE environment variable is set to a
+non-empty value other than '0', or a script calls enable() (e.g. from a
+--profile flag). When off, stage() returns a shared no-op context manager
+and count() returns immediately, so the calls can stay in hot paths.
+
+At exit an enabled run writes, into MSEC_PROFILE_DIR (default: the working
+directory):
+    profile_<script>_<pid>.json    stage totals, counters and cache statistics
+    profile_<script>_<pid>.folded  collapsed stacks (self time in microseconds)
+                                   for flamegraph.pl / speedscope
+"""
+import atexit
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import scipy.integrate as integrate
+
+enabled = False
+counters = defaultdict(int)
+stage_totals = defaultdict(lambda: [0, 0.0])  # stage path -> [calls, total seconds]
+watched_caches = {}
+local = threading.local()  # per-thread stack of open stages
+run_start = time.perf_counter()
+null_stage = contextlib.nullcontext()
+
+def enable(output_dir=None):
+    """Turn profiling on for the rest of the run and write the trace at exit."""
+    global enabled, run_start
+    if enabled:
+        return
+    enabled = True
+    run_start = time.perf_counter()
+    if output_dir is not None:
+        os.environ['MSEC_PROFILE_DIR'] = output_dir
+    atexit.register(write_trace)
+
+@contextlib.contextmanager
+def _timed_stage(name):
+    stack = local.__dict__.setdefault('stack', [])
+    stack.append(name)
+    path = tuple(stack)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        totals = stage_totals[path]
+        totals[0] += 1
+        totals[1] += time.perf_counter() - start
+        stack.pop()
+
+def stage(name):
+    """Context manager timing a named stage; stages nest into a call path."""
+    if not enabled:
+        return null_stage
+    return _timed_stage(name)
+
+def count(name, n=1):
+    """Add n to a named counter (e.g. grid points evaluated)."""
+    if enabled:
+        counters[name] += n
+
+def watch_cache(name, cached_function):
+    """Report hits/misses of a functools.lru_cache-wrapped function in the trace."""
+    watched_caches[name] = cached_function
+
+def quad(func, a, b, **kwargs):
+    """scipy.integrate.quad, counted and timed as an 'integration' stage when profiling."""
+    if not enabled:
+        return integrate.quad(func, a, b, **kwargs)
+    counters['quad_calls'] += 1
+    with _timed_stage('integration'):
+        return integrate.quad(func, a, b, **kwargs)
+
+def summary():
+    """Stage totals (with self time), counters and cache statistics collected so far."""
+    stages = []
+    for path, (calls, total) in stage_totals.items():
+        children = sum(t for p, (_, t) in stage_totals.items()
+                       if len(p) == len(path) + 1 and p[:-1] == path)
+        stages.append({'stage': ';'.join(path), 'calls': calls,
+                       'total_s': total, 'self_s': max(total - children, 0.0)})
+    stages.sort(key=lambda s: s['total_s'], reverse=True)
+    caches = {}
+    for name, function in watched_caches.items():
+        info = function.cache_info()
+        caches[name] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
+    return {
+        'script': os.path.basename(sys.argv[0]) or 'interactive',
+        'pid': os.getpid(),
+        'wall_s': time.perf_counter() - run_start,
+        'stages': stages,
+        'counters': dict(counters),
+        'caches': caches,
+    }
+
+def write_trace():
+    """Write the JSON trace and the collapsed-stack profile for this run."""
+    trace = summary()
+    output_dir = os.environ.get('MSEC_PROFILE_DIR', '.')
+    base = os.path.join(output_dir, f"profile_{os.path.splitext(trace['script'])[0]}_{trace['pid']}")
+    with open(base + '.json', 'w') as f:
+        json.dump(trace, f, indent=2)
+    # Collapsed stacks rooted at the script name; time outside any stage is the root's self time
+    root = os.path.splitext(trace['script'])[0]
+    top_level = sum(s['total_s'] for s in trace['stages'] if ';' not in s['stage'])
+    with open(base + '.folded', 'w') as f:
+        f.write(f"{root} {max(int((trace['wall_s'] - top_level) * 1e6), 0)}\n")
+        for s in trace['stages']:
+            f.write(f"{root};{s['stage']} {int(s['self_s'] * 1e6)}\n")
+    print(f"Profile written to {base}.json and {base}.folded", file=sys.stderr)
+
+if os.environ.get('MSEC_PROFILE', '') not in ('', '0'):
+    enable()
@@ -0,0 +1,143 @@
+"""
+Band-to-band k-corrections and absorption for absorbed power-law spectra.
+
+An observed flux in one band becomes a rest-frame luminosity in another as
+
+    L_rest = 4π D_L^2 F_obs * K(Γ, z) / T(Γ, N_H, z)
+
+K is the power-law k-correction (closed form). T is the fraction of the
+unabsorbed flux transmitted in the observed band through an intrinsic
+absorber of column N_H at the source redshift, with Morrison & McCammon
+(1983) cross sections. T needs a spectral integral, so its effective optical
+depth is tabulated once per band over (Γ, log N_H, z), cached with
+lookup_tables and interpolated.
+"""
+from functools import lru_cache
+
+import numpy as np
+from scipy.special import logsumexp
+
+import instrumentation as instr
+import lookup_tables
+
+# Energy bands in keV
+bands = {
+    'ep_wxt': (0.5, 4.0),  # Einstein Probe Wide-field X-ray Telescope
+    'ep_fxt': (0.3, 10.0),  # Einstein Probe Follow-up X-ray Telescope
+    '0.3-10keV': (0.3, 10.0),
+    '2-10keV': (2.0, 10.0),
+    '1-10000keV': (1.0, 1e4),  # Bolometric reference band for high-energy transients
+}
+
+# Morrison & McCammon (1983): σ(E) = (c0 + c1 E + c2 E^2) E^-3 1e-24 cm^2 per H atom, E in keV
+mm83_edges = np.array([0.030, 0.100, 0.284, 0.400, 0.532, 0.707, 0.867, 1.303, 1.840, 2.471, 3.210,
+                       4.038, 7.111, 8.331, 10.00])
+mm83_coefficients = np.array([
+    (17.3, 608.1, -2150.0),
+    (34.6, 267.9, -476.1),
+    (78.1, 18.8, 4.3),
+    (71.4, 66.8, -51.4),
+    (95.5, 145.8, -61.1),
+    (308.9, -380.6, 294.0),
+    (120.6, 169.3, -47.7),
+    (141.3, 146.8, -31.5),
+    (202.7, 104.7, -17.0),
+    (342.7, 18.7, 0.0),
+    (352.2, 18.7, 0.0),
+    (433.9, -2.4, 0.75),
+    (629.0, 30.9, 0.0),
+    (701.2, 25.2, 0.0),
+])
+
+# Absorption table grid
+gamma_axis = np.linspace(0.5, 3.5, 61)
+log_nh_axis = np.linspace(19.0, 24.0, 51)  # log10 N_H in cm^-2
+z_axis = np.linspace(0.0, 10.0, 101)
+energy_points = 512  # Log-spaced energies across the observed band
+table_version = 1
+
+def photoelectric_cross_section(E):
+    """Cross section per H atom (cm^2) at energies E in keV; the last segment is extended above 10 keV."""
+    E = np.asarray(E, dtype=float)
+    segment = np.clip(np.searchsorted(mm83_edges, E, side='right') - 1, 0, len(mm83_coefficients) - 1)
+    c0, c1, c2 = np.moveaxis(mm83_coefficients[segment], -1, 0)
+    return (c0 + c1 * E + c2 * E**2) * E**-3.0 * 1e-24
+
+def power_law_band_integral(gamma, E1, E2):
+    """∫ E^(1-Γ) dE from E1 to E2 (energy flux of N(E) ∝ E^-Γ), continuous through Γ = 2."""
+    s = 2 - np.asarray(gamma, dtype=float)
+    log_ratio = np.log(E2 / E1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        value = E1**s * np.expm1(s * log_ratio) / s
+    return np.where(s == 0, log_ratio, value)
+
+def power_law_k_correction(gamma, z, obs_band='ep_wxt', rest_band='0.3-10keV'):
+    """K(Γ, z): rest-frame rest_band luminosity over 4π D_L^2 times the unabsorbed obs_band flux."""
+    o1, o2 = bands[obs_band]
+    e1, e2 = bands[rest_band]
+    z = np.asarray(z, dtype=float)
+    return power_law_band_integral(gamma, e1, e2) / power_law_band_integral(gamma, o1 * (1 + z), o2 * (1 + z))
+
+def effective_optical_depth(gamma, log_nh, z, band='ep_wxt'):
+    """
+    τ_eff = -ln T(Γ, N_H, z) by direct integration over the observed band (vectorized, no table).
+
+    τ_eff is smooth in (Γ, log N_H, z) where T itself spans hundreds of decades, so it is what
+    the table stores. Light absorption goes through expm1, heavy absorption through logsumexp.
+    """
+    gamma, log_nh, z = (a[..., None] for a in np.broadcast_arrays(np.asarray(gamma, dtype=float),
+                                                                  np.asarray(log_nh, dtype=float),
+                                                                  np.asarray(z, dtype=float)))
+    E = np.geomspace(*bands[band], energy_points)
+    # Trapezoid weights in ln E times the power-law energy flux per ln E
+    d_ln_E = np.full(energy_points, np.log(E[1] / E[0]))
+    d_ln_E[[0, -1]] /= 2
+    weight = E**(2 - gamma) * d_ln_E
+    norm = weight.sum(axis=-1)
+    # Optical depth of the absorber at the source, seen at observed energies
+    tau = 10**log_nh * photoelectric_cross_section(E * (1 + z))
+    absorbed = np.sum(weight * -np.expm1(-tau), axis=-1) / norm
+    log_T = logsumexp(np.log(weight) - tau, axis=-1) - np.log(norm)
+    return np.where(absorbed < 0.5, -np.log1p(-np.minimum(absorbed, 0.5)), -log_T)
+
+def transmitted_fraction(gamma, log_nh, z, band='ep_wxt'):
+    """T(Γ, N_H, z) by direct integration, for checks against the table."""
+    return np.exp(-effective_optical_depth(gamma, log_nh, z, band))
+
+@lru_cache(maxsize=None)
+def absorption_table(band='ep_wxt'):
+    """log10 τ_eff on the (Γ, log N_H, z) grid for one observed band, memory-mapped from the cache."""
+    def build():
+        table = np.empty((gamma_axis.size, log_nh_axis.size, z_axis.size))
+        for i, gamma in enumerate(gamma_axis):
+            table[i] = np.log10(effective_optical_depth(gamma, log_nh_axis[:, None], z_axis[None, :], band))
+        return table
+    inputs = {'band': bands[band], 'gamma': gamma_axis, 'log_nh': log_nh_axis, 'z': z_axis,
+              'energy_points': energy_points, 'mm83': mm83_coefficients, 'version': table_version}
+    return lookup_tables.cached_table(f'absorption_{band}', inputs, build)
+
+instr.watch_cache('absorption_table', absorption_table)
+
+def absorption_correction(gamma, log_nh, z, band='ep_wxt'):
+    """
+    T(Γ, N_H, z) interpolated from the cached table; inputs beyond the grid are clamped to it.
+
+    Against direct integration the median relative error is a few 1e-6 and the largest ~1% for
+    T > 0.5 and ~3% for T > 1e-3, where absorption edges cross the band edges.
+    """
+    log_tau = lookup_tables.multilinear_interp(absorption_table(band), (gamma_axis, log_nh_axis, z_axis),
+                                               (gamma, log_nh, z))
+    return np.exp(-10**log_tau)
+
+def band_correction(gamma, z, obs_band='ep_wxt', rest_band='0.3-10keV', log_nh=None):
+    """
+    Factor converting 4π D_L^2 F_obs into the rest-frame rest_band luminosity.
+
+    With log_nh the observed flux is taken as absorbed (the intrinsic column is removed);
+    without it the flux is taken as already unabsorbed.
+    """
+    correction = power_law_k_correction(gamma, z, obs_band, rest_band)
+    if log_nh is not None:
+        correction = correction / absorption_correction(gamma, log_nh, z, obs_band)
+    instr.count('k_corrections', np.size(correction))
+    return correction
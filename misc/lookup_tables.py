@@ -0,0 +1,91 @@
+"""
+On-disk cache for precomputed lookup tables.
+
+A table is stored once as an .npy file named after a hash of everything it was
+built from, and is opened memory-mapped afterwards, so repeated runs (and
+parallel workers) share the same pages instead of rebuilding it. Changing any
+input gives a new hash and therefore a new file. The cache directory is
+MSEC_CACHE_DIR, by default ~/.cache/msec_magnetars.
+"""
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+
+import instrumentation as instr
+
+def cache_dir():
+    path = os.environ.get('MSEC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'msec_magnetars'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def inputs_hash(inputs):
+    """Short hash of a JSON-serializable dict; numpy arrays are hashed by dtype, shape and bytes."""
+    digest = hashlib.sha1()
+    for key in sorted(inputs):
+        value = inputs[key]
+        digest.update(key.encode())
+        if isinstance(value, np.ndarray):
+            digest.update(str((value.dtype.str, value.shape)).encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(json.dumps(value, sort_keys=True, default=float).encode())
+    return digest.hexdigest()[:16]
+
+def cached_table(name, inputs, builder):
+    """
+    Memory-mapped table for `inputs`, built with builder() and written on the first request.
+
+    Parameters:
+    name (str): Table family, used as the file name prefix
+    inputs (dict): Everything the table depends on (grid axes, physical parameters, version)
+    builder (callable): Returns the table as an ndarray
+
+    Returns:
+    ndarray: Read-only memory map of the table
+    """
+    path = os.path.join(cache_dir(), f'{name}_{inputs_hash(inputs)}.npy')
+    if os.path.exists(path):
+        instr.count('table_cache_hits')
+    else:
+        instr.count('table_cache_misses')
+        with instr.stage(f'build_table:{name}'):
+            table = np.asarray(builder())
+        # Write to a private file first so concurrent readers never see a partial table
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r')
+
+def multilinear_interp(table, axes, points):
+    """
+    Multilinear interpolation of a table on uniform axes, vectorized over query points.
+
+    Parameters:
+    table (ndarray): Values on the grid, one dimension per axis
+    axes (sequence of ndarray): Uniformly spaced, increasing grid coordinates of each dimension
+    points (sequence of array-like): Query coordinates per dimension, broadcast together;
+                                     queries outside the grid are clamped to its edges
+
+    Returns:
+    ndarray: Interpolated values with the broadcast shape of the points
+    """
+    points = np.broadcast_arrays(*(np.asarray(p, dtype=float) for p in points))
+    indices, weights = [], []
+    for axis, p in zip(axes, points):
+        position = np.clip((p - axis[0]) / (axis[1] - axis[0]), 0, len(axis) - 1)
+        index = np.minimum(position.astype(np.intp), len(axis) - 2)
+        indices.append(index)
+        weights.append(position - index)
+    result = np.zeros(points[0].shape)
+    # Sum over the 2^d corners of each cell
+    for corner in itertools.product((0, 1), repeat=len(axes)):
+        weight = 1.0
+        for upper, w in zip(corner, weights):
+            weight = weight * (w if upper else 1 - w)
+        result += weight * table[tuple(index + upper for index, upper in zip(indices, corner))]
+    instr.count('table_interpolations', result.size)
+    return result
@@ -1,11 +1,26 @@
+from functools import lru_cache
+
 import numpy as np
-from scipy.integrate import quad
+from scipy.integrate import cumulative_trapezoid
+from scipy.special import hyp2f1
+
+import instrumentation as instr
+import integration
 
 # Constants
 H0 = 70  # Hubble constant in km/s/Mpc
 c = 3e5  # Speed of light in km/s
 Omega_m = 0.3  # Matter density parameter
 Omega_Lambda = 0.7  # Dark energy density parameter
+hubble_time_gyr = 977.8 / H0  # 1/H0 in Gyr
+
+# Below this redshift the closed form loses digits to cancellation; use Gauss-Legendre on [0, z]
+small_z_switch = 0.1
+gauss_legendre_nodes, gauss_legendre_weights = np.polynomial.legendre.leggauss(8)
+
+# Redshift grid for the tabulated comoving distance
+z_table_max = 20.0
+z_table_points = 8001
 
 # Hubble parameter as a function of redshift
 def H(z):
@@ -17,10 +32,97 @@ def integrand(z):
 
 # Function to calculate luminosity distance
 def calculate_luminosity_distance(z):
-    D_M, _ = quad(integrand, 0, z)
+    D_M = integration.integrate(integrand, 0, z).value
     D_L = (1 + z) * D_M
     return D_L
 
+@lru_cache(maxsize=None)
+def comoving_distance_table(z_max=z_table_max, n_z=z_table_points):
+    """Comoving distance (Mpc) on a uniform redshift grid, built once per grid."""
+    with instr.stage('cosmology_table'):
+        z_grid = np.linspace(0, z_max, n_z)
+        D_C = cumulative_trapezoid(integrand(z_grid), z_grid, initial=0)
+    z_grid.setflags(write=False)
+    D_C.setflags(write=False)
+    return z_grid, D_C
+
+instr.watch_cache('comoving_distance_table', comoving_distance_table)
+
+def comoving_distance(z):
+    """Vectorized comoving distance (Mpc) interpolated from the cached table."""
+    z = np.asarray(z, dtype=float)
+    z_grid, D_C = comoving_distance_table()
+    instr.count('distance_lookups', z.size)
+    if np.any(z < 0) or np.any(z > z_grid[-1]):
+        raise ValueError(f"redshift must lie in [0, {z_grid[-1]}]")
+    return np.interp(z, z_grid, D_C)
+
+@lru_cache(maxsize=None)
+def lookback_time_table(z_max=z_table_max, n_z=z_table_points):
+    """Lookback time (Gyr) on a uniform redshift grid, built once per grid."""
+    with instr.stage('cosmology_table'):
+        z_grid = np.linspace(0, z_max, n_z)
+        t_L = hubble_time_gyr * cumulative_trapezoid(H0 / ((1 + z_grid) * H(z_grid)), z_grid, initial=0)
+    z_grid.setflags(write=False)
+    t_L.setflags(write=False)
+    return z_grid, t_L
+
+instr.watch_cache('lookback_time_table', lookback_time_table)
+
+def luminosity_distance(z):
+    """Vectorized luminosity distance (Mpc) interpolated from the cached table."""
+    return (1 + np.asarray(z, dtype=float)) * comoving_distance(z)
+
+def _flat_antiderivative(x, Omega_m):
+    """T(x) with dT/dx = -1 / sqrt(Omega_m x^3 + 1 - Omega_m), in units of the Hubble distance."""
+    return 2 / np.sqrt(Omega_m * x) * hyp2f1(1 / 6, 1 / 2, 7 / 6, -(1 - Omega_m) / (Omega_m * x**3))
+
+def comoving_distance_flat(z, Omega_m=Omega_m, H0=H0):
+    """
+    Comoving distance (Mpc) in flat ΛCDM from the hypergeometric closed form, with no table or quadrature.
+
+    D_C = c/H0 [T(1) - T(1+z)], T(x) = 2 / sqrt(Ω_m x) 2F1(1/6, 1/2; 7/6; -Ω_Λ / (Ω_m x^3)).
+    z, Omega_m and H0 broadcast together, so parameter scans are one call. For 1e-3 <= Ω_m <= 1 and
+    0 <= z <= 1000 the relative error against quad is below 1e-13 (see check_flat_distance).
+    """
+    z, Omega_m, H0 = np.broadcast_arrays(np.asarray(z, dtype=float), np.asarray(Omega_m, dtype=float),
+                                         np.asarray(H0, dtype=float))
+    if np.any((Omega_m <= 0) | (Omega_m > 1)):
+        raise ValueError("flat ΛCDM needs 0 < Omega_m <= 1")
+    if np.any(z < 0):
+        raise ValueError("redshift must be non-negative")
+    instr.count('distance_evaluations', z.size)
+    D_H = c / H0
+    D_C = np.array(D_H * (_flat_antiderivative(1.0, Omega_m) - _flat_antiderivative(1 + z, Omega_m)))
+    small = z < small_z_switch
+    if np.any(small):
+        # Fixed 8-point rule: the integrand is smooth on [0, z], so the error is ~ z^16
+        z_s, Omega_m_s = z[small][..., None], Omega_m[small][..., None]
+        z_nodes = 0.5 * z_s * (gauss_legendre_nodes + 1)
+        E = np.sqrt(Omega_m_s * (1 + z_nodes)**3 + 1 - Omega_m_s)
+        D_C[small] = D_H[small] * 0.5 * z[small] * np.sum(gauss_legendre_weights / E, axis=-1)
+    return D_C[()] if D_C.ndim == 0 else D_C
+
+def luminosity_distance_flat(z, Omega_m=Omega_m, H0=H0):
+    """Luminosity distance (Mpc) in flat ΛCDM from the closed form; see comoving_distance_flat."""
+    return (1 + np.asarray(z, dtype=float)) * comoving_distance_flat(z, Omega_m, H0)
+
+def check_flat_distance(n=2000, seed=0):
+    """Maximum relative error of comoving_distance_flat against quad over random (z, Omega_m)."""
+    rng = np.random.default_rng(seed)
+    z = np.concatenate([10**rng.uniform(-6, 3, n), [0.0, small_z_switch, 1000.0]])
+    Omega_m = np.concatenate([rng.uniform(1e-3, 1, n), [0.3, 0.3, 1.0]])
+    reference = np.empty_like(z)
+    for k, (zz, om) in enumerate(zip(z, Omega_m)):
+        # Split at decades so quad resolves each piece to near machine precision
+        points = [0.0] + [p for p in (0.01, 0.1, 1, 10, 100) if p < zz] + [zz]
+        reference[k] = c / H0 * sum(instr.quad(lambda x: 1 / np.sqrt(om * (1 + x)**3 + 1 - om), a, b,
+                                               epsabs=0, epsrel=5e-14)[0]
+                                    for a, b in zip(points[:-1], points[1:]))
+    analytic = comoving_distance_flat(z, Omega_m)
+    with np.errstate(invalid='ignore'):
+        return float(np.nanmax(np.abs(analytic / reference - 1)))
+
 # Main execution
 if __name__ == "__main__":
     # Get redshift input from user
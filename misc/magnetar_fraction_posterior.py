@@ -0,0 +1,205 @@
+import argparse
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import fftconvolve
+from scipy.special import gammaln
+
+# The formation scenarios live in formationscenarios/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'formationscenarios'))
+import instrumentation as instr
+import ep_eventrate_of_fxts
+import BP_PPdot_diagram
+import detection_efficiency
+
+# Defaults
+reference_luminosity = 1e45  # erg/s, luminosity at which V_max is evaluated
+channel_sigma_dex = 0.5  # Log-normal width of each channel rate prior
+log_grid_min = -6.0  # log10 Gpc^-3 yr^-1
+log_grid_max = 12.0
+log_grid_step = 0.005
+
+def channel_priors(sigma_dex=channel_sigma_dex):
+    """Log-normal channel rate priors: name -> (log10 median rate in Gpc^-3 yr^-1, width in dex)."""
+    return {name: (np.log10(data['rate']), sigma_dex) for name, data in BP_PPdot_diagram.scenarios.items()}
+
+def exposure(luminosity=reference_luminosity, flux_limit=ep_eventrate_of_fxts.flux_limit,
+             Omega=ep_eventrate_of_fxts.Omega, T=ep_eventrate_of_fxts.T):
+    """Expected FXT count per unit space density rate, V_max * Omega / 4π * T (Gpc^3 yr)."""
+    return ep_eventrate_of_fxts.v_max(luminosity, flux_limit) * Omega / (4 * np.pi) * T
+
+def log_likelihood(log_rho, N_FXT, exposure):
+    """Poisson log-likelihood of N_FXT observed FXTs for log10 space density rates log_rho."""
+    expected = 10**np.asarray(log_rho) * exposure
+    return N_FXT * np.log(expected) - expected - gammaln(N_FXT + 1)
+
+def log_grid():
+    return np.arange(log_grid_min, log_grid_max + log_grid_step / 2, log_grid_step)
+
+@lru_cache(maxsize=32)
+def rho_posterior_grid(N_FXT=ep_eventrate_of_fxts.N_FXT, luminosity=reference_luminosity,
+                       flux_limit=ep_eventrate_of_fxts.flux_limit):
+    """
+    Posterior density of log10 ρ_FXT on the log grid (log-uniform prior).
+
+    Cached per (N_FXT, luminosity, flux_limit), so changing a channel rate does not recompute it.
+    """
+    grid = log_grid()
+    log_post = log_likelihood(grid, N_FXT, exposure(luminosity, flux_limit))
+    density = np.exp(log_post - log_post.max())
+    density /= density.sum() * log_grid_step
+    density.setflags(write=False)
+    return density
+
+instr.watch_cache('rho_posterior_grid', rho_posterior_grid)
+
+def magnetar_rate_density(priors, n_draws=1_000_000, seed=None):
+    """Density of log10 of the summed channel rates on the log grid, from vectorized prior draws."""
+    rng = np.random.default_rng(seed)
+    medians = np.array([median for median, _ in priors.values()])
+    widths = np.array([width for _, width in priors.values()])
+    draws = rng.normal(medians, widths, size=(n_draws, len(priors)))
+    log_total = np.log10(np.sum(10**draws, axis=1))
+    grid = log_grid()
+    edges = np.append(grid - log_grid_step / 2, grid[-1] + log_grid_step / 2)
+    density, _ = np.histogram(log_total, bins=edges, density=True)
+    return density
+
+def fraction_posterior_grid(priors=None, detectable_fraction=1.0, N_FXT=ep_eventrate_of_fxts.N_FXT,
+                            luminosity=reference_luminosity, flux_limit=ep_eventrate_of_fxts.flux_limit,
+                            n_draws=1_000_000, seed=None):
+    """
+    Posterior density of log10 f, f = detectable_fraction * Σ r_c / ρ_FXT, on a dense grid.
+
+    log f = log R - log ρ, so its density is the cross-correlation of the two densities on the
+    shared uniform grid, done with one FFT convolution.
+
+    Returns:
+    tuple: (log10 f values, posterior density per dex)
+    """
+    if priors is None:
+        priors = channel_priors()
+    with instr.stage('rho_posterior'):
+        p_rho = rho_posterior_grid(N_FXT, luminosity, flux_limit)
+    with instr.stage('channel_rates'):
+        p_rate = magnetar_rate_density(priors, n_draws, seed)
+    with instr.stage('convolution'):
+        p_f = np.clip(fftconvolve(p_rate, p_rho[::-1]), 0, None) * log_grid_step
+    grid = log_grid()
+    log_f = np.arange(p_f.size) * log_grid_step + (grid[0] - grid[-1]) + np.log10(detectable_fraction)
+    return log_f, p_f / (p_f.sum() * log_grid_step)
+
+def log_posterior(theta, priors, N_FXT, exposure):
+    """
+    Log posterior for walkers theta = (log10 ρ_FXT, log10 r_c for each channel), shape (n_walkers, 1 + n_channels).
+    """
+    medians = np.array([median for median, _ in priors.values()])
+    widths = np.array([width for _, width in priors.values()])
+    log_rho = theta[:, 0]
+    log_prior = -0.5 * np.sum(((theta[:, 1:] - medians) / widths)**2, axis=1)
+    in_bounds = (log_rho > log_grid_min) & (log_rho < log_grid_max)
+    return np.where(in_bounds, log_likelihood(log_rho, N_FXT, exposure) + log_prior, -np.inf)
+
+def ensemble_sample(log_prob, initial, n_steps, stretch=2.0, seed=None):
+    """
+    Affine-invariant stretch-move ensemble sampler (Goodman & Weare 2010).
+
+    The walkers are split in two halves, and each half is updated against the other with a
+    single batched call to log_prob.
+
+    Returns:
+    ndarray: Chain of shape (n_steps, n_walkers, n_dim)
+    """
+    rng = np.random.default_rng(seed)
+    walkers = np.array(initial, dtype=float)
+    n_walkers, n_dim = walkers.shape
+    log_p = log_prob(walkers)
+    chain = np.empty((n_steps, n_walkers, n_dim))
+    halves = [np.arange(0, n_walkers // 2), np.arange(n_walkers // 2, n_walkers)]
+    for step in range(n_steps):
+        for active, partner in (halves, halves[::-1]):
+            z = ((stretch - 1) * rng.random(active.size) + 1)**2 / stretch
+            partners = walkers[rng.choice(partner, active.size)]
+            proposal = partners + z[:, None] * (walkers[active] - partners)
+            log_p_new = log_prob(proposal)
+            accept = np.log(rng.random(active.size)) < (n_dim - 1) * np.log(z) + log_p_new - log_p[active]
+            walkers[active[accept]] = proposal[accept]
+            log_p[active[accept]] = log_p_new[accept]
+        chain[step] = walkers
+    instr.count('log_prob_evaluations', n_walkers * (n_steps + 1))
+    return chain
+
+def fraction_posterior_ensemble(priors=None, detectable_fraction=1.0, N_FXT=ep_eventrate_of_fxts.N_FXT,
+                                luminosity=reference_luminosity, flux_limit=ep_eventrate_of_fxts.flux_limit,
+                                n_walkers=64, n_steps=2000, burn_in=500, seed=None):
+    """Posterior samples of log10 f from the ensemble sampler, after discarding burn-in."""
+    if priors is None:
+        priors = channel_priors()
+    rng = np.random.default_rng(seed)
+    counts_exposure = exposure(luminosity, flux_limit)
+    medians = np.array([median for median, _ in priors.values()])
+    widths = np.array([width for _, width in priors.values()])
+    initial = np.column_stack([
+        np.log10(max(N_FXT, 1) / counts_exposure) + 0.1 * rng.standard_normal(n_walkers),
+        medians + widths * rng.standard_normal((n_walkers, medians.size)),
+    ])
+    with instr.stage('ensemble_sampler'):
+        chain = ensemble_sample(lambda theta: log_posterior(theta, priors, N_FXT, counts_exposure),
+                                initial, n_steps, seed=seed)
+    samples = chain[burn_in:].reshape(-1, chain.shape[-1])
+    return np.log10(detectable_fraction * np.sum(10**samples[:, 1:], axis=1)) - samples[:, 0]
+
+def summarize(log_f, density=None):
+    """Median, 68% interval and 95% upper limit of f, from a gridded density or from samples."""
+    quantiles = [0.5, 0.16, 0.84, 0.95]
+    if density is None:
+        values = np.quantile(log_f, quantiles)
+    else:
+        cdf = np.cumsum(density) * (log_f[1] - log_f[0])
+        values = np.interp(quantiles, cdf / cdf[-1], log_f)
+    median, low, high, upper = (float(v) for v in 10**values)
+    return {'median': median, 'interval_68': (low, high), 'upper_95': upper}
+
+def main():
+    parser = argparse.ArgumentParser(description='Posterior on the magnetar fraction of FXTs.')
+    parser.add_argument('--method', choices=['grid', 'ensemble', 'both'], default='both')
+    parser.add_argument('--luminosity', type=float, default=reference_luminosity,
+                        help='luminosity (erg/s) at which V_max is evaluated')
+    parser.add_argument('--detectable-fraction', type=float, default=1.0,
+                        help='fraction of magnetars that would produce a detectable FXT')
+    parser.add_argument('--population', action='store_true',
+                        help='take the detectable fraction from the detection-efficiency table '
+                             'for a simulated magnetar population instead')
+    parser.add_argument('--eta', type=float, default=1e-3,
+                        help='X-ray efficiency of the simulated population (with --population)')
+    parser.add_argument('--z-max', type=float, default=1.0,
+                        help='maximum redshift of the simulated population (with --population)')
+    parser.add_argument('--sigma-dex', type=float, default=channel_sigma_dex,
+                        help='width of the log-normal channel rate priors in dex')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    priors = channel_priors(args.sigma_dex)
+    if args.population:
+        args.detectable_fraction = detection_efficiency.population_detectable_fraction(
+            eta=args.eta, z_max=args.z_max, seed=args.seed)
+        print(f"Detectable fraction from the efficiency table: {args.detectable_fraction:.3e}")
+    results = {}
+    if args.method in ('grid', 'both'):
+        log_f, density = fraction_posterior_grid(priors, args.detectable_fraction,
+                                                 luminosity=args.luminosity, seed=args.seed)
+        results['grid'] = summarize(log_f, density)
+    if args.method in ('ensemble', 'both'):
+        samples = fraction_posterior_ensemble(priors, args.detectable_fraction,
+                                              luminosity=args.luminosity, seed=args.seed)
+        results['ensemble'] = summarize(samples)
+
+    for method, summary in results.items():
+        low, high = summary['interval_68']
+        print(f"{method}: median f = {summary['median']:.2e}, "
+              f"68% interval [{low:.2e}, {high:.2e}], 95% upper limit {summary['upper_95']:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Streaming structured output for script results.
+
+Scripts hand their results to a RecordSink as they are produced, one record
+(a flat dict) or one batch of columns at a time. The sink writes them as
+NDJSON (one JSON object per line, flushed per write) or as an Arrow IPC
+stream of record batches for large outputs, so a downstream job can read a
+pipe or a growing file while the producer is still running, and nothing is
+buffered beyond one Arrow batch. Arrow output needs pyarrow.
+
+Scripts take the destination from --records (or the MSEC_RECORDS
+environment variable); '-' is stdout, in which case the usual printed
+summary moves to stderr so the record stream stays clean.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+import instrumentation as instr
+
+formats = ('ndjson', 'arrow')
+batch_size = 65536  # Rows per Arrow record batch
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("Arrow output needs pyarrow; install it or use the ndjson format") from None
+    return pyarrow
+
+class RecordSink:
+    """
+    Incremental writer of flat records as NDJSON or an Arrow IPC stream.
+
+    Every record of one sink should have the same fields; with Arrow the first batch fixes the schema.
+    """
+
+    def __init__(self, path='-', fmt='ndjson', batch_size=batch_size):
+        if fmt not in formats:
+            raise ValueError(f"unknown record format '{fmt}', use one of {', '.join(formats)}")
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.to_stdout = path == '-'
+        self.pa = _pyarrow() if fmt == 'arrow' else None
+        if self.to_stdout:
+            self.stream = sys.stdout.buffer if fmt == 'arrow' else sys.stdout
+        else:
+            self.stream = open(path, 'wb' if fmt == 'arrow' else 'w')
+        self.pending = []
+        self.writer = None
+        self.records = 0
+
+    def write(self, record):
+        """Write one record (dict of scalars)."""
+        if self.fmt == 'ndjson':
+            self.stream.write(json.dumps(record, default=_plain) + '\n')
+            self.stream.flush()
+        else:
+            self.pending.append(record)
+            if len(self.pending) >= self.batch_size:
+                self._flush_pending()
+        self.records += 1
+        instr.count('records_written')
+
+    def write_columns(self, columns):
+        """Write a batch of records given as equal-length columns; scalars are repeated."""
+        n = max((np.size(value) for value in columns.values() if np.ndim(value) > 0), default=1)
+        columns = {name: np.broadcast_to(np.asarray(value), (n,)) for name, value in columns.items()}
+        if self.fmt == 'ndjson':
+            names = list(columns)
+            lines = [json.dumps(dict(zip(names, row)), default=_plain)
+                     for row in zip(*(column.tolist() for column in columns.values()))]
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        else:
+            self._flush_pending()
+            for start in range(0, n, self.batch_size):
+                self._write_batch({name: column[start:start + self.batch_size] for name, column in columns.items()})
+        self.records += n
+        instr.count('records_written', n)
+
+    def _flush_pending(self):
+        if self.pending:
+            names = list(self.pending[0])
+            self._write_batch({name: [record[name] for record in self.pending] for name in names})
+            self.pending = []
+
+    def _write_batch(self, columns):
+        batch = self.pa.RecordBatch.from_pydict({name: self.pa.array(np.asarray(column).tolist())
+                                                 for name, column in columns.items()})
+        if self.writer is None:
+            self.writer = self.pa.ipc.new_stream(self.stream, batch.schema)
+        self.writer.write_batch(batch)
+        self.stream.flush()
+
+    def close(self):
+        if self.fmt == 'arrow':
+            self._flush_pending()
+            if self.writer is not None:
+                self.writer.close()
+        self.stream.flush()
+        if not self.to_stdout:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def add_arguments(parser):
+    """Add --records and --records-format to a script's argument parser."""
+    parser.add_argument('--records', default=os.environ.get('MSEC_RECORDS'), metavar='FILE',
+                        help="stream results as structured records to FILE ('-' for stdout; default: MSEC_RECORDS)")
+    parser.add_argument('--records-format', choices=formats, default='ndjson',
+                        help='record format: NDJSON lines or an Arrow IPC stream')
+
+def from_args(args):
+    """RecordSink for parsed --records arguments, or None when records were not requested."""
+    if not args.records:
+        return None
+    return RecordSink(args.records, args.records_format)
+
+def text_stream(sink):
+    """Where a script's printed summary goes: stderr when the records stream to stdout."""
+    return sys.stderr if sink is not None and sink.to_stdout else sys.stdout
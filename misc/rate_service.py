@@ -0,0 +1,299 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+# Make the gsmf and magnetar model scripts importable from here
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_dir, 'gsmf'))
+sys.path.insert(0, os.path.join(repo_dir, 'magnetar_model_fxts'))
+
+import luminositydistance
+import ep_eventrate_of_fxts
+import doubleschechter
+import duration_of_fxts
+import detection_efficiency
+import instrumentation as instr
+
+# Defaults
+default_socket = '/tmp/msec_rate_service.sock'
+max_concurrency = 8  # Batches evaluated at the same time
+latency_window = 10000  # Number of recent batch latencies kept for percentiles
+
+def warm_state():
+    """Build the cosmology and detection-efficiency tables and the per-set GSMF normalizations once."""
+    luminositydistance.comoving_distance_table()
+    detection_efficiency.efficiency_table()
+    gsmf_sets = []
+    for ref, z, log_M_star, phi_1, phi_2, alpha_1, alpha_2 in doubleschechter.schechter_params:
+        n_gal_gpc3, n_gal_11_gpc3, N = doubleschechter.normalization(log_M_star, phi_1, phi_2, alpha_1, alpha_2)
+        gsmf_sets.append({'reference': ref, 'z': z, 'n_gal': n_gal_gpc3, 'N': N})
+    return {
+        'gsmf_sets': gsmf_sets,
+        'event_rates': {label: rate for rate, label in doubleschechter.event_rates},
+    }
+
+class ServiceStats:
+    """Request, query and error counters plus a window of recent batch latencies."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.queries = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=latency_window)
+
+    def record(self, n_queries, n_errors, latency):
+        self.requests += 1
+        self.queries += n_queries
+        self.errors += n_errors
+        self.latencies.append(latency)
+
+    def snapshot(self):
+        uptime = time.monotonic() - self.started
+        latencies_ms = np.array(self.latencies) * 1e3
+        if latencies_ms.size:
+            p50, p99 = np.percentile(latencies_ms, [50, 99])
+        else:
+            p50 = p99 = 0.0
+        return {
+            'uptime_s': uptime,
+            'requests': self.requests,
+            'queries': self.queries,
+            'errors': self.errors,
+            'queries_per_s': self.queries / uptime if uptime > 0 else 0.0,
+            'latency_p50_ms': float(p50),
+            'latency_p99_ms': float(p99),
+        }
+
+def finite_field(query, name, minimum=None, default=None):
+    """
+    A query field as a float array; ValueError for null, non-finite or out-of-range values.
+
+    minimum is exclusive (e.g. 0 for quantities that must be positive); a missing field takes
+    default when one is given and raises KeyError otherwise.
+    """
+    value = query[name] if default is None else query.get(name, default)
+    try:
+        array = np.asarray(value, dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a number or a list of numbers") from None
+    if value is None or not np.all(np.isfinite(array)):
+        raise ValueError(f"'{name}' must be finite")
+    if minimum is not None and not np.all(array > minimum):
+        raise ValueError(f"'{name}' must be greater than {minimum}")
+    return array
+
+def luminosity_distance_query(state, query):
+    z = finite_field(query, 'z', minimum=-1)
+    return {'D_L_Mpc': luminositydistance.luminosity_distance(z).tolist()}
+
+def volumetric_rate_query(state, query):
+    """Volumetric rate (Gpc^-3 yr^-1) for every GSMF set, by event rate or registry label."""
+    if 'label' in query:
+        event_rate = state['event_rates'][query['label']]
+    else:
+        event_rate = float(finite_field(query, 'event_rate', minimum=0))
+    return {'rates': [
+        {'reference': s['reference'], 'z': s['z'],
+         'R': doubleschechter.volumetric_rate(event_rate, s['n_gal'], s['N'])}
+        for s in state['gsmf_sets']
+    ]}
+
+def rho_fxt_query(state, query):
+    luminosities = finite_field(query, 'luminosity', minimum=0)
+    flux_limit = finite_field(query, 'flux_limit', minimum=0, default=ep_eventrate_of_fxts.flux_limit)
+    N_FXT = finite_field(query, 'N_FXT', minimum=0, default=ep_eventrate_of_fxts.N_FXT)
+    return {'v_max_Gpc3': ep_eventrate_of_fxts.v_max(luminosities, flux_limit).tolist(),
+            'rho_FXT': ep_eventrate_of_fxts.rho_FXT(luminosities, N_FXT, flux_limit).tolist()}
+
+def spin_down_query(state, query):
+    B_p = finite_field(query, 'B_p', minimum=0)
+    P_i = finite_field(query, 'P_i', minimum=0)
+    return {'tau_EM_s': duration_of_fxts.tau_EM(B_p, P_i).tolist(),
+            'L_0_EM': duration_of_fxts.L_0_EM(B_p, P_i).tolist()}
+
+def detection_efficiency_query(state, query):
+    L_0 = finite_field(query, 'L_0', minimum=0)
+    tau = finite_field(query, 'tau', minimum=0)
+    z = finite_field(query, 'z', minimum=0)
+    flux_limit = finite_field(query, 'flux_limit', minimum=0, default=ep_eventrate_of_fxts.flux_limit)
+    return {'efficiency': detection_efficiency.detection_efficiency(L_0, tau, z, flux_limit).tolist()}
+
+query_handlers = {
+    'luminosity_distance': luminosity_distance_query,
+    'volumetric_rate': volumetric_rate_query,
+    'rho_fxt': rho_fxt_query,
+    'spin_down': spin_down_query,
+    'detection_efficiency': detection_efficiency_query,
+}
+
+def evaluate_batch(state, stats, request):
+    """Answer every query in a request; a failing query reports an error without failing the batch."""
+    results = []
+    n_errors = 0
+    queries = request.get('queries', [])
+    if not isinstance(queries, list):
+        return {'results': [], 'error': "'queries' must be a list"}, 1
+    for query in queries:
+        if not isinstance(query, dict):
+            results.append({'error': 'each query must be a JSON object'})
+            n_errors += 1
+            continue
+        kind = query.get('kind')
+        try:
+            if kind == 'stats':
+                answer = stats.snapshot()
+            else:
+                with instr.stage(f'query:{kind}'):
+                    answer = query_handlers[kind](state, query)
+        except KeyError as e:
+            answer = {'error': f'missing or unknown field: {e}'}
+        except (TypeError, ValueError) as e:
+            answer = {'error': str(e)}
+        if 'error' in answer:
+            n_errors += 1
+        if 'id' in query:
+            answer['id'] = query['id']
+        results.append(answer)
+    return {'results': results}, n_errors
+
+def finite_results(results):
+    """Replace each result that does not encode as strict JSON by an error; returns (results, replaced)."""
+    checked, replaced = [], 0
+    for result in results:
+        try:
+            json.dumps(result, allow_nan=False)
+        except ValueError:
+            result = {'error': 'the result is not finite for these inputs',
+                      **({'id': result['id']} if 'id' in result else {})}
+            replaced += 1
+        checked.append(result)
+    return checked, replaced
+
+async def answer(state, stats, limiter, payload):
+    """
+    Decode one JSON request, evaluate it under the concurrency limit and encode the reply.
+
+    Returns:
+    tuple: (JSON reply, whether the request itself was well formed)
+    """
+    start = time.perf_counter()
+    try:
+        request = json.loads(payload)
+    except ValueError as e:
+        stats.record(0, 1, time.perf_counter() - start)
+        return json.dumps({'error': f'invalid JSON: {e}'}), False
+    if not isinstance(request, dict):
+        stats.record(0, 1, time.perf_counter() - start)
+        return json.dumps({'error': 'the request must be a JSON object with a "queries" list'}), False
+    async with limiter:
+        response, n_errors = await asyncio.to_thread(evaluate_batch, state, stats, request)
+    try:
+        reply = json.dumps(response, allow_nan=False)
+    except ValueError:
+        # Strict JSON has no NaN or Infinity: report the queries that produced them as errors
+        response['results'], n_non_finite = finite_results(response['results'])
+        n_errors += n_non_finite
+        reply = json.dumps(response, allow_nan=False)
+    stats.record(len(response['results']), n_errors, time.perf_counter() - start)
+    return reply, 'error' not in response
+
+async def handle_stream(state, stats, limiter, reader, writer):
+    """Unix-socket protocol: one JSON request per line, one JSON response per line."""
+    try:
+        while line := await reader.readline():
+            if not line.strip():
+                continue
+            reply, _ = await answer(state, stats, limiter, line)
+            writer.write(reply.encode() + b'\n')
+            await writer.drain()
+    finally:
+        writer.close()
+
+async def handle_http(state, stats, limiter, reader, writer):
+    """Minimal HTTP/1.0 protocol: POST a JSON request body, GET /stats for the counters."""
+    try:
+        request_line = (await reader.readline()).decode().split()
+        headers = {}
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            key, _, value = line.decode().partition(':')
+            headers[key.strip().lower()] = value.strip()
+        length = headers.get('content-length', '0')
+        if request_line[:1] == ['POST'] and not (length.isascii() and length.isdigit()):
+            status, reply = '400 Bad Request', json.dumps({'error': f'invalid Content-Length: {length!r}'})
+        elif request_line[:1] == ['POST']:
+            try:
+                body = await reader.readexactly(int(length))
+            except asyncio.IncompleteReadError:
+                status, reply = '400 Bad Request', json.dumps({'error': 'body shorter than Content-Length'})
+            else:
+                reply, well_formed = await answer(state, stats, limiter, body)
+                status = '200 OK' if well_formed else '400 Bad Request'
+        elif request_line[:2] == ['GET', '/stats']:
+            status, reply = '200 OK', json.dumps(stats.snapshot())
+        else:
+            status, reply = '405 Method Not Allowed', json.dumps({'error': 'use POST or GET /stats'})
+        data = reply.encode()
+        writer.write(f'HTTP/1.0 {status}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(unix_path=None, port=None, concurrency=max_concurrency):
+    """Warm the tables and serve queries on a Unix socket and/or localhost HTTP port."""
+    state = warm_state()
+    stats = ServiceStats()
+    limiter = asyncio.Semaphore(concurrency)
+
+    servers = []
+    if unix_path is not None:
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        servers.append(await asyncio.start_unix_server(
+            lambda r, w: handle_stream(state, stats, limiter, r, w), path=unix_path))
+        print(f"Serving on unix socket {unix_path}")
+    if port is not None:
+        servers.append(await asyncio.start_server(
+            lambda r, w: handle_http(state, stats, limiter, r, w), host='127.0.0.1', port=port))
+        print(f"Serving HTTP on 127.0.0.1:{port}")
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+def query(queries, unix_path=default_socket):
+    """Send one batch of queries to a running service and return its results."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(unix_path)
+        sock.sendall(json.dumps({'queries': queries}).encode() + b'\n')
+        reply = sock.makefile('rb').readline()
+    return json.loads(reply)
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm-cache rate query service.')
+    parser.add_argument('--unix', metavar='PATH', default=None,
+                        help=f'Unix socket path (default {default_socket} if --port is not given)')
+    parser.add_argument('--port', type=int, default=None, help='serve HTTP on 127.0.0.1:PORT')
+    parser.add_argument('--concurrency', type=int, default=max_concurrency,
+                        help='maximum number of batches evaluated at once')
+    parser.add_argument('--profile', action='store_true',
+                        help='write a stage timing trace at exit (same as MSEC_PROFILE=1)')
+    args = parser.parse_args()
+    if args.profile:
+        instr.enable()
+
+    unix_path = args.unix
+    if unix_path is None and args.port is None:
+        unix_path = default_socket
+    try:
+        asyncio.run(serve(unix_path, args.port, args.concurrency))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
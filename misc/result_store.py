@@ -0,0 +1,315 @@
+"""
+Chunked, self-describing result store for computed grids and tables.
+
+A store is a directory; every dataset lives in its own subdirectory (names
+may contain '/' to form groups) with a meta.json describing shape, dtype,
+chunk shape, compression, units, free-form attributes and provenance (script,
+arguments, git commit, time), plus one file per chunk:
+
+    <store>/<name>/meta.json
+    <store>/<name>/c.<i>.<j>...npy     uncompressed chunk, read memory-mapped
+    <store>/<name>/c.<i>.<j>...zlib    zlib-compressed raw chunk bytes
+
+Reads are lazy: slicing a Dataset touches only the chunks that overlap the
+slice. Chunks and metadata are written to a temporary file and renamed, so a
+crash never leaves a partial chunk, and readers can open a store while a
+sweep is still filling it. Scripts write their results to the store named by
+the MSEC_RESULT_STORE environment variable, when it is set.
+"""
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import zlib
+
+import numpy as np
+
+import instrumentation as instr
+
+default_chunk_bytes = 1 << 20  # Target uncompressed chunk size
+compression_level = 6
+
+def provenance():
+    """Where a result came from: script, arguments, git commit, host and time."""
+    repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'script': os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        'argv': sys.argv[1:],
+        'git_commit': commit,
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    }
+
+def default_chunks(shape, itemsize, chunk_bytes=default_chunk_bytes):
+    """Chunk shape of about chunk_bytes, splitting the leading axes first."""
+    chunks = list(shape)
+    size = itemsize * int(np.prod(shape, dtype=np.int64))
+    axis = 0
+    while size > chunk_bytes and axis < len(chunks):
+        shrink = min(chunks[axis], int(np.ceil(size / chunk_bytes)))
+        chunks[axis] = max(1, int(np.ceil(chunks[axis] / shrink)))
+        size = itemsize * int(np.prod(chunks, dtype=np.int64))
+        axis += 1
+    return tuple(max(1, c) for c in chunks)
+
+def _atomic_write(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class Dataset:
+    """One array in the store, read and written chunk by chunk."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.shape = tuple(self.meta['shape'])
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.chunks = tuple(self.meta['chunks'])
+        self.compression = self.meta['compression']
+        self.units = self.meta['units']
+        self.attrs = self.meta['attrs']
+        self.fill_value = np.nan if self.meta['fill_value'] is None else self.meta['fill_value']
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"<Dataset {os.path.basename(self.path)} shape={self.shape} dtype={self.dtype} units={self.units!r}>"
+
+    def chunk_grid(self):
+        return tuple(int(np.ceil(s / c)) for s, c in zip(self.shape, self.chunks))
+
+    def _chunk_path(self, index):
+        suffix = 'zlib' if self.compression == 'zlib' else 'npy'
+        return os.path.join(self.path, 'c.' + '.'.join(str(i) for i in index) + '.' + suffix) if index else \
+            os.path.join(self.path, f'c.{suffix}')
+
+    def _chunk_shape(self, index):
+        return tuple(min(c, s - i * c) for i, c, s in zip(index, self.chunks, self.shape))
+
+    def has_chunk(self, index):
+        return os.path.exists(self._chunk_path(tuple(index)))
+
+    def read_chunk(self, index):
+        """One chunk as an array (memory-mapped when uncompressed); fill_value where never written."""
+        index = tuple(index)
+        path = self._chunk_path(index)
+        if not os.path.exists(path):
+            return np.full(self._chunk_shape(index), self.fill_value, dtype=self.dtype)
+        instr.count('store_chunks_read')
+        if self.compression == 'zlib':
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+            return np.frombuffer(data, dtype=self.dtype).reshape(self._chunk_shape(index))
+        return np.load(path, mmap_mode='r')
+
+    def write_chunk(self, index, values):
+        """Write one whole chunk atomically."""
+        index = tuple(index)
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        if values.shape != self._chunk_shape(index):
+            raise ValueError(f"chunk {index} has shape {self._chunk_shape(index)}, got {values.shape}")
+        path = self._chunk_path(index)
+        if self.compression == 'zlib':
+            _atomic_write(path, zlib.compress(values.tobytes(), compression_level))
+        else:
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp_path, path)
+        instr.count('store_chunks_written')
+
+    def _selection(self, key):
+        """Normalize a basic index to per-axis (start, stop, step) and the axes to drop."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            at = key.index(Ellipsis)
+            key = key[:at] + (slice(None),) * (self.ndim - len(key) + 1) + key[at + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if len(key) != self.ndim:
+            raise IndexError(f"too many indices for dataset of dimension {self.ndim}")
+        bounds, drop = [], []
+        for axis, (k, size) in enumerate(zip(key, self.shape)):
+            if isinstance(k, slice):
+                bounds.append(k.indices(size))
+            else:
+                k = int(k)
+                if not -size <= k < size:
+                    raise IndexError(f"index {k} is out of bounds for axis {axis} with size {size}")
+                k %= size
+                bounds.append((k, k + 1, 1))
+                drop.append(axis)
+        return bounds, tuple(drop)
+
+    def _overlapping(self, lows, highs):
+        """Chunk indices that intersect the block [lows, highs)."""
+        return itertools.product(*(range(low // c, (high - 1) // c + 1) if high > low else range(0)
+                                   for low, high, c in zip(lows, highs, self.chunks)))
+
+    def _copy_regions(self, index, lows, highs):
+        """(slices in the chunk, slices in the block) of the overlap of a chunk with a block."""
+        in_chunk, in_block = [], []
+        for i, c, n, low, high in zip(index, self.chunks, self._chunk_shape(index), lows, highs):
+            a, b = max(i * c, low), min(i * c + n, high)
+            in_chunk.append(slice(a - i * c, b - i * c))
+            in_block.append(slice(a - low, b - low))
+        return tuple(in_chunk), tuple(in_block)
+
+    def __getitem__(self, key):
+        bounds, drop = self._selection(key)
+        ranges = [range(*b) for b in bounds]
+        lows = [min(r) if len(r) else 0 for r in ranges]
+        highs = [max(r) + 1 if len(r) else 0 for r in ranges]
+        # Gather the covering block chunk by chunk, then apply any steps
+        block = np.empty([high - low for low, high in zip(lows, highs)], dtype=self.dtype)
+        for index in self._overlapping(lows, highs):
+            in_chunk, in_block = self._copy_regions(index, lows, highs)
+            block[in_block] = self.read_chunk(index)[in_chunk]
+        if any(step != 1 for _, _, step in bounds):
+            block = block[np.ix_(*(np.asarray(r) - low for r, low in zip(ranges, lows)))]
+        return block.reshape([n for axis, n in enumerate(block.shape) if axis not in drop])
+
+    def __setitem__(self, key, values):
+        """Write a step-1 region; partially covered chunks are read, updated and rewritten."""
+        bounds, drop = self._selection(key)
+        if any(step != 1 for _, _, step in bounds):
+            raise IndexError("only step-1 slices can be assigned")
+        lows = [start for start, _, _ in bounds]
+        highs = [max(start, stop) for start, stop, _ in bounds]
+        region = [high - low for low, high in zip(lows, highs)]
+        kept = [n for axis, n in enumerate(region) if axis not in drop]
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), kept).reshape(region)
+        for index in self._overlapping(lows, highs):
+            in_chunk, in_block = self._copy_regions(index, lows, highs)
+            shape = self._chunk_shape(index)
+            whole = all(s.stop - s.start == n for s, n in zip(in_chunk, shape))
+            chunk = np.empty(shape, dtype=self.dtype) if whole else np.array(self.read_chunk(index))
+            chunk[in_chunk] = values[in_block]
+            self.write_chunk(index, chunk)
+
+    def read(self):
+        return self[...]
+
+    def completed_chunks(self):
+        """Indices of the chunks written so far."""
+        return [index for index in itertools.product(*(range(n) for n in self.chunk_grid()))
+                if self.has_chunk(index)]
+
+class ResultStore:
+    """A directory of datasets with units and provenance; see the module docstring."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return f"<ResultStore {self.path}: {len(self.keys())} datasets>"
+
+    def _dataset_path(self, name):
+        parts = [part for part in name.split('/') if part]
+        if not parts or any(part in ('.', '..') for part in parts):
+            raise ValueError(f"invalid dataset name '{name}'")
+        return os.path.join(self.path, *parts)
+
+    def __contains__(self, name):
+        return os.path.exists(os.path.join(self._dataset_path(name), 'meta.json'))
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return Dataset(self._dataset_path(name))
+
+    def keys(self):
+        """Names of all datasets, including those in groups."""
+        names = []
+        for root, _, files in os.walk(self.path):
+            if 'meta.json' in files:
+                names.append(os.path.relpath(root, self.path).replace(os.sep, '/'))
+        return sorted(names)
+
+    def create(self, name, shape, dtype=np.float64, chunks=None, units=None, compression='zlib',
+               fill_value=np.nan, attrs=None, overwrite=False):
+        """
+        New empty dataset, filled later chunk by chunk; an existing one with the same layout is reopened.
+
+        Parameters:
+        name (str): Dataset name, '/' separates groups
+        shape, dtype: Array layout
+        chunks (tuple): Chunk shape (default about 1 MiB per chunk)
+        units (str or dict): Units of the values, or of each named field/axis
+        compression (str): 'zlib' or None (uncompressed chunks are read memory-mapped)
+        fill_value: Value returned for chunks never written
+        attrs (dict): Axis coordinates, parameters and other JSON-serializable metadata
+        """
+        if compression not in ('zlib', None):
+            raise ValueError(f"unknown compression '{compression}', use 'zlib' or None")
+        path = self._dataset_path(name)
+        dtype = np.dtype(dtype)
+        shape = tuple(int(s) for s in shape)
+        chunks = tuple(int(c) for c in chunks) if chunks is not None else default_chunks(shape, dtype.itemsize)
+        if name in self and not overwrite:
+            dataset = self[name]
+            if dataset.shape != shape or dataset.dtype != dtype or dataset.chunks != chunks:
+                raise ValueError(f"dataset '{name}' exists with a different layout")
+            return dataset
+        if name in self:
+            for entry in os.listdir(path):
+                if entry.startswith('c.'):
+                    os.remove(os.path.join(path, entry))
+        os.makedirs(path, exist_ok=True)
+        fill = fill_value.item() if isinstance(fill_value, np.generic) else fill_value
+        if dtype.kind not in 'fc' and isinstance(fill, float) and np.isnan(fill):
+            fill = 0
+        meta = {
+            'shape': list(shape),
+            'dtype': dtype.str,
+            'chunks': list(chunks),
+            'compression': compression,
+            'fill_value': None if isinstance(fill, float) and np.isnan(fill) else fill,
+            'units': units,
+            'attrs': attrs or {},
+            'provenance': provenance(),
+        }
+        _atomic_write(os.path.join(path, 'meta.json'), json.dumps(meta, indent=1, default=_json_default).encode())
+        return Dataset(path)
+
+    def write(self, name, values, units=None, chunks=None, compression='zlib', attrs=None):
+        """Write a whole array as a new (or replaced) dataset."""
+        values = np.asarray(values)
+        with instr.stage('store_write'):
+            dataset = self.create(name, values.shape, values.dtype, chunks, units, compression,
+                                  attrs=attrs, overwrite=True)
+            for index in itertools.product(*(range(n) for n in dataset.chunk_grid())):
+                region = tuple(slice(i * c, (i + 1) * c) for i, c in zip(index, dataset.chunks))
+                dataset.write_chunk(index, values[region])
+        return dataset
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def open_default():
+    """The store named by MSEC_RESULT_STORE, or None when results are not being kept."""
+    path = os.environ.get('MSEC_RESULT_STORE')
+    return ResultStore(path) if path else None
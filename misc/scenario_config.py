@@ -0,0 +1,299 @@
+"""
+Scenario configuration files compiled into one vectorized evaluation plan.
+
+A config (TOML, or YAML with PyYAML) declares any number of scenario
+variants. Each variant names the kernels it needs (the column kernels of
+sweep.py) and overrides the physical inputs that otherwise come from the
+module constants (eta, flux_limit, N_FXT, r_MW_values, schechter_params,
+event_rates, the formation-channel rates, ...):
+
+    name = "eta_study"
+
+    [defaults]                  # shared by every scenario
+    N_FXT = 60
+
+    [[scenarios]]
+    name = "low_eta"
+    kernels = ["spindown", "fxt_rate"]
+    [scenarios.parameters]
+    eta = 1e-4
+    B = {logspace = [14, 16, 50]}
+
+    [[scenarios]]
+    name = "weigel_only"
+    kernels = ["gsmf"]
+    [scenarios.parameters]
+    "log_M_star,phi_1,phi_2,alpha_1,alpha_2" = [[10.79, 4.90e-4, 9.77e-3, -1.69, -0.79]]
+    event_rate = [1e-6, 3e-4]
+
+Parameters take the sweep grid syntax (scalar, list, {linspace|logspace}),
+and a comma-joined key declares rows of parameters that vary together. The
+grid of each scenario is the Cartesian product of its declarations.
+
+The config is validated once, then compiled: the points of every scenario
+that uses a kernel are stacked (scenarios resolving to identical inputs
+share one block), and each kernel runs once over its stacked columns before
+the outputs are split back per scenario. Results are tagged with the hash of the validated config.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+import instrumentation as instr
+import result_store
+import sweep
+
+# Inputs that must be strictly positive wherever they are declared
+positive_parameters = {'B', 'P_ms', 'M_NS', 'R_NS', 'eta', 'luminosity', 'N_FXT', 'flux_limit', 'Omega', 'T',
+                       'r_MW', 'SFR_MW', 'M_MW', 'event_rate'}
+schechter_columns = 'log_M_star,phi_1,phi_2,alpha_1,alpha_2'
+
+def module_defaults(kernel):
+    """Declarations of a kernel's inputs taken from the module constants they replace."""
+    if kernel == 'spindown':
+        import spindown_energy_calculation as spindown
+        return {'B': spindown.B_range, 'P_ms': spindown.P_range, 'M_NS': 1.4, 'R_NS': 12.0, 'eta': spindown.eta}
+    if kernel == 'gsmf':
+        import doubleschechter
+        return {schechter_columns: [list(shape) for _, _, *shape in doubleschechter.schechter_params],
+                'event_rate': [rate for rate, _ in doubleschechter.event_rates]}
+    if kernel == 'fxt_rate':
+        import ep_eventrate_of_fxts as ep
+        return {'luminosity': ep.luminosities, 'N_FXT': ep.N_FXT, 'flux_limit': ep.flux_limit,
+                'Omega': ep.Omega, 'T': ep.T}
+    if kernel == 'sfr_rate':
+        import sfr_smd_rate_comparison as sfr
+        return {'r_MW': sfr.r_MW_values, 'z': sfr.z_values, 'SFR_MW': sfr.SFR_MW, 'M_MW': sfr.M_MW}
+    if kernel == 'fraction':
+        import BP_PPdot_diagram
+        import ep_eventrate_of_fxts as ep
+        import spindown_energy_calculation as spindown
+        defaults = {'log_eta': np.log10(spindown.eta), 'M_NS': 1.4, 'R_NS': 12.0, 'log_B': np.log10(spindown.B_range),
+                    'P_ms': spindown.P_range, 'log_flux_limit': np.log10(ep.flux_limit), 'N_FXT': ep.N_FXT}
+        for scenario, data in BP_PPdot_diagram.scenarios.items():
+            defaults[f'log_rate[{scenario}]'] = np.log10(data['rate'])
+        return defaults
+    return {}
+
+def required_parameters(kernel):
+    required = sweep.kernels[kernel][1]
+    return required() if callable(required) else required
+
+def merge_declarations(*layers):
+    """Later layers override earlier ones; a row declaration replaces every single name it covers and vice versa."""
+    merged = {}
+    for layer in layers:
+        for key, value in layer.items():
+            names = set(key.split(','))
+            for existing in [k for k in merged if names & set(k.split(','))]:
+                del merged[existing]
+            merged[key] = value
+    return merged
+
+def declaration_rows(key, value):
+    """2-D array of the values one declaration takes, one column per parameter name."""
+    names = key.split(',')
+    if len(names) == 1:
+        rows = sweep.parameter_values(value)[:, None]
+    else:
+        rows = np.asarray(value, dtype=float)
+        rows = rows[None, :] if rows.ndim == 1 else rows
+        if rows.ndim != 2 or rows.shape[1] != len(names):
+            raise ValueError(f"'{key}' needs rows of {len(names)} values")
+    if not np.all(np.isfinite(rows)):
+        raise ValueError(f"'{key}' has non-finite values")
+    for j, name in enumerate(names):
+        if name in positive_parameters and np.any(rows[:, j] <= 0):
+            raise ValueError(f"'{name}' must be positive")
+    return names, rows
+
+def expand(declarations, required):
+    """Cartesian grid of a kernel's declarations as equal-length columns in the order of required."""
+    axes = [declaration_rows(key, value) for key, value in declarations.items()
+            if set(key.split(',')) & set(required)]
+    covered = {name for names, _ in axes for name in names}
+    missing = [name for name in required if name not in covered]
+    if missing:
+        raise ValueError(f"missing parameters: {', '.join(missing)}")
+    index = np.indices([len(rows) for _, rows in axes]).reshape(len(axes), -1)
+    columns = {}
+    for (names, rows), i in zip(axes, index):
+        for j, name in enumerate(names):
+            columns[name] = rows[i, j]
+    return {name: columns[name] for name in required}
+
+def load_config(path):
+    """Read a TOML or YAML config file into a plain dict."""
+    if path.endswith(('.yaml', '.yml')):
+        import yaml
+        with open(path, 'r') as f:
+            return yaml.safe_load(f)
+    import tomllib
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+def validate(config):
+    """
+    Check a config once and return it normalized (defaults filled in, declarations made JSON-plain).
+
+    Raises ValueError naming the scenario and the offending entry.
+    """
+    unknown = set(config) - {'name', 'defaults', 'scenarios'}
+    if unknown:
+        raise ValueError(f"unknown config keys: {', '.join(sorted(unknown))}")
+    scenarios = config.get('scenarios')
+    if not scenarios:
+        raise ValueError("config declares no scenarios")
+    defaults = config.get('defaults', {})
+    normalized = {'name': str(config.get('name', 'scenarios')), 'defaults': _plain(defaults), 'scenarios': []}
+    names = set()
+    used = set()
+    for i, scenario in enumerate(scenarios):
+        name = str(scenario.get('name', f'scenario_{i}'))
+        if name in names or '/' in name:
+            raise ValueError(f"scenario name '{name}' is repeated or contains '/'")
+        names.add(name)
+        kernels = scenario.get('kernels', [])
+        if isinstance(kernels, str):
+            kernels = [kernels]
+        bad = [kernel for kernel in kernels if kernel not in sweep.kernels]
+        if not kernels or bad:
+            raise ValueError(f"scenario '{name}': unknown or missing kernels {bad} (available: {', '.join(sweep.kernels)})")
+        parameters = scenario.get('parameters', {})
+        known = {parameter for kernel in kernels for parameter in required_parameters(kernel)}
+        used |= known
+        stray = [key for key in parameters if not set(key.split(',')) <= known]
+        if stray:
+            raise ValueError(f"scenario '{name}': parameters {stray} are not used by kernels {kernels}")
+        for kernel in kernels:
+            try:
+                expand(merge_declarations(module_defaults(kernel), defaults, parameters), required_parameters(kernel))
+            except ValueError as error:
+                raise ValueError(f"scenario '{name}', kernel '{kernel}': {error}") from None
+        normalized['scenarios'].append({'name': name, 'kernels': list(kernels), 'parameters': _plain(parameters)})
+    stray = [key for key in defaults if not set(key.split(',')) <= used]
+    if stray:
+        raise ValueError(f"defaults {stray} are not used by the kernels of any scenario")
+    return normalized
+
+def config_hash(config):
+    """SHA-256 of the canonical JSON of a validated config."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+def _plain(declarations):
+    """Declarations with numpy values turned into lists, for hashing and storing."""
+    return json.loads(json.dumps(declarations, default=lambda value: np.asarray(value).tolist()))
+
+class Plan:
+    """
+    A validated config compiled into one stacked evaluation per kernel.
+
+    Each kernel group holds the stacked columns of all scenarios that use the kernel and the
+    slice of the stack that belongs to each scenario.
+    """
+
+    def __init__(self, config):
+        self.config = validate(config)
+        self.name = self.config['name']
+        self.hash = config_hash(self.config)
+        self.groups = {}
+        with instr.stage('compile_plan'):
+            for scenario in self.config['scenarios']:
+                for kernel in scenario['kernels']:
+                    required = required_parameters(kernel)
+                    declarations = merge_declarations(module_defaults(kernel), self.config['defaults'],
+                                                      scenario['parameters'])
+                    declarations = {key: value for key, value in declarations.items()
+                                    if set(key.split(',')) & set(required)}
+                    group = self.groups.setdefault(kernel, {'columns': [], 'entries': [], 'blocks': {}, 'size': 0})
+                    # Scenarios that resolve to the same inputs for this kernel share one block of points
+                    key = json.dumps(_plain(declarations), sort_keys=True)
+                    if key not in group['blocks']:
+                        columns = expand(declarations, required)
+                        n = next(iter(columns.values())).size
+                        group['blocks'][key] = (group['size'], group['size'] + n)
+                        group['columns'].append(columns)
+                        group['size'] += n
+                    group['entries'].append((scenario['name'], *group['blocks'][key]))
+            for kernel, group in self.groups.items():
+                group['columns'] = {name: np.concatenate([columns[name] for columns in group['columns']])
+                                    for name in required_parameters(kernel)}
+
+    def summary(self):
+        """(kernel, scenarios, distinct points evaluated) per kernel group."""
+        return [(kernel, len(group['entries']), group['size']) for kernel, group in self.groups.items()]
+
+    def run(self):
+        """
+        Evaluate every kernel once over its stacked points.
+
+        Returns:
+        dict: scenario name -> kernel -> {'parameters': columns, 'outputs': columns}
+        """
+        results = {scenario['name']: {} for scenario in self.config['scenarios']}
+        for kernel, group in self.groups.items():
+            with instr.stage(f'kernel:{kernel}'):
+                outputs = sweep.kernels[kernel][0](group['columns'])
+            instr.count('plan_points', sum(stop - start for _, start, stop in group['entries']))
+            instr.count('plan_kernel_evaluations', group['size'])
+            outputs = {name: np.asarray(value) for name, value in outputs.items()}
+            for scenario, start, stop in group['entries']:
+                results[scenario][kernel] = {
+                    'parameters': {name: column[start:stop] for name, column in group['columns'].items()},
+                    'outputs': {name: value[start:stop] for name, value in outputs.items()},
+                }
+        return results
+
+    def write(self, store, results):
+        """Write results under <config name>/<scenario>/<kernel>/, tagged with the config hash."""
+        for scenario in self.config['scenarios']:
+            attrs = {'config_hash': self.hash, 'config_name': self.name, 'scenario': scenario['name'],
+                     'declarations': scenario['parameters'], 'defaults': self.config['defaults']}
+            for kernel, result in results[scenario['name']].items():
+                prefix = f"{self.name}/{scenario['name']}/{kernel}"
+                for group in ('parameters', 'outputs'):
+                    for name, values in result[group].items():
+                        path = f'{prefix}/{name}' if group == 'outputs' else f'{prefix}/parameters/{name}'
+                        if path in store:
+                            if store[path].attrs.get('config_hash') == self.hash:
+                                continue
+                            raise ValueError(f"'{path}' exists from a different config; remove it or rename the config")
+                        store.write(path, values, attrs=dict(attrs, kernel=kernel))
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate the scenario variants of a TOML/YAML config.')
+    parser.add_argument('config', help='TOML or YAML scenario config')
+    parser.add_argument('--store', default=os.environ.get('MSEC_RESULT_STORE'),
+                        help='result store directory (default: MSEC_RESULT_STORE)')
+    parser.add_argument('--check', action='store_true', help='validate and compile only')
+    parser.add_argument('--profile', action='store_true', help='write a stage timing trace at exit')
+    args = parser.parse_args()
+    if args.profile:
+        instr.enable()
+
+    plan = Plan(load_config(args.config))
+    print(f"Config '{plan.name}' ({plan.hash[:12]}): {len(plan.config['scenarios'])} scenarios")
+    for kernel, n_scenarios, n_points in plan.summary():
+        print(f"  {kernel}: {n_points} points from {n_scenarios} scenarios")
+    if args.check:
+        return
+
+    start = time.perf_counter()
+    results = plan.run()
+    print(f"Evaluated in {time.perf_counter() - start:.2f} s")
+    if args.store is not None:
+        plan.write(result_store.ResultStore(args.store), results)
+        print(f"Wrote results to {args.store}/{plan.name}")
+    else:
+        for scenario, kernels in results.items():
+            for kernel, result in kernels.items():
+                ranges = ', '.join(f"{name} {np.min(value):.3g}..{np.max(value):.3g}"
+                                   for name, value in result['outputs'].items())
+                print(f"  {scenario}/{kernel}: {ranges}")
+
+if __name__ == "__main__":
+    main()
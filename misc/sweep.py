@@ -0,0 +1,397 @@
+"""
+Parameter sweeps split into work units, checkpointed to the result store.
+
+A sweep is declared in a JSON spec:
+
+    {
+      "name": "spindown_grid",
+      "kernel": "spindown",
+      "parameters": {
+        "B": {"logspace": [14, 16, 200]},
+        "P_ms": {"linspace": [1, 2, 100]},
+        "M_NS": [1.4, 2.0],
+        "R_NS": 12.0,
+        "eta": {"logspace": [-4, -1, 4]}
+      },
+      "unit_size": 4096
+    }
+
+Parameters are scalars, lists or {"linspace"|"logspace": [start, stop, n]}
+and span a Cartesian grid. With "samples": n (and optional "seed") the
+sweep instead draws n random points, taking {"uniform"|"loguniform": [low,
+high]} ranges and random list elements. A top-level "eos": "SLy" makes
+the spindown kernel take R and I from that EOS (eos.py) instead of R_NS.
+
+The points are cut into units of unit_size. Each unit writes one chunk of
+every output dataset (<name>/<output> in the store), so a unit is complete
+exactly when all its chunks exist, and an interrupted sweep resumes by
+skipping complete units. Resuming with a changed spec is refused unless
+`run --fresh` discards the earlier results. The parameter columns are
+stored for reference only: every worker computes the points from the spec
+and publishes a column by renaming a staged copy into place. Workers coordinate through claim files in
+<store>/<name>/_claims, created with O_EXCL; `run` starts a local pool of
+such workers, and `worker` can be started on any number of nodes sharing
+the store directory.
+"""
+import argparse
+import functools
+import itertools
+import json
+import os
+import shutil
+import socket
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# The model scripts live in gsmf/, magnetar_model_fxts/ and formationscenarios/
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for directory in ('gsmf', 'magnetar_model_fxts', 'formationscenarios'):
+    sys.path.insert(0, os.path.join(repo_dir, directory))
+import instrumentation as instr
+import result_store
+
+claim_timeout = 3600.0  # s after which another host may take over an unfinished claim
+
+def spindown_kernel(p, eos=None):
+    """
+    Spin-down luminosity, X-ray luminosity and spin-down time for (B, P_ms, M_NS, R_NS, eta).
+
+    With eos (a name from eos.available_eos()) R and I follow from M_NS on that EOS instead, R_NS is
+    not a parameter, and the radius used is returned as R_NS (km); masses off its stable branch give NaN.
+    """
+    from spindown_energy_calculation import calculate_I, calculate_luminosities, M_sun
+    M = p['M_NS'] * M_sun
+    outputs = {}
+    if eos is None:
+        R = p['R_NS'] * 1e5
+    else:
+        from eos import eos_table, eos_radius
+        eos = eos_table(eos)
+        R = eos_radius(eos, M)
+        outputs['R_NS'] = R / 1e5
+    L_sd, _ = calculate_luminosities(p['B'], p['P_ms'], M, R, eos)
+    Omega = 2 * np.pi / (p['P_ms'] * 1e-3)
+    outputs.update({'L_sd': L_sd, 'L_X': p['eta'] * L_sd, 'tau_sd': calculate_I(M, R, eos) * Omega**2 / (2 * L_sd)})
+    return outputs
+
+def gsmf_kernel(p):
+    """Normalization N and volumetric rate R for perturbed double Schechter parameters and event rates."""
+    import doubleschechter
+    # The integral depends only on the Schechter parameters, so each distinct set is integrated once
+    shapes = np.column_stack([p[name] for name in ('log_M_star', 'phi_1', 'phi_2', 'alpha_1', 'alpha_2')])
+    unique_shapes, inverse = np.unique(shapes, axis=0, return_inverse=True)
+    n_gal = doubleschechter.integrated_number_densities(*unique_shapes.T)
+    N = n_gal / doubleschechter.number_density_11(*unique_shapes.T)
+    n_gal, N = n_gal[inverse.ravel()], N[inverse.ravel()]
+    return {'n_gal': n_gal, 'N': N, 'R': p['event_rate'] * doubleschechter.rate_factor(n_gal, N)}
+
+def fxt_rate_kernel(p):
+    """Space density rate ρ_FXT (Gpc^-3 yr^-1) at each luminosity for the survey parameters."""
+    import ep_eventrate_of_fxts
+    return {'rho_FXT': ep_eventrate_of_fxts.rho_FXT(p['luminosity'], p['N_FXT'], p['flux_limit'], p['Omega'], p['T'])}
+
+def sfr_rate_kernel(p):
+    """Volumetric rates (Gpc^-3 yr^-1) scaled from a Milky Way rate by star formation and stellar mass density."""
+    import sfr_smd_rate_comparison as sfr
+    return {'R_SFR': p['r_MW'] / p['SFR_MW'] * sfr.SFR_z(p['z']) * 1e9,
+            'R_SMD': p['r_MW'] / p['M_MW'] * sfr.rho_star_interp(p['z'])}
+
+def fraction_kernel(p):
+    """Spin-down and detectability outputs of sensitivity_analysis.model, by parameter name."""
+    import sensitivity_analysis
+    X = np.column_stack([p[name] for name in sensitivity_analysis.parameter_names])
+    outputs = sensitivity_analysis.model(X)
+    return {name: outputs[:, j] for j, name in enumerate(sensitivity_analysis.output_names)}
+
+def _spindown_parameters(eos=None):
+    return ['B', 'P_ms', 'M_NS', 'eta'] if eos is not None else ['B', 'P_ms', 'M_NS', 'R_NS', 'eta']
+
+def _fraction_parameters():
+    import sensitivity_analysis
+    return sensitivity_analysis.parameter_names
+
+# Kernel name -> (function of a dict of parameter columns, required parameter names or a callable giving them);
+# the spec's kernel options (see kernel_options) are passed to both as keywords
+kernels = {
+    'spindown': (spindown_kernel, _spindown_parameters),
+    'gsmf': (gsmf_kernel, ['log_M_star', 'phi_1', 'phi_2', 'alpha_1', 'alpha_2', 'event_rate']),
+    'fraction': (fraction_kernel, _fraction_parameters),
+    'fxt_rate': (fxt_rate_kernel, ['luminosity', 'N_FXT', 'flux_limit', 'Omega', 'T']),
+    'sfr_rate': (sfr_rate_kernel, ['r_MW', 'z', 'SFR_MW', 'M_MW']),
+}
+
+def kernel_options(spec):
+    """Keyword options of the kernel set at the top level of a spec: the EOS name of the spindown kernel."""
+    if 'eos' not in spec:
+        return {}
+    if spec['kernel'] != 'spindown':
+        raise ValueError(f"kernel '{spec['kernel']}' takes no EOS")
+    return {'eos': spec['eos']}
+
+def load_spec(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def parameter_values(value):
+    """Grid values of one parameter declaration."""
+    if isinstance(value, dict):
+        if 'linspace' in value:
+            return np.linspace(*value['linspace'][:2], int(value['linspace'][2]))
+        if 'logspace' in value:
+            return np.logspace(*value['logspace'][:2], int(value['logspace'][2]))
+        if 'values' in value:
+            return np.asarray(value['values'], dtype=float)
+        raise ValueError(f"unknown grid declaration {value}")
+    return np.atleast_1d(np.asarray(value, dtype=float))
+
+def sample_values(value, n, rng):
+    """Random draws of one parameter declaration."""
+    if isinstance(value, dict) and 'uniform' in value:
+        return rng.uniform(*value['uniform'], n)
+    if isinstance(value, dict) and 'loguniform' in value:
+        return 10**rng.uniform(*np.log10(value['loguniform']), n)
+    return rng.choice(parameter_values(value), n)
+
+def sweep_points(spec):
+    """All sweep points as a dict of equal-length parameter columns, in a fixed order."""
+    kernel, required = kernels[spec['kernel']]
+    required = required(**kernel_options(spec)) if callable(required) else required
+    missing = [name for name in required if name not in spec['parameters']]
+    if missing:
+        raise ValueError(f"kernel '{spec['kernel']}' needs parameters: {', '.join(missing)}")
+    if 'samples' in spec:
+        rng = np.random.default_rng(spec.get('seed', 0))
+        return {name: sample_values(spec['parameters'][name], int(spec['samples']), rng) for name in required}
+    grids = [parameter_values(spec['parameters'][name]) for name in required]
+    mesh = np.meshgrid(*grids, indexing='ij')
+    return {name: axis.ravel() for name, axis in zip(required, mesh)}
+
+class Sweep:
+    """A declared sweep bound to a result store."""
+
+    def __init__(self, spec, store_path):
+        self.spec = spec
+        self.name = spec['name']
+        self.store = result_store.ResultStore(store_path)
+        self.kernel = functools.partial(kernels[spec['kernel']][0], **kernel_options(spec))
+        self.unit_size = int(spec.get('unit_size', 4096))
+        self.claims_dir = os.path.join(store_path, self.name, '_claims')
+
+    def prepare(self, fresh=False):
+        """
+        Write the parameter columns and create the output datasets (idempotent).
+
+        Raises ValueError if the store holds this sweep for a different spec or unit size, unless
+        fresh, in which case the earlier parameters, results and claims are discarded. Each
+        parameter column is built in a staging directory and renamed into place, so concurrent
+        workers never see a partly written one; units are computed from the in-memory points.
+        """
+        points = sweep_points(self.spec)
+        self.points = points
+        self.parameters = list(points)
+        self.n_points = next(iter(points.values())).size
+        self.n_units = -(-self.n_points // self.unit_size)
+        spec_attrs = {'spec': self.spec, 'unit_size': self.unit_size}
+        # One point tells the output names, trailing shapes and dtypes
+        probe = self.kernel({name: column[:1] for name, column in points.items()})
+        names = [f'{self.name}/parameters/{name}' for name in points] + [f'{self.name}/{name}' for name in probe]
+        stale = [name for name in names if name in self.store and not _same_spec(self.store[name].attrs, spec_attrs)]
+        if stale and not fresh:
+            raise ValueError(f"sweep '{self.name}' in {self.store.path} was prepared from a different spec "
+                             f"({', '.join(stale)}); rerun with --fresh to discard it")
+        for name, column in points.items():
+            if fresh or f'{self.name}/parameters/{name}' not in self.store:
+                self._publish_parameter(name, column, spec_attrs, fresh)
+        self.outputs = []
+        for name, value in probe.items():
+            value = np.asarray(value)
+            self.store.create(f'{self.name}/{name}', (self.n_points,) + value.shape[1:], value.dtype,
+                              chunks=(self.unit_size,) + value.shape[1:], attrs=spec_attrs, overwrite=fresh)
+            self.outputs.append(name)
+        if fresh and os.path.isdir(self.claims_dir):
+            shutil.rmtree(self.claims_dir)
+        os.makedirs(self.claims_dir, exist_ok=True)
+        return self
+
+    def _publish_parameter(self, name, column, spec_attrs, replace):
+        """Write one parameter column under a staging name and rename it into place; the first worker wins."""
+        staging = os.path.join(self.store.path, self.name, '_staging', f"{socket.gethostname()}.{os.getpid()}")
+        result_store.ResultStore(staging).write(name, column, chunks=(self.unit_size,), attrs=spec_attrs)
+        target = os.path.join(self.store.path, self.name, 'parameters', name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if replace and os.path.isdir(target):
+            shutil.rmtree(target)
+        try:
+            os.rename(os.path.join(staging, name), target)
+        except OSError:
+            # Another worker published the same column first
+            if not os.path.exists(os.path.join(target, 'meta.json')):
+                raise
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(staging))
+        except OSError:
+            pass
+
+    def unit_complete(self, unit):
+        return all(self.store[f'{self.name}/{name}'].has_chunk(_unit_chunk(self.store[f'{self.name}/{name}'], unit))
+                   for name in self.outputs)
+
+    def pending_units(self):
+        return [unit for unit in range(self.n_units) if not self.unit_complete(unit)]
+
+    def _claim(self, unit):
+        """
+        Take the claim file for a unit; stale claims (dead local process or timed out) are taken over.
+
+        A stale claim is renamed to a tombstone unique to this worker, so of several workers that
+        find it stale only one moves it, and the claim is then re-created exclusively. The owner is
+        read back after writing, so a unit is only run by the worker named in its claim.
+        """
+        path = os.path.join(self.claims_dir, f'unit_{unit}')
+        owner = f'{socket.gethostname()}:{os.getpid()}'
+        if not _create_claim(path, owner):
+            try:
+                with open(path, 'r') as f:
+                    stale = f.read()
+                mtime = os.path.getmtime(path)
+            except OSError:
+                return False
+            host, _, pid = stale.partition(':')
+            if not (time.time() - mtime > claim_timeout
+                    or (host == socket.gethostname() and pid.isdigit() and not _alive(int(pid)))):
+                return False
+            tombstone = f"{path}.stale.{owner.replace(':', '.')}"
+            try:
+                os.rename(path, tombstone)
+            except FileNotFoundError:
+                return False
+            try:
+                with open(tombstone, 'r') as f:
+                    moved = f.read()
+                if moved != stale or os.path.getmtime(tombstone) != mtime:
+                    # Another worker took the claim over in between: put its claim back
+                    try:
+                        os.link(tombstone, path)
+                    except FileExistsError:
+                        pass
+                    return False
+            finally:
+                os.remove(tombstone)
+            if not _create_claim(path, owner):
+                return False
+        try:
+            with open(path, 'r') as f:
+                return f.read() == owner
+        except FileNotFoundError:
+            return False
+
+    def run_unit(self, unit):
+        start = unit * self.unit_size
+        stop = min(start + self.unit_size, self.n_points)
+        columns = {name: self.points[name][start:stop] for name in self.parameters}
+        with instr.stage(f'sweep:{self.name}'):
+            results = self.kernel(columns)
+        for name in self.outputs:
+            dataset = self.store[f'{self.name}/{name}']
+            dataset.write_chunk(_unit_chunk(dataset, unit), np.asarray(results[name]))
+        instr.count('sweep_units', 1)
+        instr.count('sweep_points', stop - start)
+
+    def work(self):
+        """Claim and run pending units until none are left; returns the number of units run here."""
+        done = 0
+        for unit in range(self.n_units):
+            if self.unit_complete(unit) or not self._claim(unit):
+                continue
+            if not self.unit_complete(unit):
+                self.run_unit(unit)
+                done += 1
+            try:
+                os.remove(os.path.join(self.claims_dir, f'unit_{unit}'))
+            except FileNotFoundError:
+                pass
+        return done
+
+def _create_claim(path, owner):
+    """Create a claim file exclusively; False if it already exists."""
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(owner)
+    return True
+
+def _same_spec(attrs, spec_attrs):
+    """Whether stored dataset attrs were written for this spec and unit size."""
+    canonical = lambda value: json.dumps(value, sort_keys=True, default=lambda v: np.asarray(v).tolist())
+    return canonical({key: attrs.get(key) for key in spec_attrs}) == canonical(spec_attrs)
+
+def _unit_chunk(dataset, unit):
+    """Chunk index of a work unit: units split the first axis only."""
+    return (unit,) + (0,) * (dataset.ndim - 1)
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _worker(spec, store_path):
+    return Sweep(spec, store_path).prepare().work()
+
+def run(spec, store_path, workers=1, fresh=False):
+    """Run a sweep with a local pool of queue workers; complete units from earlier runs are skipped unless fresh."""
+    sweep = Sweep(spec, store_path).prepare(fresh)
+    pending = len(sweep.pending_units())
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = sum(pool.map(_worker, itertools.repeat(spec, workers), itertools.repeat(store_path, workers)))
+    else:
+        done = sweep.work()
+    return {'units': sweep.n_units, 'pending_at_start': pending, 'run': done,
+            'remaining': len(sweep.pending_units())}
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkpointed parameter sweeps.')
+    parser.add_argument('command', choices=['run', 'worker', 'status'],
+                        help='run: local worker pool; worker: one queue worker (start one per node); '
+                             'status: report progress')
+    parser.add_argument('spec', help='JSON sweep specification')
+    parser.add_argument('--store', default=os.environ.get('MSEC_RESULT_STORE'),
+                        help='result store directory (default: MSEC_RESULT_STORE)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='local worker processes for run')
+    parser.add_argument('--fresh', action='store_true',
+                        help='run: discard results stored for an earlier version of this sweep instead of refusing')
+    parser.add_argument('--profile', action='store_true', help='write a stage timing trace at exit')
+    args = parser.parse_args()
+    if args.store is None:
+        parser.error('--store or MSEC_RESULT_STORE is required')
+    if args.profile:
+        instr.enable()
+
+    spec = load_spec(args.spec)
+    start = time.perf_counter()
+    if args.command == 'run':
+        summary = run(spec, args.store, args.workers, args.fresh)
+        print(f"{spec['name']}: ran {summary['run']} of {summary['pending_at_start']} pending units "
+              f"({summary['units']} total, {summary['remaining']} remaining) in {time.perf_counter() - start:.1f} s")
+    elif args.command == 'worker':
+        done = _worker(spec, args.store)
+        print(f"{spec['name']}: worker {socket.gethostname()}:{os.getpid()} ran {done} units "
+              f"in {time.perf_counter() - start:.1f} s")
+    else:
+        sweep = Sweep(spec, args.store).prepare()
+        pending = len(sweep.pending_units())
+        print(f"{spec['name']}: {sweep.n_units - pending} of {sweep.n_units} units complete "
+              f"({sweep.n_points} points, outputs: {', '.join(sweep.outputs)})")
+
+if __name__ == "__main__":
+    main()
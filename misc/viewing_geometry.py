@@ -0,0 +1,91 @@
+"""
+Viewing angles and angular emission profiles for magnetar-wind X-ray emission.
+
+A profile g(θ) is symmetric about the spin axis and between the two poles.
+It is normalized to f = g / <g> so that the isotropic-equivalent luminosity
+seen at viewing angle θ is L f(θ), where L is the true (angle-averaged)
+luminosity and <...> averages over isotropic orientations (cos θ uniform).
+
+Population batches draw θ and scale each source's luminosity by f(θ). Rate
+estimates that depend on a power of the luminosity need only angle averages
+<f^p>. For the Euclidean V_max ∝ L^(3/2) the detected volume becomes
+V_max(L) <f^(3/2)>. These averages are tabulated once per profile over
+(log10 θ_c, p), so folding the geometry into a rate costs one lookup.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+import instrumentation as instr
+import lookup_tables
+
+# Defaults
+theta_c = 0.1  # Core (or half-opening) angle in radians
+power_law_index = 3.0  # k of the power-law wing (1 + (θ/θ_c)^2)^(-k/2)
+
+# Angle-average table grid
+log_theta_c_axis = np.linspace(-2.0, np.log10(np.pi / 2), 241)
+exponent_axis = np.linspace(0.5, 3.0, 26)
+quadrature_points = 16385  # θ nodes, clustered towards the axis
+
+def profile_shape(theta, profile='isotropic', theta_c=theta_c, k=power_law_index):
+    """Unnormalized emission profile g(θ); θ in radians, folded onto [0, π/2]."""
+    theta = np.asarray(theta, dtype=float)
+    theta = np.minimum(theta, np.pi - theta)
+    if profile == 'isotropic':
+        return np.ones_like(theta * theta_c)
+    if profile == 'top_hat':
+        return (theta <= theta_c).astype(float)
+    if profile == 'gaussian':
+        return np.exp(-0.5 * (theta / theta_c)**2)
+    if profile == 'power_law':
+        return (1 + (theta / theta_c)**2)**(-k / 2)
+    raise ValueError(f"unknown profile '{profile}', use 'isotropic', 'top_hat', 'gaussian' or 'power_law'")
+
+@lru_cache(maxsize=None)
+def angle_average_table(profile, k=power_law_index):
+    """ln <g^p> on the (log10 θ_c, p) grid, by trapezoid quadrature in θ."""
+    u = np.linspace(0, 1, quadrature_points)
+    theta = np.pi / 2 * u**2
+    d_theta = np.gradient(theta)
+    d_theta[[0, -1]] /= 2
+    weight = np.sin(theta) * d_theta
+    weight /= weight.sum()
+    table = np.empty((log_theta_c_axis.size, exponent_axis.size))
+    for i, log_theta_c in enumerate(log_theta_c_axis):
+        g = profile_shape(theta, profile, 10**log_theta_c, k)
+        with np.errstate(divide='ignore'):
+            table[i] = np.log(np.maximum(np.exp(np.log(g)[None, :] * exponent_axis[:, None]) @ weight, 1e-300))
+    instr.count('angle_average_tables', 1)
+    return table
+
+instr.watch_cache('angle_average_table', angle_average_table)
+
+def angle_average(exponent, profile='isotropic', theta_c=theta_c, k=power_law_index):
+    """<g^p> over isotropic orientations, from the table; θ_c and p beyond the grid are clamped to it."""
+    if profile == 'isotropic':
+        return np.ones(np.broadcast(np.asarray(exponent), np.asarray(theta_c)).shape)
+    return np.exp(lookup_tables.multilinear_interp(angle_average_table(profile, k), (log_theta_c_axis, exponent_axis),
+                                                   (np.log10(theta_c), exponent)))
+
+def beaming_factor(theta, profile='isotropic', theta_c=theta_c, k=power_law_index):
+    """f(θ) = g(θ) / <g>, the isotropic-equivalent over true luminosity at viewing angle θ."""
+    return profile_shape(theta, profile, theta_c, k) / angle_average(1.0, profile, theta_c, k)
+
+def luminosity_correction(exponent=1.5, profile='isotropic', theta_c=theta_c, k=power_law_index):
+    """
+    <f^p>: the factor a quantity scaling as L^p picks up from random orientations.
+
+    With p = 3/2 this multiplies the Euclidean V_max. 1 for isotropic emission.
+    """
+    return angle_average(exponent, profile, theta_c, k) / angle_average(1.0, profile, theta_c, k)**exponent
+
+def sample_viewing_angles(n, seed=None):
+    """n viewing angles (radians, 0 to π/2) from isotropic orientations."""
+    rng = np.random.default_rng(seed)
+    instr.count('viewing_angles_drawn', n)
+    return np.arccos(rng.random(n))
+
+def observed_luminosity(L, theta, profile='isotropic', theta_c=theta_c, k=power_law_index):
+    """Isotropic-equivalent luminosity L f(θ) for true luminosities L seen at angles θ."""
+    return np.asarray(L) * beaming_factor(theta, profile, theta_c, k)